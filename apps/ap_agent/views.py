@@ -1,6 +1,5 @@
 import json
 import logging
-import time
 import traceback
 from collections import defaultdict
 from django.conf import settings
@@ -13,7 +12,8 @@ from rest_framework.views import APIView
 
 from language.language_pack import RET, Language
 from utils.cst_class import CstException, CstResponse
-from utils.distributed_id_generator.get_id import get_distributed_id
+from utils.distributed_id_generator.get_id import (get_distributed_id,
+                                                   get_distributed_ids)
 from utils.prompts import generate_structured_prompt_agent
 from utils.sql_oper import MysqlOper
 
@@ -21,7 +21,6 @@ logger = logging.getLogger("view")
 
 
 class AgentPictures(APIView):
-    worker_id = 8888
 
     @swagger_auto_schema(
         operation_id="200",
@@ -105,7 +104,7 @@ class AgentPictures(APIView):
         pic_url = data.get("pic_url")
         pic_tags = data.get("pic_tags")
         pic_name = data.get("pic_name")
-        pic_id = get_distributed_id(worker_id=self.worker_id)
+        pic_id = get_distributed_id()
 
         if not user_id or not group_name or not group_order or not pic_url or not pic_name:
             code = RET.PARAM_MISSING
@@ -125,7 +124,7 @@ class AgentPictures(APIView):
                     duplicate_data = MysqlOper.get_query_result(cursor)
                     group_id = duplicate_data[0].get('group_id')
                 else:
-                    group_id = get_distributed_id(worker_id=self.worker_id)
+                    group_id = get_distributed_id()
 
         except Exception:
             print(traceback.format_exc())
@@ -528,7 +527,6 @@ class AgentPictures(APIView):
 
 
 class AgentDocuments(APIView):
-    worker_id = 8889
 
     @swagger_auto_schema(
         operation_id="204",
@@ -612,7 +610,7 @@ class AgentDocuments(APIView):
         file_url = data.get("file_url")
         file_name = data.get("file_name")
         file_type = data.get("file_type")
-        file_id = get_distributed_id(worker_id=self.worker_id)
+        file_id = get_distributed_id()
 
         if not user_id or not group_name or not file_url or not file_name or not file_type:
             code = RET.PARAM_MISSING
@@ -632,7 +630,7 @@ class AgentDocuments(APIView):
                     duplicate_data = MysqlOper.get_query_result(cursor)
                     group_id = duplicate_data[0].get('group_id')
                 else:
-                    group_id = get_distributed_id(worker_id=self.worker_id)
+                    group_id = get_distributed_id()
 
         except Exception:
             print(traceback.format_exc())
@@ -1050,7 +1048,6 @@ class AgentDocuments(APIView):
 
 
 class AgentUrls(APIView):
-    worker_id = 8822
 
     @swagger_auto_schema(
         operation_id="208",
@@ -1133,7 +1130,7 @@ class AgentUrls(APIView):
         # url_title = data.get("url_title")
         url_name = data.get("url_name")
         url_type = 'url'
-        url_id = get_distributed_id(worker_id=self.worker_id)
+        url_id = get_distributed_id()
 
         if not user_id or not group_name or not url_name or not group_order:
             code = RET.PARAM_MISSING
@@ -1153,7 +1150,7 @@ class AgentUrls(APIView):
                     duplicate_data = MysqlOper.get_query_result(cursor)
                     group_id = duplicate_data[0].get('group_id')
                 else:
-                    group_id = get_distributed_id(worker_id=self.worker_id)
+                    group_id = get_distributed_id()
 
         except Exception:
             print(traceback.format_exc())
@@ -1568,7 +1565,6 @@ class AgentUrls(APIView):
 
 
 class AgentModels(APIView):
-    worker_id = 8890
 
     @swagger_auto_schema(
         operation_id="213",
@@ -1711,7 +1707,7 @@ class AgentModels(APIView):
         info_agent = data.get('info_agent', [])
 
         if not int(is_edit):
-            agent_id = get_distributed_id(worker_id=self.worker_id)
+            agent_id = get_distributed_id()
         else:
             agent_id = data.get("agent_id")
 
@@ -1770,7 +1766,7 @@ class AgentModels(APIView):
                     duplicate_data = MysqlOper.get_query_result(cursor)
                     group_id = duplicate_data[0].get('group_id')
                 else:
-                    group_id = get_distributed_id(worker_id=self.worker_id)
+                    group_id = get_distributed_id()
 
         except Exception:
             print(traceback.format_exc())
@@ -1793,7 +1789,7 @@ class AgentModels(APIView):
                     duplicate_data_type = MysqlOper.get_query_result(cursor)
                     agent_type_id = duplicate_data_type[0].get('agent_type_id')
                 else:
-                    agent_type_id = get_distributed_id(worker_id=self.worker_id)
+                    agent_type_id = get_distributed_id()
 
         except Exception:
             print(traceback.format_exc())
@@ -1832,7 +1828,7 @@ class AgentModels(APIView):
             message = Language.get(code)
             return CstResponse(code=code, message=message)
         if is_edit:
-            agent_id = get_distributed_id(self.worker_id)
+            agent_id = get_distributed_id()
 
         # 插入向量数据库
         url_called_ids = []
@@ -1892,8 +1888,12 @@ class AgentModels(APIView):
 
         if info_agent:
 
+            # 批量取号, 输入框与选项各一次
+            info_ids = iter(get_distributed_ids(len(info_agent)))
+            option_count = sum(len(each.get('info_options') or []) for each in info_agent)
+            info_option_ids = iter(get_distributed_ids(option_count))
             for each_info_question in info_agent:
-                agent_add_id = get_distributed_id(self.worker_id)
+                agent_add_id = next(info_ids)
                 agent_add_ids.append(str(agent_add_id))
 
                 each_info_agent_type_id = each_info_question.get('type_id')
@@ -1906,9 +1906,8 @@ class AgentModels(APIView):
                 if each_info_agent_info_options:
                     options_data = []
                     for inner_info_question_info_options in each_info_agent_info_options:
-                        option_id = get_distributed_id(self.worker_id)
+                        option_id = next(info_option_ids)
                         option_ids.append(str(option_id))
-                        time.sleep(0.05)
                         info_type_id = each_info_agent_type_id
                         option_value = inner_info_question_info_options.get('value')
                         options_data.append((user_id, agent_id, option_id, info_type_id, option_value))
@@ -1969,10 +1968,8 @@ class AgentModels(APIView):
             agent_success = True
         prompt_data = []
 
-        for each_prompt in agent_prompt:
+        for each_prompt, prompt_id in zip(agent_prompt, get_distributed_ids(len(agent_prompt))):
             type = 'prompt'
-            prompt_id = get_distributed_id(self.worker_id)
-            time.sleep(0.05)
             prompt_data.append((agent_id, type, each_prompt, prompt_id, prompt_id))
         if prompt_data:
             try:
@@ -2002,11 +1999,9 @@ class AgentModels(APIView):
             prompt_success = True
 
         sample_questio_data = []
-        for each_sample in sample_question:
+        for each_sample, sample_id in zip(sample_question, get_distributed_ids(len(sample_question))):
             type = 'question'
             sample_question = each_sample.get('sample_question')
-            sample_id = get_distributed_id(self.worker_id)
-            time.sleep(0.05)
             sample_questio_data.append((agent_id, type, sample_question, sample_id, sample_id))
 
         if sample_questio_data:
@@ -2813,7 +2808,6 @@ class AgenClassificationGroup(APIView):
     )
     def get(self, request):
 
-        worker_id = 9008
         user_id = request.GET.get('user_id')
         if not user_id:
             code = RET.PARAM_MISSING
@@ -2857,7 +2851,7 @@ class AgenClassificationGroup(APIView):
                 type_tree[row[3]].append(type_dict)
 
         else:
-            default_group_id = get_distributed_id(worker_id=worker_id)
+            default_group_id = get_distributed_id()
             group_dict = {
                 'group_name': "默认分组",
                 'group_id': default_group_id,
@@ -6,7 +6,6 @@ import ssl
 import time
 import traceback
 
-import requests
 import websocket
 from django.conf import settings
 from django.db import connection, connections
@@ -18,6 +17,7 @@ from rest_framework.views import APIView
 from language.language_pack import RET, Language
 from utils.cst_class import CstException, CstResponse
 from utils.gadgets import gadgets
+from utils.http_client import http
 from utils.spark_utils import (DocumentUpload, SparkQA)
 from utils.sql_oper import MysqlOper
 
@@ -149,7 +149,7 @@ class UploadFileToSpark(APIView):
         full_file_url = settings.OSS_PREFIX + file_url
         body = document_upload.get_body(full_file_url, file_name)
         headers["Content-Type"] = body.content_type
-        response = requests.post(request_url, data=body, headers=headers)
+        response = http.post(request_url, data=body, headers=headers)
         res_data = json.loads(response.text)
 
         print(res_data)
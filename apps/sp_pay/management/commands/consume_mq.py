@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 03:00
+# @Author  : payne
+# @File    : consume_mq.py
+# @Description : RabbitMQ 并发消费 worker, 回调在线程池或进程池中执行
+#
+# 用法: python manage.py consume_mq --type direct --queue q --exchange e --routing-key k \
+#           --callback apps.xxx.consumers.handle [--workers 8] [--prefetch 16] [--pool thread|process]
+# - thread 模式回调签名为 (ch, method, properties, body), 与 RabbitMqUtil.bin_handle 相同
+# - process 模式回调为模块级函数 callback(body)
+# - SIGTERM/SIGINT 后等待已分发的消息处理完再退出; 连接断开后按退避间隔重连
+import logging
+import signal
+import threading
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from utils.mq_consumer import POOL_TYPES, MqConsumerRuntime
+from utils.mq_utils import RabbitMqUtil
+
+logger = logging.getLogger("view")
+
+
+class Command(BaseCommand):
+    help = "RabbitMQ 并发消费"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", required=True, choices=sorted(RabbitMqUtil.bin_param))
+        parser.add_argument("--queue", required=True)
+        parser.add_argument("--exchange")
+        parser.add_argument("--routing-key")
+        parser.add_argument("--callback", required=True, help="回调的导入路径")
+        parser.add_argument("--workers", type=int, help="线程数或进程数, 默认 CPU 核数")
+        parser.add_argument("--prefetch", type=int, help="预取数, 默认 workers 的 2 倍")
+        parser.add_argument("--pool", default="thread", choices=POOL_TYPES)
+        parser.add_argument("--requeue", action="store_true", help="回调异常时重新排队")
+        parser.add_argument("--max-backoff", type=float, default=30, help="重连最大间隔(秒)")
+
+    def handle(self, *args, **options):
+        runtime = MqConsumerRuntime(
+            {
+                "type": options["type"],
+                "queue": options["queue"],
+                "exchange": options["exchange"],
+                "routing_key": options["routing_key"],
+                "callback": import_string(options["callback"]),
+            },
+            workers=options["workers"],
+            prefetch=options["prefetch"],
+            pool=options["pool"],
+            requeue_on_error=options["requeue"],
+        )
+        stopping = threading.Event()
+
+        def stop(*_):
+            stopping.set()
+            runtime.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(
+            f"mq consumer started, queue={options['queue']} pool={runtime.pool} "
+            f"workers={runtime.workers} prefetch={runtime.prefetch}")
+        backoff = 1
+        try:
+            while not stopping.is_set():
+                started = time.monotonic()
+                try:
+                    runtime.run()
+                except Exception:
+                    logger.error(traceback.format_exc())
+                    # 运行较久后才断开的连接从最小间隔开始重连
+                    if time.monotonic() - started > options["max_backoff"]:
+                        backoff = 1
+                    stopping.wait(backoff)
+                    backoff = min(backoff * 2, options["max_backoff"])
+        finally:
+            runtime.shutdown()
+        self.stdout.write(f"mq consumer stopped, {runtime.stats()}")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 00:30
+# @Author  : payne
+# @File    : flush_message_reads.py
+# @Description : 消息中心已读状态写回, 将 message_read:pending 批量写入 omt_message_read_status
+#
+# 用法: python manage.py flush_message_reads [--interval 2] [--batch 500] [--once]
+import logging
+import signal
+import threading
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.sp_pay.message_reads import MessageReads
+
+logger = logging.getLogger("view")
+
+
+class Command(BaseCommand):
+    help = "消息中心已读状态批量写回数据库"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=2, help="队列为空时的等待时间(秒)")
+        parser.add_argument("--batch", type=int, default=500)
+        parser.add_argument("--once", action="store_true", help="写完当前队列后退出")
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+        signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+        while not stopping.is_set():
+            try:
+                flushed = MessageReads.flush(options["batch"])
+            except Exception:
+                logger.error(traceback.format_exc())
+                flushed = 0
+            finally:
+                close_old_connections()
+
+            if flushed == options["batch"]:
+                continue
+            if options["once"]:
+                break
+            stopping.wait(options["interval"])
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 11:50
+# @Author  : payne
+# @File    : migrate_balance_ledger.py
+# @Description : 将 package hash + packages zset + total 计数器 的旧布局迁移到用户余额账本
+#
+# 用法: python manage.py migrate_balance_ledger [--dry-run] [--delete-legacy]
+#
+# 可在切换后运行, 也可重复运行: 每个 (用户, 产品) 只迁移一次, 记录在 ledger_migrated:{family};
+# 累计购买量加到账本已有值上, 包记录只在账本中不存在时写入, 不覆盖切换后的购买和扣减
+import time
+
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+from utils.quota.ledger import (FAMILY_PACKAGE, FAMILY_UNIVERSAL, ledger_key,
+                                pack_record)
+
+# 未迁移过时: 累计购买量累加, 包记录 HSETNX; 已迁移返回 0
+MIGRATE_SCRIPT = """
+if redis.call('SADD', KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HINCRBYFLOAT', KEYS[1], ARGV[2], ARGV[3])
+for i = 4, #ARGV, 2 do
+    redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+
+def migrated_key(family):
+    return f"ledger_migrated:{family}"
+
+
+# 账本类型: (累计购买 key 前缀, 剩余 key 前缀, zset 前缀, 包内余额字段)
+LEGACY_LAYOUTS = {
+    FAMILY_PACKAGE: ("total_count_origin", "total_count", "packages", "count"),
+    FAMILY_UNIVERSAL: (
+        "total_price_origin",
+        "total_price",
+        "universal_packages",
+        "total_price",
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = "迁移流量包余额到 ledger:{family}:{user_id} 账本"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="只统计, 不写入")
+        parser.add_argument(
+            "--delete-legacy",
+            action="store_true",
+            help="迁移完成后删除旧布局的 key",
+        )
+        parser.add_argument("--batch", type=int, default=500)
+
+    def handle(self, *args, **options):
+        r_usage = get_redis_connection("usage")
+        migrate = r_usage.register_script(MIGRATE_SCRIPT)
+        now = time.time()
+
+        for family, layout in LEGACY_LAYOUTS.items():
+            origin_prefix, rest_prefix, zset_prefix, rest_field = layout
+            migrated_users = set()
+            migrated_packages = 0
+            skipped = 0
+
+            for origin_key in r_usage.scan_iter(
+                    match=f"{origin_prefix}:*", count=options["batch"]):
+                _, user_id, prod_id = origin_key.split(":")
+                zset_key = f"{zset_prefix}:{user_id}:{prod_id}"
+                package_keys = r_usage.zrange(zset_key, 0, -1)
+
+                pipe = r_usage.pipeline(transaction=False)
+                for package_key in package_keys:
+                    pipe.hmget(package_key, rest_field, "expire_at")
+                package_infos = pipe.execute() if package_keys else []
+
+                records = []
+                for package_key, (rest, expire_at) in zip(
+                        package_keys, package_infos):
+                    if rest is None or expire_at is None:
+                        continue
+                    if float(expire_at) < now or float(rest) <= 0:
+                        continue
+                    order_id = package_key.split(":")[-1]
+                    # 旧布局没有记录单个包的购买量, 以当前剩余作为该包的购买量
+                    records.extend((
+                        f"{prod_id}:{order_id}",
+                        pack_record(float(expire_at), rest, rest)))
+
+                if options["dry_run"]:
+                    if r_usage.sismember(migrated_key(family), f"{user_id}:{prod_id}"):
+                        skipped += 1
+                    else:
+                        migrated_users.add(user_id)
+                        migrated_packages += len(records) // 2
+                    continue
+
+                if migrate(
+                        keys=[ledger_key(family, user_id), migrated_key(family)],
+                        args=[f"{user_id}:{prod_id}", f"o:{prod_id}",
+                              float(r_usage.get(origin_key) or 0), *records]):
+                    migrated_users.add(user_id)
+                    migrated_packages += len(records) // 2
+                else:
+                    skipped += 1
+                if options["delete_legacy"]:
+                    r_usage.delete(
+                        origin_key,
+                        f"{rest_prefix}:{user_id}:{prod_id}",
+                        zset_key,
+                        *package_keys)
+
+            self.stdout.write(
+                f"{family}: users={len(migrated_users)} packages={migrated_packages} "
+                f"already migrated={skipped}"
+                f"{' (dry run)' if options['dry_run'] else ''}"
+            )
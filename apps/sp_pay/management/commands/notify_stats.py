@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 19:40
+# @Author  : payne
+# @File    : notify_stats.py
+# @Description : 支付回调去重指标
+#
+# 用法: python manage.py notify_stats [--reset]
+from django.core.management.base import BaseCommand
+
+from apps.sp_pay.notify_dedup import NotifyDedup
+
+
+class Command(BaseCommand):
+    help = "查看支付回调去重指标"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="输出后清空指标")
+
+    def handle(self, *args, **options):
+        stats = NotifyDedup.stats()
+        if not stats:
+            self.stdout.write("no notify metrics")
+        for channel, metrics in sorted(stats.items()):
+            self.stdout.write(
+                f"{channel}: "
+                + ", ".join(f"{name}={value}" for name, value in metrics.items()))
+
+        if options["reset"]:
+            NotifyDedup.reset()
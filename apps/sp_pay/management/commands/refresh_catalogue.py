@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 23:40
+# @Author  : payne
+# @File    : refresh_catalogue.py
+# @Description : 修改 pp_products 后通知所有进程重新加载商品目录快照
+#
+# 用法: python manage.py refresh_catalogue
+from django.core.management.base import BaseCommand
+
+from utils.catalogue import Catalogue
+
+
+class Command(BaseCommand):
+    help = "通知所有进程重新加载商品目录"
+
+    def handle(self, *args, **options):
+        version = Catalogue.bump()
+        self.stdout.write(f"catalogue version {version}")
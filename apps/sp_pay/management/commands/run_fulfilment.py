@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 18:50
+# @Author  : payne
+# @File    : run_fulfilment.py
+# @Description : 支付后履约 worker, 可多进程/多实例部署, 通过 fulfilment:jobs 竞争领取订单
+#
+# 用法: python manage.py run_fulfilment [--threads 4] [--sweep-interval 60]
+import logging
+import signal
+import threading
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+
+from apps.sp_pay.fulfilment import Fulfilment
+
+logger = logging.getLogger("view")
+
+
+class Command(BaseCommand):
+    help = "执行支付后履约任务"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument(
+            "--sweep-interval",
+            type=int,
+            default=60,
+            help="补入队间隔(秒), 0 为不补入队",
+        )
+        parser.add_argument(
+            "--idle",
+            type=float,
+            default=0.5,
+            help="队列为空时的等待时间(秒)",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+        signal.signal(signal.SIGINT, lambda *_: self.stopping.set())
+
+        workers = [
+            threading.Thread(target=self.work, args=(options["idle"],), daemon=True)
+            for _ in range(options["threads"])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"fulfilment started, threads={len(workers)}")
+
+        queue = Fulfilment.queue()
+        last_sweep = 0
+        while not self.stopping.is_set():
+            if options["sweep_interval"] and time.time() - last_sweep > options["sweep_interval"]:
+                last_sweep = time.time()
+                try:
+                    swept = Fulfilment.sweep(queue)
+                    if swept:
+                        logger.warning(f"fulfilment sweep re-queued {swept} orders")
+                except Exception:
+                    logger.error(traceback.format_exc())
+            self.stopping.wait(1)
+
+        for worker in workers:
+            worker.join()
+        self.stdout.write("fulfilment stopped")
+
+    def work(self, idle):
+        queue = Fulfilment.queue()
+        while not self.stopping.is_set():
+            try:
+                order_ids = queue.claim()
+            except Exception:
+                logger.error(traceback.format_exc())
+                self.stopping.wait(idle)
+                continue
+
+            if not order_ids:
+                self.stopping.wait(idle)
+                continue
+            for order_id in order_ids:
+                Fulfilment.handle(queue, order_id)
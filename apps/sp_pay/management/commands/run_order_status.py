@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 20:05
+# @Author  : payne
+# @File    : run_order_status.py
+# @Description : 订单支付状态轮询 worker, 可多实例部署, 通过 order_status:jobs 竞争领取订单
+#
+# 用法: python manage.py run_order_status [--threads 4]
+# 每个线程同时只处理一个订单, 单实例对支付渠道的并发查询不超过 --threads
+import logging
+import signal
+import threading
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from utils.scripts.query_order_status import QueryOrderStatusQueue
+
+logger = logging.getLogger("view")
+
+
+class Command(BaseCommand):
+    help = "轮询订单支付状态"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument(
+            "--idle",
+            type=float,
+            default=0.5,
+            help="队列为空时的等待时间(秒)",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.stopping.set())
+        signal.signal(signal.SIGINT, lambda *_: self.stopping.set())
+
+        workers = [
+            threading.Thread(target=self.work, args=(options["idle"],), daemon=True)
+            for _ in range(options["threads"])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f"order status started, threads={len(workers)}")
+
+        while not self.stopping.is_set():
+            self.stopping.wait(1)
+
+        for worker in workers:
+            worker.join()
+        self.stdout.write("order status stopped")
+
+    def work(self, idle):
+        queue = QueryOrderStatusQueue.queue()
+        while not self.stopping.is_set():
+            try:
+                order_ids = queue.claim()
+                if not order_ids:
+                    self.stopping.wait(idle)
+                    continue
+                QueryOrderStatusQueue.handle(queue, order_ids[0])
+            except Exception:
+                logger.error(traceback.format_exc())
+                self.stopping.wait(idle)
+            finally:
+                close_old_connections()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 20:55
+# @Author  : payne
+# @File    : run_reconcile.py
+# @Description : 未支付订单对账, 定期向支付宝/微信查询并补偿丢失的支付回调
+#
+# 用法: python manage.py run_reconcile [--interval 300] [--once] [--threads 8] [--alipay-qps 10] [--wechat-qps 10]
+import logging
+import signal
+import threading
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.sp_pay.reconcile import Reconciler
+
+logger = logging.getLogger("view")
+
+
+class Command(BaseCommand):
+    help = "未支付订单对账"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=int, default=300, help="对账间隔(秒)")
+        parser.add_argument("--once", action="store_true", help="只执行一次")
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--batch", type=int, default=200)
+        parser.add_argument("--window", type=int, default=7200, help="对账窗口(秒)")
+        parser.add_argument("--min-age", type=int, default=60, help="跳过创建不足此时间(秒)的订单")
+        parser.add_argument("--alipay-qps", type=float, default=None)
+        parser.add_argument("--wechat-qps", type=float, default=None)
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+        signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+        reconciler = Reconciler(
+            threads=options["threads"],
+            alipay_qps=options["alipay_qps"],
+            wechat_qps=options["wechat_qps"],
+            batch=options["batch"],
+        )
+        try:
+            while not stopping.is_set():
+                if options["once"] or Reconciler.acquire_lock(options["interval"]):
+                    try:
+                        summary = reconciler.run_once(
+                            window=options["window"], min_age=options["min_age"])
+                        self.stdout.write(
+                            "reconcile checked={checked} recovered={recovered} expired={expired}".format(**summary))
+                        if summary["recovered"]:
+                            logger.warning(f"reconcile recovered {summary['recovered']} paid orders")
+                    except Exception:
+                        logger.error(traceback.format_exc())
+                    finally:
+                        close_old_connections()
+                if options["once"]:
+                    break
+                stopping.wait(options["interval"])
+        finally:
+            reconciler.close()
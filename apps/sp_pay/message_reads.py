@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 00:10
+# @Author  : payne
+# @File    : message_reads.py
+# @Description : 消息中心已读状态, 每个用户一个 redis 位图, 定期批量写回 omt_message_read_status
+#
+# - message_read:{user_id} 位图, 偏移为 omt_message_center.id, 第 0 位表示已从数据库加载
+#   位图不存在(首次访问或过期)时先按 omt_message_read_status 重建
+# - 标记已读时只有新置位的消息写入待同步队列 message_read:pending ("{user_id}:{message_id}"),
+#   由 flush_message_reads 批量写回数据库
+# - 全部已读不再对整张消息表做反连接, 用进程内的 message_id -> id 映射一次脚本调用完成
+import logging
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .queries import PayQueries
+
+logger = logging.getLogger("view")
+
+MESSAGE_READ_PENDING = "message_read:pending"
+MESSAGE_READ_TTL = 86400 * 30
+# message_id -> id 映射进程内缓存时间(秒)
+MESSAGE_INDEX_TTL = 60
+
+# 置位并记录新读消息; 位图不存在时返回 -1, 由调用方加载后重试
+MARK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local marked = 0
+for i = 3, #ARGV, 2 do
+    if redis.call('SETBIT', KEYS[1], ARGV[i], 1) == 0 then
+        redis.call('RPUSH', KEYS[2], ARGV[2] .. ':' .. ARGV[i + 1])
+        marked = marked + 1
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return marked
+"""
+
+_scripts = {}
+
+
+def _get_script(r_connect, name, source):
+    # 每个进程只注册一次, 之后走 EVALSHA, NOSCRIPT 时 redis-py 会自动重新加载
+    script = _scripts.get(name)
+    if script is None:
+        script = _scripts[name] = r_connect.register_script(source)
+    return script
+
+
+def message_read_key(user_id):
+    return f"message_read:{user_id}"
+
+
+class MessageIndex(object):
+    """
+    message_id -> omt_message_center.id, 在进程内缓存 MESSAGE_INDEX_TTL 秒
+    """
+
+    _lock = threading.Lock()
+    _index = None
+    _loaded_at = 0
+
+    @classmethod
+    def get(cls, force=False):
+        if force or cls._index is None or time.time() - cls._loaded_at > MESSAGE_INDEX_TTL:
+            with cls._lock:
+                if force or cls._index is None or time.time() - cls._loaded_at > MESSAGE_INDEX_TTL:
+                    cls._index = {
+                        each.get("message_id"): int(each.get("id"))
+                        for each in PayQueries.FETCH_MESSAGE_INDEX.fetch_all()
+                    }
+                    cls._loaded_at = time.time()
+        return cls._index
+
+    @classmethod
+    def seqs(cls, message_ids):
+        """
+        :return: [(id, message_id)], 不存在的消息忽略; 有未知消息时(可能是新发布的)重新加载一次
+        """
+        index = cls.get()
+        message_ids = [str(each) for each in message_ids]
+        if any(each not in index for each in message_ids) and time.time() - cls._loaded_at > 1:
+            index = cls.get(force=True)
+        return [(index[each], each) for each in message_ids if each in index]
+
+
+class MessageReads(object):
+    def __init__(self, user_id, r_conn=None):
+        self.user_id = user_id
+        self.key = message_read_key(user_id)
+        self.redis = r_conn or get_redis_connection("default")
+
+    def load(self):
+        """
+        按 omt_message_read_status 重建位图
+        """
+        rows = PayQueries.FETCH_USER_READ_MESSAGES.fetch_all({"user_id": self.user_id})
+        args = ["SET", "u1", 0, 1]
+        for seq, _ in MessageIndex.seqs([each.get("message_id") for each in rows]):
+            args.extend(("SET", "u1", seq, 1))
+
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.execute_command("BITFIELD", self.key, *args)
+        pipe.expire(self.key, MESSAGE_READ_TTL)
+        pipe.execute()
+
+    def mark(self, message_ids):
+        """
+        :return: 新标记为已读的消息数
+        """
+        seqs = MessageIndex.seqs(message_ids)
+        if not seqs:
+            return 0
+        args = [MESSAGE_READ_TTL, self.user_id]
+        for seq, message_id in seqs:
+            args.extend((seq, message_id))
+
+        script = _get_script(self.redis, "message_mark", MARK_SCRIPT)
+        marked = script(keys=[self.key, MESSAGE_READ_PENDING], args=args, client=self.redis)
+        if marked == -1:
+            self.load()
+            marked = script(keys=[self.key, MESSAGE_READ_PENDING], args=args, client=self.redis)
+        return max(marked, 0)
+
+    def mark_all(self):
+        """
+        全部消息标记为已读
+        """
+        return self.mark(list(MessageIndex.get()))
+
+    def read_flags(self, seqs):
+        """
+        :param seqs: omt_message_center.id 列表
+        :return: 与 seqs 对应的 0/1 列表
+        """
+        if not seqs:
+            return []
+        args = []
+        for seq in seqs:
+            args.extend(("GET", "u1", int(seq)))
+
+        flags = self.redis.execute_command("BITFIELD", self.key, "GET", "u1", 0, *args)
+        if not flags[0]:
+            self.load()
+            flags = self.redis.execute_command("BITFIELD", self.key, "GET", "u1", 0, *args)
+        return flags[1:]
+
+    @staticmethod
+    def flush(batch=500, r_conn=None):
+        """
+        待同步队列批量写回 omt_message_read_status, 失败时放回队列
+        :return: 写回条数
+        """
+        r_conn = r_conn or get_redis_connection("default")
+        pipe = r_conn.pipeline(transaction=True)
+        pipe.lrange(MESSAGE_READ_PENDING, 0, batch - 1)
+        pipe.ltrim(MESSAGE_READ_PENDING, batch, -1)
+        entries = pipe.execute()[0]
+        if not entries:
+            return 0
+
+        rows = []
+        for entry in entries:
+            if isinstance(entry, bytes):
+                entry = entry.decode()
+            user_id, message_id = entry.split(":", 1)
+            rows.append({"user_id": user_id, "message_id": message_id})
+
+        try:
+            with transaction.atomic(using=settings.ADMIN_DB):
+                PayQueries.INSERT_MESSAGE_READS.execute_many(rows)
+        except Exception:
+            logger.error(traceback.format_exc())
+            r_conn.rpush(MESSAGE_READ_PENDING, *entries)
+            raise
+        return len(rows)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 17:55
+# @Author  : payne
+# @File    : 0001_orders_list_indexes.py
+# @Description : 订单列表覆盖索引
+#
+# OrdersList 以 po_orders 为驱动表, 按 user_id 过滤、(created_at, order_id) 倒序游标分页,
+# 其余四张表按 order_id 关联, 索引把各表用到的列全部带上, 回表只剩 pp_products 主键查找:
+# - po_orders        (user_id, is_delete, created_at, order_id) + status/source/total_amount
+# - po_orders_items  (order_id, is_delete) + prod_cate_id/prod_id/price/quantity
+# - pp_payments      (order_id, is_delete) + payment_method
+# - pm_membership    (order_id) + expire_at
+# 表由业务库维护, 不在 Django 模型中, 这里只负责索引, 执行: python manage.py migrate sp_pay
+from django.db import migrations
+
+INDEXES = [
+    (
+        "po_orders",
+        "idx_orders_user_created",
+        "user_id, is_delete, created_at, order_id, status, source, total_amount",
+    ),
+    (
+        "po_orders_items",
+        "idx_orders_items_order",
+        "order_id, is_delete, prod_cate_id, prod_id, price, quantity",
+    ),
+    ("pp_payments", "idx_payments_order", "order_id, is_delete, payment_method"),
+    ("pm_membership", "idx_membership_order", "order_id, expire_at"),
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = []
+
+    operations = [
+        migrations.RunSQL(
+            sql=f"ALTER TABLE {table} ADD INDEX {index} ({columns})",
+            reverse_sql=f"ALTER TABLE {table} DROP INDEX {index}",
+        )
+        for table, index, columns in INDEXES
+    ]
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 19:20
+# @Author  : payne
+# @File    : 0002_notify_records.py
+# @Description : 支付回调幂等记录表, 见 notify_dedup.py
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sp_pay", "0001_orders_list_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE TABLE IF NOT EXISTS pp_notify_records (
+                    id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT,
+                    channel TINYINT NOT NULL COMMENT '1 支付宝 2 微信',
+                    out_trade_no VARCHAR(64) NOT NULL COMMENT '商户订单号',
+                    trade_no VARCHAR(64) NOT NULL COMMENT '渠道交易号',
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (id),
+                    UNIQUE KEY uk_notify (channel, out_trade_no, trade_no),
+                    KEY idx_created_at (created_at)
+                ) ENGINE = InnoDB DEFAULT CHARSET = utf8mb4 COMMENT = '支付回调幂等记录'
+            """,
+            reverse_sql="DROP TABLE IF EXISTS pp_notify_records",
+        ),
+    ]
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 20:55
+# @Author  : payne
+# @File    : 0003_orders_status_index.py
+# @Description : 对账及履约补入队按 status + created_at 扫描 po_orders
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sp_pay", "0002_notify_records"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="ALTER TABLE po_orders ADD INDEX idx_orders_status_created (status, created_at, order_id)",
+            reverse_sql="ALTER TABLE po_orders DROP INDEX idx_orders_status_created",
+        ),
+    ]
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 19:20
+# @Author  : payne
+# @File    : notify_dedup.py
+# @Description : 支付回调幂等, 按 (渠道, 商户订单号, 渠道交易号) 去重, 重复通知直接返回成功
+#
+# - redis(order 库) notify:{channel}:{out_trade_no}:{trade_no}, 处理中为 p, 事务提交后为 d
+#   验签之前一次脚本调用即可判断: d 直接返回成功, p 说明同一通知正在处理, 返回失败让渠道稍后重试
+# - pp_notify_records 唯一键 (channel, out_trade_no, trade_no), 在回调事务内写入,
+#   redis 不可用或记录过期时由唯一键兜底, 并发的重复通知会等待前一个事务提交后命中唯一键
+# - 指标 hash notify:metrics, 字段 {channel}:{name}
+import logging
+import time
+import traceback
+
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .fulfilment import CHANNEL_ALIPAY, CHANNEL_WECHAT
+from .queries import PayQueries
+
+logger = logging.getLogger("view")
+
+NOTIFY_METRICS = "notify:metrics"
+
+# 支付宝最长 25 小时内重试 8 次, 微信 24 小时内重试 15 次
+NOTIFY_DONE_TTL = 86400 * 2
+# 处理中标记的过期时间(秒), 进程崩溃时不会长期挡住重试
+NOTIFY_PENDING_TTL = 60
+
+CHANNEL_NAMES = {
+    CHANNEL_ALIPAY: "alipay",
+    CHANNEL_WECHAT: "wechat",
+}
+
+# 读取通知状态, 未处理时标记为处理中, 同时累计指标
+BEGIN_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+redis.call('HINCRBY', KEYS[2], ARGV[2] .. ':received', 1)
+if current then
+    local name = 'inflight'
+    if current == 'd' then
+        name = 'dup_redis'
+    end
+    redis.call('HINCRBY', KEYS[2], ARGV[2] .. ':' .. name, 1)
+    return current
+end
+redis.call('SET', KEYS[1], 'p', 'EX', ARGV[1])
+return false
+"""
+
+_scripts = {}
+
+
+def _get_script(r_connect, name, source):
+    # 每个进程只注册一次, 之后走 EVALSHA, NOSCRIPT 时 redis-py 会自动重新加载
+    script = _scripts.get(name)
+    if script is None:
+        script = _scripts[name] = r_connect.register_script(source)
+    return script
+
+
+def notify_key(channel, out_trade_no, trade_no):
+    return f"notify:{channel}:{out_trade_no}:{trade_no}"
+
+
+class NotifyDedup(object):
+    DONE = "d"
+    PENDING = "p"
+
+    def __init__(self, channel, out_trade_no, trade_no, r_order=None):
+        self.channel = channel
+        self.out_trade_no = out_trade_no
+        self.trade_no = trade_no
+        self.key = notify_key(channel, out_trade_no, trade_no)
+        self.redis = r_order
+        self.enabled = bool(out_trade_no and trade_no)
+        self.claimed = False
+        self.started = time.perf_counter()
+
+    def begin(self):
+        """
+        验签之前调用
+        :return: DONE 已处理过, PENDING 正在处理, None 需要继续处理
+        """
+        if not self.enabled:
+            return None
+        try:
+            self.redis = self.redis or get_redis_connection("order")
+            current = _get_script(self.redis, "notify_begin", BEGIN_SCRIPT)(
+                keys=[self.key, NOTIFY_METRICS],
+                args=[NOTIFY_PENDING_TTL, self.channel],
+                client=self.redis,
+            )
+        except Exception:
+            # redis 不可用时由唯一键兜底
+            logger.error(traceback.format_exc())
+            self.redis = None
+            return None
+
+        if current is None:
+            self.claimed = True
+            return None
+        return current.decode() if isinstance(current, bytes) else current
+
+    def record(self):
+        """
+        验签通过后、更新订单之前在回调事务内调用
+        :return: False 表示唯一键已存在, 该通知已处理过
+        """
+        if not self.enabled:
+            return True
+        if PayQueries.INSERT_NOTIFY_RECORD.execute({
+            "channel": self.channel,
+            "out_trade_no": self.out_trade_no,
+            "trade_no": self.trade_no,
+        }):
+            return True
+
+        # 已提交过, 补上 redis 标记, 之后的重复通知在验签前返回
+        self._finish(self.DONE, "dup_mysql")
+        return False
+
+    def commit(self):
+        """
+        更新成功后调用, 事务提交后标记为已处理
+        """
+        if self.enabled:
+            transaction.on_commit(lambda: self._finish(self.DONE, "processed"))
+
+    def abort(self):
+        """
+        处理失败时调用, 清除处理中标记, 渠道重试时重新处理
+        """
+        if not self.claimed:
+            return
+        self.claimed = False
+        try:
+            self.redis.delete(self.key)
+        except Exception:
+            logger.error(traceback.format_exc())
+
+    def _finish(self, state, metric):
+        elapsed = int((time.perf_counter() - self.started) * 1000000)
+        try:
+            r_order = self.redis or get_redis_connection("order")
+            pipe = r_order.pipeline(transaction=False)
+            pipe.set(self.key, state, ex=NOTIFY_DONE_TTL)
+            pipe.hincrby(NOTIFY_METRICS, f"{self.channel}:{metric}", 1)
+            pipe.hincrby(NOTIFY_METRICS, f"{self.channel}:{metric}_us", elapsed)
+            pipe.execute()
+        except Exception:
+            logger.error(traceback.format_exc())
+        self.claimed = False
+
+    @staticmethod
+    def stats(r_order=None):
+        """
+        :return: {渠道名: 指标}, saved_ms 为按首次处理平均耗时估算的重复通知节省时间
+        """
+        r_order = r_order or get_redis_connection("order")
+        raw = {}
+        for field, value in r_order.hgetall(NOTIFY_METRICS).items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            channel, name = field.split(":", 1)
+            raw.setdefault(int(channel), {})[name] = int(value)
+
+        stats = {}
+        for channel, metrics in raw.items():
+            processed = metrics.get("processed", 0)
+            avg_us = metrics.get("processed_us", 0) / processed if processed else 0
+            duplicates = metrics.get("dup_redis", 0) + metrics.get("dup_mysql", 0)
+            stats[CHANNEL_NAMES.get(channel, str(channel))] = {
+                "received": metrics.get("received", 0),
+                "processed": processed,
+                "dup_redis": metrics.get("dup_redis", 0),
+                "dup_mysql": metrics.get("dup_mysql", 0),
+                "inflight": metrics.get("inflight", 0),
+                "avg_processed_ms": round(avg_us / 1000, 2),
+                # 唯一键命中的重复通知已经付出了验签和一次插入的开销, 从节省中扣除
+                "saved_ms": round(
+                    (duplicates * avg_us - metrics.get("dup_mysql_us", 0)) / 1000, 2),
+            }
+        return stats
+
+    @staticmethod
+    def reset(r_order=None):
+        (r_order or get_redis_connection("order")).delete(NOTIFY_METRICS)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 17:40
+# @Author  : payne
+# @File    : order_count.py
+# @Description : 订单列表总数缓存, 下单/支付回调/删除/过期时失效
+#
+# order 库 hash order_count:{user_id}, 每种筛选条件一个字段, 值为 "{计数开始时间}:{总数}";
+# 失效时写入字段 i 记录失效时间, 计数开始早于失效时间的结果视为未命中
+import logging
+import time
+import traceback
+
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .queries import PayQueries
+
+logger = logging.getLogger("view")
+
+# 订单总数缓存时间(秒)
+ORDER_COUNT_TTL = 3600
+
+
+def order_count_key(user_id):
+    return f"order_count:{user_id}"
+
+
+class OrderCountCache(object):
+    INVALIDATED_FIELD = "i"
+
+    @staticmethod
+    def field(params):
+        prod_cate_ids = ",".join(
+            sorted(str(each) for each in params.get("prod_cate_ids") or ()))
+        return f"{params.get('status') or ''}:{prod_cate_ids}"
+
+    @staticmethod
+    def fetch(params, r_order=None):
+        """
+        :param params: OrdersList 查询参数, 按单个订单号查询时不走缓存
+        :return: 订单总数
+        """
+        if params.get("order_id") is not None:
+            return PayQueries.COUNT_ORDERS.fetch_one(params).get("total")
+
+        r_order = r_order or get_redis_connection("order")
+        key = order_count_key(params["user_id"])
+        field = OrderCountCache.field(params)
+        now = time.time()
+
+        try:
+            cached, invalidated_at = r_order.hmget(
+                key, field, OrderCountCache.INVALIDATED_FIELD)
+            if cached:
+                if isinstance(cached, bytes):
+                    cached = cached.decode()
+                counted_at, total = cached.split(":")
+                if float(counted_at) > float(invalidated_at or 0):
+                    return total
+        except Exception:
+            logger.error(traceback.format_exc())
+
+        total = PayQueries.COUNT_ORDERS.fetch_one(params).get("total")
+
+        try:
+            pipe = r_order.pipeline(transaction=False)
+            pipe.hset(key, field, f"{now}:{total}")
+            pipe.expire(key, ORDER_COUNT_TTL)
+            pipe.execute()
+        except Exception:
+            logger.error(traceback.format_exc())
+        return total
+
+    @staticmethod
+    def invalidate(user_id, r_order=None):
+        """
+        订单增删或状态变化后调用, 在事务提交后生效, 避免提交前的计数被重新缓存
+        """
+        if not user_id:
+            return
+
+        def _invalidate():
+            key = order_count_key(user_id)
+            try:
+                pipe = (r_order or get_redis_connection("order")).pipeline(
+                    transaction=False)
+                pipe.hset(key, OrderCountCache.INVALIDATED_FIELD, time.time())
+                pipe.expire(key, ORDER_COUNT_TTL)
+                pipe.execute()
+            except Exception:
+                logger.error(traceback.format_exc())
+
+        transaction.on_commit(_invalidate)
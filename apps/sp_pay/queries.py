@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 16:10
+# @Author  : payne
+# @File    : queries.py
+# @Description : pay 模块参数化语句, 统一在这里声明, 视图中通过 PayQueries 执行
+
+from utils.sql_oper import QueryRegistry
+
+
+class PayQueries(object):
+    # 产品
+    # 商品列表见 utils.catalogue
+    FETCH_PRODUCT_PRICE = QueryRegistry.register(
+        "pay.fetch_product_price",
+        "SELECT prod_price, prod_cate_id FROM {db}.pp_products "
+        "WHERE prod_id = %(prod_id)s AND is_delete = 0",
+    )
+
+    # 订单列表
+    ORDERS_FILTERS = {
+        "status": " AND a.status = %(status)s",
+        "order_id": " AND a.order_id = %(order_id)s",
+        "prod_cate_ids": " AND oi.prod_cate_id IN %(prod_cate_ids)s",
+    }
+    FETCH_ORDERS = QueryRegistry.register(
+        "pay.fetch_orders",
+        "SELECT a.order_id, a.source, oi.price, b.prod_name, b.prod_id, b.prod_cate_id, "
+        "b.valid_period_days, a.total_amount, c.payment_method, a.created_at, a.status, "
+        "oi.quantity, d.expire_at "
+        "FROM {db}.po_orders AS a "
+        "LEFT JOIN {db}.po_orders_items AS oi ON a.order_id = oi.order_id "
+        "LEFT JOIN {db}.pp_products AS b ON oi.prod_id = b.prod_id "
+        "LEFT JOIN {db}.pp_payments AS c ON a.order_id = c.order_id "
+        "LEFT JOIN {db}.pm_membership AS d ON a.order_id = d.order_id "
+        "WHERE a.is_delete = 0 AND a.user_id = %(user_id)s AND oi.is_delete = 0"
+        "{status}{order_id}{prod_cate_ids}{after} "
+        "ORDER BY a.created_at DESC, a.order_id DESC{limit}{offset}",
+        optional=dict(
+            ORDERS_FILTERS,
+            # 游标分页, 从上一页最后一条 (created_at, order_id) 之后继续
+            after=" AND (a.created_at < %(after_created_at)s OR "
+                  "(a.created_at = %(after_created_at)s AND a.order_id < %(after_order_id)s))",
+            limit=" LIMIT %(limit)s",
+            offset=" OFFSET %(offset)s",
+        ),
+    )
+    COUNT_ORDERS = QueryRegistry.register(
+        "pay.count_orders",
+        "SELECT COUNT(a.order_id) AS total "
+        "FROM {db}.po_orders AS a "
+        "LEFT JOIN {db}.po_orders_items AS oi ON a.order_id = oi.order_id "
+        "LEFT JOIN {db}.pp_products AS b ON oi.prod_id = b.prod_id "
+        "LEFT JOIN {db}.pp_payments AS c ON a.order_id = c.order_id "
+        "LEFT JOIN {db}.pm_membership AS d ON a.order_id = d.order_id "
+        "WHERE a.is_delete = 0 AND a.user_id = %(user_id)s AND b.is_delete = 0 "
+        "AND c.is_delete = 0 AND oi.is_delete = 0{status}{order_id}{prod_cate_ids}",
+        optional=ORDERS_FILTERS,
+    )
+    FETCH_ORDERS_USERS = QueryRegistry.register(
+        "pay.fetch_orders_users",
+        "SELECT DISTINCT user_id FROM {db}.po_orders WHERE order_id IN %(order_ids)s",
+    )
+    DELETE_ORDERS = QueryRegistry.register(
+        "pay.delete_orders",
+        "UPDATE {db}.po_orders AS o "
+        "JOIN {db}.po_orders_items AS oi ON o.order_id = oi.order_id "
+        "JOIN {db}.pp_payments AS p ON o.order_id = p.order_id "
+        "SET o.is_delete = 1, oi.is_delete = 1, p.is_delete = 1 "
+        "WHERE o.order_id IN %(order_ids)s",
+    )
+
+    # 下单
+    INSERT_ORDER = QueryRegistry.register(
+        "pay.insert_order",
+        "INSERT INTO {db}.po_orders (order_id, source, user_id, total_amount, status, prod_cate_id) "
+        "VALUES (%(order_id)s, %(source)s, %(user_id)s, %(total_amount)s, %(status)s, %(prod_cate_id)s)",
+    )
+    INSERT_ORDER_ITEM = QueryRegistry.register(
+        "pay.insert_order_item",
+        "INSERT INTO {db}.po_orders_items "
+        "(order_id, prod_id, quantity, price, prod_cate_id, model_name, live_code) "
+        "VALUES (%(order_id)s, %(prod_id)s, %(quantity)s, %(price)s, %(prod_cate_id)s, "
+        "%(model_name)s, %(live_code)s)",
+    )
+    INSERT_PAYMENT = QueryRegistry.register(
+        "pay.insert_payment",
+        "INSERT INTO {db}.pp_payments (order_id, user_id, amount, status, payment_method, pay_data) "
+        "VALUES (%(order_id)s, %(user_id)s, %(amount)s, 0, %(payment_method)s, '')",
+    )
+    INSERT_CODE_ORDER = QueryRegistry.register(
+        "pay.insert_code_order",
+        "INSERT INTO {db}.po_orders (order_id, user_id, total_amount, status, prod_cate_id) "
+        "VALUES (%(order_id)s, %(user_id)s, %(total_amount)s, %(status)s, %(prod_cate_id)s)",
+    )
+    INSERT_CODE_ORDER_ITEM = QueryRegistry.register(
+        "pay.insert_code_order_item",
+        "INSERT INTO {db}.po_orders_items (order_id, prod_id, quantity, price, prod_cate_id) "
+        "VALUES (%(order_id)s, %(prod_id)s, 1, %(price)s, %(prod_cate_id)s)",
+    )
+    UPDATE_PAY_DATA = QueryRegistry.register(
+        "pay.update_pay_data",
+        "UPDATE {db}.pp_payments SET pay_data = %(pay_data)s{pre_pay_id} "
+        "WHERE order_id = %(order_id)s",
+        optional={"pre_pay_id": ", pre_pay_id = %(pre_pay_id)s"},
+    )
+
+    # 支付完成
+    MARK_PAYMENT_PAID = QueryRegistry.register(
+        "pay.mark_payment_paid",
+        "UPDATE {db}.pp_payments SET status = 1, pay_id = %(pay_id)s WHERE order_id = %(order_id)s",
+    )
+    MARK_ORDER_PAID = QueryRegistry.register(
+        "pay.mark_order_paid",
+        "UPDATE {db}.po_orders SET status = 2, processed = 1 WHERE order_id = %(order_id)s",
+    )
+    # 回调只标记已支付, 履约完成后由 run_fulfilment 置 processed = 1;
+    # 已被主动查询置为已支付的订单不匹配, 影响行数为 0, 不再重复履约
+    MARK_ORDER_PAID_PENDING = QueryRegistry.register(
+        "pay.mark_order_paid_pending",
+        "UPDATE {db}.po_orders SET status = 2, processed = 0 "
+        "WHERE order_id = %(order_id)s AND status <> 2",
+    )
+    FETCH_ORDER_STATUS = QueryRegistry.register(
+        "pay.fetch_order_status",
+        "SELECT status FROM {db}.po_orders WHERE order_id = %(order_id)s",
+    )
+    MARK_ORDER_FULFILLED = QueryRegistry.register(
+        "pay.mark_order_fulfilled",
+        "UPDATE {db}.po_orders SET processed = 1 WHERE order_id = %(order_id)s",
+    )
+    FETCH_FULFILMENT_ORDER = QueryRegistry.register(
+        "pay.fetch_fulfilment_order",
+        "SELECT a.order_id, a.user_id, a.prod_cate_id, a.total_amount, a.processed, "
+        "b.prod_id, b.quantity, c.payment_method "
+        "FROM {db}.po_orders a "
+        "LEFT JOIN {db}.po_orders_items b ON a.order_id = b.order_id "
+        "LEFT JOIN {db}.pp_payments c ON a.order_id = c.order_id "
+        "WHERE a.order_id = %(order_id)s AND a.status = 2 LIMIT 1",
+    )
+    FETCH_UNFULFILLED_ORDERS = QueryRegistry.register(
+        "pay.fetch_unfulfilled_orders",
+        "SELECT order_id FROM {db}.po_orders WHERE status = 2 AND processed = 0 "
+        "AND created_at >= NOW() - INTERVAL %(days)s DAY LIMIT 500",
+    )
+    # 回调幂等, 唯一键 (channel, out_trade_no, trade_no), 重复时影响行数为 0
+    INSERT_NOTIFY_RECORD = QueryRegistry.register(
+        "pay.insert_notify_record",
+        "INSERT IGNORE INTO {db}.pp_notify_records (channel, out_trade_no, trade_no) "
+        "VALUES (%(channel)s, %(out_trade_no)s, %(trade_no)s)",
+    )
+    FETCH_ORDER_PROD = QueryRegistry.register(
+        "pay.fetch_order_prod",
+        "SELECT a.user_id, a.prod_cate_id, b.prod_id, b.quantity, b.price, a.total_amount "
+        "FROM {db}.po_orders a LEFT JOIN {db}.po_orders_items b ON a.order_id = b.order_id "
+        "WHERE a.order_id = %(order_id)s",
+    )
+
+    # 支付结果 / 重新支付
+    FETCH_PAYMENT_STATUS = QueryRegistry.register(
+        "pay.fetch_payment_status",
+        "SELECT status FROM {db}.pp_payments WHERE order_id = %(order_id)s",
+    )
+    FETCH_PAYMENT_DETAIL = QueryRegistry.register(
+        "pay.fetch_payment_detail",
+        "SELECT pp_payments.status, pp_payments.payment_method, pp_payments.created_at, "
+        "pp_payments.amount, pp_payments.pay_id, pp_payments.order_id, "
+        "po_orders_items.prod_id, pp_products.prod_name "
+        "FROM {db}.po_orders_items "
+        "INNER JOIN {db}.pp_products ON po_orders_items.prod_id = pp_products.prod_id "
+        "INNER JOIN {db}.pp_payments ON po_orders_items.order_id = pp_payments.order_id "
+        "WHERE po_orders_items.order_id = %(order_id)s",
+    )
+    FETCH_REPAY_ORDER = QueryRegistry.register(
+        "pay.fetch_repay_order",
+        "SELECT user_id, pay_data, UNIX_TIMESTAMP(created_at) AS created_at FROM {db}.pp_payments "
+        "WHERE order_id = %(order_id)s AND is_delete = 0",
+    )
+    EXPIRE_PAYMENT = QueryRegistry.register(
+        "pay.expire_payment",
+        "UPDATE {db}.pp_payments SET status = 4 WHERE order_id = %(order_id)s AND is_delete = 0",
+    )
+    EXPIRE_ORDER = QueryRegistry.register(
+        "pay.expire_order",
+        "UPDATE {db}.po_orders SET status = 4 WHERE order_id = %(order_id)s AND is_delete = 0",
+    )
+
+    # 会员
+    FETCH_MEMBERSHIP_EXPIRE = QueryRegistry.register(
+        "pay.fetch_membership_expire",
+        "SELECT expire_at FROM {db}.pm_membership WHERE user_id = %(user_id)s "
+        "AND status = 1 ORDER BY expire_at DESC LIMIT 1",
+    )
+    EXPIRE_MEMBERSHIP = QueryRegistry.register(
+        "pay.expire_membership",
+        "UPDATE {db}.pm_membership SET status = 2 WHERE user_id = %(user_id)s",
+    )
+    FETCH_CURRENT_VIP_ORDER = QueryRegistry.register(
+        "pay.fetch_current_vip_order",
+        "SELECT oi.prod_id, o.order_id FROM {db}.po_orders_items oi "
+        "INNER JOIN {db}.po_orders o ON oi.order_id = o.order_id "
+        "WHERE o.user_id = %(user_id)s AND o.status = 2 AND oi.prod_cate_id = 3 "
+        "ORDER BY o.created_at DESC LIMIT 1",
+    )
+
+    # 卡密
+    FETCH_ACTIVATE_CODE = QueryRegistry.register(
+        "pay.fetch_activate_code",
+        "SELECT activate_code_id, generated_by, to_prod_id, status, expired_date "
+        "FROM {admin_db}.oa_activate_code WHERE activate_code = %(activate_code)s "
+        "AND NOW() < expired_date AND is_delete = 0",
+        using="{admin_db}",
+    )
+    CONSUME_ACTIVATE_CODE = QueryRegistry.register(
+        "pay.consume_activate_code",
+        "UPDATE {admin_db}.oa_activate_code SET consumed_by = %(user_id)s, status = 1 "
+        "WHERE activate_code = %(activate_code)s",
+        using="{admin_db}",
+    )
+
+    # 对账
+    FETCH_RECONCILE_ORDERS = QueryRegistry.register(
+        "pay.fetch_reconcile_orders",
+        "SELECT a.order_id, a.user_id, a.source, a.created_at, c.payment_method "
+        "FROM {db}.po_orders AS a "
+        "INNER JOIN {db}.pp_payments AS c ON a.order_id = c.order_id "
+        "WHERE a.status = 1 AND a.is_delete = 0 AND c.payment_method IN (1, 2) "
+        "AND a.created_at >= NOW() - INTERVAL %(window)s SECOND "
+        "AND a.created_at < NOW() - INTERVAL %(min_age)s SECOND{after} "
+        "ORDER BY a.created_at, a.order_id LIMIT %(limit)s",
+        optional={
+            "after": " AND (a.created_at > %(after_created_at)s OR "
+                     "(a.created_at = %(after_created_at)s AND a.order_id > %(after_order_id)s))",
+        },
+    )
+    LOCK_UNPAID_ORDERS = QueryRegistry.register(
+        "pay.lock_unpaid_orders",
+        "SELECT order_id, user_id FROM {db}.po_orders "
+        "WHERE order_id IN %(order_ids)s AND status = 1 FOR UPDATE",
+    )
+    MARK_ORDERS_PAID_PENDING = QueryRegistry.register(
+        "pay.mark_orders_paid_pending",
+        "UPDATE {db}.po_orders SET status = 2, processed = 0 "
+        "WHERE order_id IN %(order_ids)s AND status = 1",
+    )
+    EXPIRE_UNPAID_PAYMENTS = QueryRegistry.register(
+        "pay.expire_unpaid_payments",
+        "UPDATE {db}.pp_payments SET status = 4 WHERE order_id IN %(order_ids)s AND status = 0",
+    )
+    EXPIRE_UNPAID_ORDERS = QueryRegistry.register(
+        "pay.expire_unpaid_orders",
+        "UPDATE {db}.po_orders SET status = 4 WHERE order_id IN %(order_ids)s AND status = 1",
+    )
+
+    # 消息中心已读状态
+    FETCH_MESSAGE_INDEX = QueryRegistry.register(
+        "pay.fetch_message_index",
+        "SELECT id, message_id FROM {admin_db}.omt_message_center",
+        using="{admin_db}",
+    )
+    FETCH_USER_READ_MESSAGES = QueryRegistry.register(
+        "pay.fetch_user_read_messages",
+        "SELECT message_id FROM {admin_db}.omt_message_read_status WHERE user_id = %(user_id)s",
+        using="{admin_db}",
+    )
+    INSERT_MESSAGE_READS = QueryRegistry.register(
+        "pay.insert_message_reads",
+        "INSERT INTO {admin_db}.omt_message_read_status (user_id, message_id, is_read) "
+        "VALUES (%(user_id)s, %(message_id)s, 1) ON DUPLICATE KEY UPDATE is_read = 1",
+        using="{admin_db}",
+    )
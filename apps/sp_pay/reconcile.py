@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 20:40
+# @Author  : payne
+# @File    : reconcile.py
+# @Description : 未支付订单对账, 批量向支付宝/微信查询支付状态, 补偿丢失的支付回调
+#
+# - 选取时间窗口内 status = 1 的订单, 按 (created_at, order_id) 分批
+# - 线程池并发查询, 每个渠道一个 QPS 限制, 连接复用 utils.http_client 的连接池
+# - 每批结果在一个事务内批量更新: 已支付 -> status = 2, processed = 0 并进入履约队列; 已关闭 -> status = 4
+# - 已支付的订单同时写入 pp_notify_records, 之后到达的支付回调按重复通知处理
+import logging
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from utils.exception import AliPayException
+from utils.payment.alipay import AliPay
+from utils.payment.wechat_pay import query_payment_status
+
+from .fulfilment import CHANNEL_ALIPAY, CHANNEL_WECHAT, Fulfilment
+from .order_count import OrderCountCache
+from .queries import PayQueries
+
+logger = logging.getLogger("view")
+
+RECONCILE_LOCK = "reconcile:lock"
+
+# 查询结果
+PAID = "paid"
+CLOSED = "closed"
+
+ALIPAY_PAID_STATES = ("TRADE_SUCCESS", "TRADE_FINISHED")
+WECHAT_CLOSED_STATES = ("CLOSED", "REVOKED", "PAYERROR")
+
+
+class RateLimiter(object):
+    """
+    按固定间隔放行, 多线程共享
+    """
+
+    def __init__(self, qps):
+        self.interval = 1.0 / qps if qps else 0
+        self.next_at = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self.next_at - now
+            self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class Reconciler(object):
+    def __init__(self, threads=8, alipay_qps=None, wechat_qps=None, batch=200):
+        self.threads = threads
+        self.batch = batch
+        self.alipay = AliPay()
+        self.limiters = {
+            CHANNEL_ALIPAY: RateLimiter(
+                alipay_qps or getattr(settings, "RECONCILE_ALIPAY_QPS", 10)),
+            CHANNEL_WECHAT: RateLimiter(
+                wechat_qps or getattr(settings, "RECONCILE_WECHAT_QPS", 10)),
+        }
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def close(self):
+        self.pool.shutdown()
+
+    def query(self, order):
+        """
+        :return: (order, 结果, 渠道交易号), 未支付或查询失败时结果为 None
+        """
+        channel = int(order.get("payment_method"))
+        order_id = order.get("order_id")
+        self.limiters[channel].acquire()
+        try:
+            if channel == CHANNEL_ALIPAY:
+                result = self.alipay.api_alipay_trade_query(out_trade_no=order_id)
+                trade_status = result.get("trade_status")
+                if result.get("code") == "10000" and trade_status in ALIPAY_PAID_STATES:
+                    return order, PAID, result.get("trade_no")
+                if trade_status == "TRADE_CLOSED":
+                    return order, CLOSED, None
+            else:
+                result = query_payment_status(order_id, order.get("source"))
+                if result and result.get("result_code") == "SUCCESS":
+                    trade_state = result.get("trade_state")
+                    if trade_state == "SUCCESS":
+                        return order, PAID, result.get("transaction_id")
+                    if trade_state in WECHAT_CLOSED_STATES:
+                        return order, CLOSED, None
+        except AliPayException:
+            # 交易不存在, 用户未扫码
+            pass
+        except Exception:
+            logger.warning(f"reconcile query {order_id} failed: {traceback.format_exc()}")
+        return order, None, None
+
+    def apply(self, results):
+        """
+        批量更新一批查询结果
+        :return: (补单数, 关闭数)
+        """
+        paid = {
+            order.get("order_id"): (order, trade_no)
+            for order, state, trade_no in results
+            if state == PAID and trade_no
+        }
+        closed = [order for order, state, _ in results if state == CLOSED]
+        if not paid and not closed:
+            return 0, 0
+
+        with transaction.atomic():
+            recovered = []
+            if paid:
+                # 锁定仍未支付的订单, 与同时到达的支付回调互斥
+                recovered = PayQueries.LOCK_UNPAID_ORDERS.fetch_all(
+                    {"order_ids": tuple(paid)})
+            if recovered:
+                order_ids = tuple(each.get("order_id") for each in recovered)
+                PayQueries.MARK_PAYMENT_PAID.execute_many([
+                    {"pay_id": paid[order_id][1], "order_id": order_id}
+                    for order_id in order_ids
+                ])
+                PayQueries.MARK_ORDERS_PAID_PENDING.execute(
+                    {"order_ids": order_ids})
+                PayQueries.INSERT_NOTIFY_RECORD.execute_many([
+                    {
+                        "channel": int(paid[order_id][0].get("payment_method")),
+                        "out_trade_no": order_id,
+                        "trade_no": paid[order_id][1],
+                    }
+                    for order_id in order_ids
+                ])
+                for each in recovered:
+                    Fulfilment.enqueue(each.get("order_id"))
+                    OrderCountCache.invalidate(each.get("user_id"))
+
+            expired = 0
+            if closed:
+                order_ids = tuple(order.get("order_id") for order in closed)
+                PayQueries.EXPIRE_UNPAID_PAYMENTS.execute({"order_ids": order_ids})
+                expired = PayQueries.EXPIRE_UNPAID_ORDERS.execute(
+                    {"order_ids": order_ids})
+                for user_id in {order.get("user_id") for order in closed}:
+                    OrderCountCache.invalidate(user_id)
+
+        return len(recovered), expired
+
+    def run_once(self, window=7200, min_age=60):
+        """
+        :param window: 对账窗口(秒), 只查询此时间内创建的订单
+        :param min_age: 创建不足此时间(秒)的订单留给支付回调
+        :return: {"checked", "recovered", "expired"}
+        """
+        summary = {"checked": 0, "recovered": 0, "expired": 0}
+        params = {"window": window, "min_age": min_age, "limit": self.batch}
+        while True:
+            orders = PayQueries.FETCH_RECONCILE_ORDERS.fetch_all(params)
+            if not orders:
+                break
+
+            results = list(self.pool.map(self.query, orders))
+            try:
+                recovered, expired = self.apply(results)
+            except Exception:
+                logger.error(traceback.format_exc())
+                recovered, expired = 0, 0
+            summary["checked"] += len(orders)
+            summary["recovered"] += recovered
+            summary["expired"] += expired
+
+            if len(orders) < self.batch:
+                break
+            cursor = (orders[-1].get("created_at"), orders[-1].get("order_id"))
+            # 游标未前进时退出, 避免反复查询同一页
+            if params.get("after") and cursor <= (params["after_created_at"], params["after_order_id"]):
+                logger.error(f"reconcile cursor did not advance at {cursor}")
+                break
+            params["after"] = True
+            params["after_created_at"], params["after_order_id"] = cursor
+        return summary
+
+    @staticmethod
+    def acquire_lock(ttl):
+        """
+        多实例部署时同一时间只有一个实例对账
+        """
+        return bool(get_redis_connection("order").set(
+            RECONCILE_LOCK, int(time.time()), nx=True, ex=ttl))
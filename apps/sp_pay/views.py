@@ -7,11 +7,9 @@ import random
 import time
 import traceback
 from collections import defaultdict
-from decimal import ROUND_HALF_UP, Decimal, getcontext
+from decimal import ROUND_HALF_UP, Decimal
 from typing import List
-from urllib.parse import parse_qs
 
-import requests
 from django.conf import settings
 from django.db import connection, connections, transaction
 from django.http import HttpResponse
@@ -24,20 +22,32 @@ from rest_framework.views import APIView
 from rest_framework_extensions.cache.decorators import cache_response
 
 from language.language_pack import RET, Language
-from utils.cst_class import CstException, CstResponse
+from utils.catalogue import Catalogue
+from utils.cst_class import CstException, CstRawResponse, CstResponse
 from utils.distributed_id_generator.get_id import get_distributed_id
 from utils.gadgets import CstKeyConstructor, gadgets
-from utils.json_datetime import DateTimeEncoder
+from utils.http_client import http
 from utils.my_decorators import (ExperienceCardRejectSecPurchase,
                                  ValidateAmount)
-from utils.payment.alipay import AliPay
-from utils.payment.wechat_pay import (get_pay_sign, get_sign,
-                                      query_payment_status, trans_dict_to_xml,
-                                      trans_xml_to_dict, wxpay)
+from utils.payment.alipay import AliPay, AliPayNotify
+from utils.payment import wechat_codec
+from utils.payment.wechat_pay import (get_pay_sign, query_payment_status,
+                                      trans_dict_to_xml, trans_xml_to_dict,
+                                      wxpay)
+from utils.quota.deduction import QuotaDeduction
+from utils.quota.entitlement import MEMBERSHIP_ENABLED, EntitlementCache
+from utils.quota.snapshot import ProductMaps, load_snapshot
+from utils.quota.vip_quota import QuotaTemplate, VipQuota
 from utils.scripts.query_order_status import QueryOrderStatusQueue
 from utils.serializers import QuestionsSetManageSerializer
 from utils.sql_oper import MysqlOper
 
+from .fulfilment import CHANNEL_ALIPAY, CHANNEL_WECHAT, Fulfilment
+from .message_reads import MessageReads
+from .notify_dedup import NotifyDedup
+from .order_count import OrderCountCache
+from .queries import PayQueries
+
 logger = logging.getLogger("view")
 
 
@@ -852,85 +862,13 @@ class ProductsList(APIView):
 
         prod_cate_id = data.get("prod_cate_id")
 
-        if len(prod_cate_id) == 1:
-            prod_cate_id = "({})".format(str(prod_cate_id[0]))
-        else:
-            prod_cate_id = tuple(prod_cate_id)
-        # sql_fetch_prod = f"SELECT prod_id, prod_name, prod_description, prod_details, prod_origin_price, prod_price,continuous_annual_sub_price, prod_cate_id FROM {settings.DEFAULT_DB}." \
-        #                  f"pp_products WHERE prod_cate_id in {prod_cate_id} AND is_show = 1  ORDER BY prod_price DESC"
-
-        sql_fetch_prod = (
-            f"SELECT prod_id, prod_name, prod_description, prod_details,prod_rules, "
-            f"prod_origin_price, prod_price,continuous_annual_sub_price, prod_cate_id, "
-            f" directed_hashrate,universal_hashrate,  hashrate FROM {settings.DEFAULT_DB}."
-            f" pp_products WHERE prod_cate_id in {prod_cate_id} AND is_show = 1 ORDER BY prod_price DESC")
-
-        logger.info(sql_fetch_prod)
-
-        ret_data = defaultdict(list)
-
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_fetch_prod)
-                query_data = MysqlOper.get_query_result(cursor)
-                for each_prod in query_data:
-                    prod_data = {}
-                    prod_id = each_prod.get("prod_id")
-                    prod_name = each_prod.get("prod_name")
-                    prod_desc = each_prod.get("prod_description")
-                    prod_rules = each_prod.get("prod_rules")
-                    prod_details = each_prod.get("prod_details")
-                    prod_origin_price = each_prod.get("prod_origin_price")
-                    prod_price = each_prod.get("prod_price")
-                    prod_cate_id = each_prod.get("prod_cate_id")
-                    continuous_annual_sub_price = each_prod.get(
-                        "continuous_annual_sub_price"
-                    )
-                    directed_hashrate = each_prod.get("directed_hashrate")
-                    hashrate = each_prod.get("hashrate")
-                    universal_hashrate = each_prod.get("universal_hashrate")
-
-                    prod_desc_object = defaultdict(dict)
-                    if prod_desc and "|" in prod_desc:
-                        prod_desc = prod_desc.split("|")
-                        prod_desc_object["count"] = prod_desc[0].strip()
-                        prod_desc_object["valid"] = prod_desc[1].strip()
-                    else:
-                        prod_desc_object = {}
-
-                    prod_details_object = defaultdict(dict)
-
-                    if int(prod_cate_id) == 3:
-                        prod_details = prod_details.split("|")
-                        prod_details_object["version_3_5"] = prod_details[0]
-                        prod_details_object["version_4_0"] = prod_details[1]
-                    else:
-                        prod_details_object["value"] = prod_details
-
-                    prod_data["prod_id"] = prod_id
-                    prod_data["prod_name"] = prod_name
-                    prod_data["prod_desc"] = prod_desc_object
-                    prod_data["prod_details"] = prod_details_object
-                    prod_data["prod_origin_price"] = prod_origin_price
-                    prod_data["prod_price"] = prod_price
-                    prod_data["prod_rules"] = prod_rules
-                    prod_data["prod_points"] = str(
-                        math.ceil(
-                            float(prod_origin_price) *
-                            settings.POINTS_UNIT))
-                    prod_data["prod_cate_id"] = prod_cate_id
-                    prod_data["hashrate"] = hashrate
-                    prod_data["directed_hashrate"] = directed_hashrate
-                    prod_data["universal_hashrate"] = universal_hashrate
-                    prod_data["prod_cate_id"] = prod_cate_id
-                    prod_data[
-                        "continuous_annual_sub_price"
-                    ] = continuous_annual_sub_price
-                    ret_data[prod_cate_id].append(prod_data)
+            # 商品目录快照中已按分类渲染好, 不查询数据库
+            ret_data = Catalogue.get().listing(prod_cate_id)
 
             code = RET.OK
             message = Language.get(code)
-            return CstResponse(code=code, message=message, data=ret_data)
+            return CstRawResponse(code=code, message=message, data=ret_data)
         except Exception:
             print(traceback.format_exc())
             code = RET.DB_ERR
@@ -1285,6 +1223,10 @@ class OrdersList(APIView):
                     type=openapi.TYPE_INTEGER, description="订单ID。"
                 ),
                 "status": openapi.Schema(type=openapi.TYPE_STRING, description="订单状态。"),
+                "cursor": openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description="游标分页, 传上一页最后一条订单的 cursor, 传入后忽略 page_index。",
+                ),
             },
         ),
         responses={
@@ -1308,6 +1250,9 @@ class OrdersList(APIView):
                                     "order_id": openapi.Schema(
                                         type=openapi.TYPE_INTEGER, description="订单ID。"
                                     ),
+                                    "cursor": openapi.Schema(
+                                        type=openapi.TYPE_STRING, description="分页游标。"
+                                    ),
                                     "source": openapi.Schema(
                                         type=openapi.TYPE_INTEGER, description="来源。"
                                     ),
@@ -1382,13 +1327,10 @@ class OrdersList(APIView):
         page_count = data.get("page_count")
         order_id = data.get("order_id")
         status = data.get("status")
+        page_cursor = data.get("cursor")
 
         prod_cate_id = data.get("prod_cate_id", [3,6])
 
-        prod_cate_id = [str(each) for each in prod_cate_id]
-
-        prod_cate_id = ','.join(prod_cate_id)
-
         if not prod_cate_id:
             code = RET.PARAM_MISSING
             message = Language.get(code)
@@ -1396,101 +1338,74 @@ class OrdersList(APIView):
             logger.error(trace)
             raise CstException(code=code, message=message)
 
-
-        sql_fetch_orders_raw = (
-            f"SELECT a.order_id, a.source,oi.price, b.prod_name,b.prod_id, b.prod_cate_id, "
-            f"b.prod_cate_id, b.valid_period_days,  a.total_amount, c.payment_method"
-            f", a.created_at, a.status, oi.quantity, d.expire_at "
-            f" FROM {settings.DEFAULT_DB}.po_orders AS a LEFT JOIN {settings.DEFAULT_DB}.po_orders_items "
-            f" AS oi ON a.order_id = oi.order_id LEFT JOIN "
-            f" {settings.DEFAULT_DB}.pp_products AS b ON oi.prod_id = b.prod_id LEFT JOIN "
-            f" {settings.DEFAULT_DB}.pp_payments AS c ON a.order_id = c.order_id LEFT JOIN "
-            f" {settings.DEFAULT_DB}.pm_membership AS d ON a.order_id = d.order_id "
-            f" WHERE a.is_delete = 0 AND a.user_id = {user_id} AND oi.is_delete = 0  ")
-
-        sql_fetch_orders_total_raw = (
-            f"SELECT COUNT(a.order_id)  AS total "
-            f"FROM {settings.DEFAULT_DB}.po_orders AS a LEFT JOIN {settings.DEFAULT_DB}.po_orders_items "
-            f"AS oi ON a.order_id = oi.order_id LEFT JOIN "
-            f"{settings.DEFAULT_DB}.pp_products AS b ON oi.prod_id = b.prod_id LEFT JOIN "
-            f"{settings.DEFAULT_DB}.pp_payments AS c ON a.order_id = c.order_id LEFT JOIN "
-            f"{settings.DEFAULT_DB}.pm_membership d  ON a.order_id = d.order_id "
-            f" WHERE a.is_delete = 0 AND a.user_id = {user_id} "
-            f" AND a.is_delete = 0 AND b.is_delete = 0 AND c.is_delete = 0 AND oi.is_delete = 0 ")
-        if status:
-            if status == "0":
-                sql_fetch_orders_raw = sql_fetch_orders_raw
-            else:
-                sql_fetch_orders_raw += f"AND  a.status = {status} "
-                sql_fetch_orders_total_raw += f"AND  a.status = {status} "
-        else:
-            sql_fetch_orders_raw = sql_fetch_orders_raw
-
-        if order_id:
-            sql_fetch_orders_raw += f" AND a.order_id = {order_id} "
-            sql_fetch_orders_total_raw += f" AND a.order_id = {order_id} "
-
-        if prod_cate_id:
-            sql_fetch_orders_raw += f" AND oi.prod_cate_id in ({prod_cate_id}) "
-            sql_fetch_orders_total_raw += (
-                f" AND oi.prod_cate_id in ({prod_cate_id}) "
-            )
-
-        sql_fetch_orders_raw += "ORDER BY created_at DESC "
-
+        params = {
+            "user_id": user_id,
+            # status 为 "0" 时查询全部状态
+            "status": status if status and status != "0" else None,
+            "order_id": order_id or None,
+            "prod_cate_ids": tuple(prod_cate_id),
+        }
         if page_count is not None:
-            sql_fetch_orders_raw += " LIMIT " + str(page_count)
-
-            if page_index is not None:
-                row_index = int(int(page_index) - 1) * int(page_count)
-                sql_fetch_orders_raw += " OFFSET " + str(row_index)
-
-        logger.info(sql_fetch_orders_raw)
+            params["limit"] = int(page_count)
+        if page_cursor:
+            # 游标分页, 深翻页不随页码变慢; 游标格式为 "created_at|order_id"
+            try:
+                if not isinstance(page_cursor, str):
+                    raise ValueError(f"invalid cursor {page_cursor!r}")
+                after_created_at, after_order_id = page_cursor.rsplit("|", 1)
+                if not after_created_at or not after_order_id:
+                    raise ValueError(f"invalid cursor {page_cursor!r}")
+            except Exception:
+                code = RET.PARAM_ERR
+                message = Language.get(code)
+                logger.error(traceback.format_exc())
+                raise CstException(code=code, message=message)
+            params["after"] = True
+            params["after_created_at"] = after_created_at
+            params["after_order_id"] = after_order_id
+        elif page_count is not None and page_index is not None:
+            params["offset"] = int(int(page_index) - 1) * int(page_count)
 
         list_orders: List[defaultdict] = []
 
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_fetch_orders_total_raw)
-                query_total_data = MysqlOper.get_query_result(cursor)
-                query_total = query_total_data[0].get("total")
-            with connection.cursor() as cursor:
-                cursor.execute(sql_fetch_orders_raw)
-                query_data = MysqlOper.get_query_result(cursor)
-                for each_order in query_data:
-                    order_data = defaultdict()
-                    order_id = each_order.get("order_id")
-                    source = each_order.get("source")
-                    valid_period_days = each_order.get("valid_period_days")
-                    prod_cate_id = each_order.get("prod_cate_id")
-                    total_amount = each_order.get("total_amount")
-                    quantity = each_order.get("quantity")
-                    prod_price = each_order.get("price")
-                    payment_method = each_order.get("payment_method")
-                    created_at = each_order.get("created_at")
-                    status = each_order.get("status")
-                    prod_name = each_order.get("prod_name")
-                    from datetime import datetime, timedelta
-
-                    date_obj = datetime.strptime(
-                        created_at, "%Y-%m-%d %H:%M:%S")
-                    date_obj = date_obj + \
-                               timedelta(days=int(valid_period_days))
-
-                    expire_at = date_obj.strftime("%Y-%m-%d %H:%M:%S")
-
-                    order_data["order_id"] = order_id
-                    order_data["source"] = source
-                    order_data["prod_price"] = prod_price
-                    order_data["total_amount"] = total_amount
-                    order_data["payment_method"] = payment_method
-                    order_data["prod_cate_id"] = prod_cate_id
-                    order_data["created_at"] = created_at
-                    order_data["status"] = status
-                    order_data["prod_name"] = prod_name
-                    order_data["expire_at"] = expire_at
-                    order_data["quantity"] = quantity
-                    list_orders.append(order_data)
+            query_total = OrderCountCache.fetch(params)
+            query_data = PayQueries.FETCH_ORDERS.fetch_all(params)
+            for each_order in query_data:
+                order_data = defaultdict()
+                order_id = each_order.get("order_id")
+                source = each_order.get("source")
+                valid_period_days = each_order.get("valid_period_days")
+                prod_cate_id = each_order.get("prod_cate_id")
+                total_amount = each_order.get("total_amount")
+                quantity = each_order.get("quantity")
+                prod_price = each_order.get("price")
+                payment_method = each_order.get("payment_method")
+                created_at = each_order.get("created_at")
+                status = each_order.get("status")
+                prod_name = each_order.get("prod_name")
+                from datetime import datetime, timedelta
+
+                date_obj = datetime.strptime(
+                    created_at, "%Y-%m-%d %H:%M:%S")
+                date_obj = date_obj + \
+                           timedelta(days=int(valid_period_days))
+
+                expire_at = date_obj.strftime("%Y-%m-%d %H:%M:%S")
+
+                order_data["order_id"] = order_id
+                order_data["cursor"] = f"{created_at}|{order_id}"
+                order_data["source"] = source
+                order_data["prod_price"] = prod_price
+                order_data["total_amount"] = total_amount
+                order_data["payment_method"] = payment_method
+                order_data["prod_cate_id"] = prod_cate_id
+                order_data["created_at"] = created_at
+                order_data["status"] = status
+                order_data["prod_name"] = prod_name
+                order_data["expire_at"] = expire_at
+                order_data["quantity"] = quantity
+                list_orders.append(order_data)
 
             code = RET.OK
             message = Language.get(code)
@@ -1583,47 +1498,36 @@ class OrdersList(APIView):
         data = request.data
         order_ids = data.get("order_ids")
 
-        try:
-            with connection.cursor() as cursor:
-                if isinstance(order_ids, list):
-                    # 批量删除
-                    order_ids_str = "', '".join(order_ids)
-                    # 更新po_orders、po_orders_items、pp_payments表的is_delete字段为1
-                    sql_update = (
-                        f"UPDATE {settings.DEFAULT_DB}.po_orders AS o "
-                        f"JOIN {settings.DEFAULT_DB}.po_orders_items AS oi ON o.order_id = oi.order_id "
-                        f"JOIN {settings.DEFAULT_DB}.pp_payments AS p ON o.order_id = p.order_id "
-                        f"SET o.is_delete = 1, oi.is_delete = 1, p.is_delete = 1 "
-                        f"WHERE o.order_id IN ('{order_ids_str}')")
-
-                elif isinstance(order_ids, str):
-                    # 单个删除
-                    # 更新po_orders、po_orders_items、pp_payments表的is_delete字段为1
-                    sql_update = (
-                        f"UPDATE {settings.DEFAULT_DB}.po_orders AS o "
-                        f"JOIN {settings.DEFAULT_DB}.po_orders_items AS oi ON o.order_id = oi.order_id "
-                        f"JOIN {settings.DEFAULT_DB}.pp_payments AS p ON o.order_id = p.order_id "
-                        f"SET o.is_delete = 1, oi.is_delete = 1, p.is_delete = 1 "
-                        f"WHERE o.order_id = '{order_ids}'")
-
-                cursor.execute(sql_update)
-                rowcount = cursor.rowcount
-                ret_data = {"oder_ids": order_ids}
+        if isinstance(order_ids, str):
+            order_ids_param = (order_ids,)
+        else:
+            order_ids_param = tuple(order_ids or ())
 
-                logger.error(sql_update)
+        try:
+            # 更新po_orders、po_orders_items、pp_payments表的is_delete字段为1
+            if order_ids_param:
+                users = PayQueries.FETCH_ORDERS_USERS.fetch_all(
+                    {"order_ids": order_ids_param})
+                rowcount = PayQueries.DELETE_ORDERS.execute(
+                    {"order_ids": order_ids_param})
+                for each_user in users:
+                    OrderCountCache.invalidate(each_user.get("user_id"))
+            else:
+                rowcount = 0
+            ret_data = {"oder_ids": order_ids}
 
-                if rowcount > 0:
+            if rowcount > 0:
 
-                    code = RET.OK
-                    message = Language.get(code)
-                    return CstResponse(
-                        code=code, message=message, data=[ret_data])
-                else:
-                    code = RET.DB_ERR
-                    message = Language.get(code)
-                    trace = str(traceback.format_exc())
-                    logger.error(trace)
-                    raise CstException(code=code, message=message)
+                code = RET.OK
+                message = Language.get(code)
+                return CstResponse(
+                    code=code, message=message, data=[ret_data])
+            else:
+                code = RET.DB_ERR
+                message = Language.get(code)
+                trace = str(traceback.format_exc())
+                logger.error(trace)
+                raise CstException(code=code, message=message)
 
         except Exception:
             code = RET.DB_ERR
@@ -1719,54 +1623,15 @@ class MembershipManage(APIView):
         data = request.data
         user_id = data.get("user_id")
 
-        # SQL query to retrieve membership information from the database
-        sql_member_info = (
-            f"SELECT FROM_UNIXTIME({settings.DEFAULT_DB}.pm_membership.expire_at) AS expire_date, "
-            f"{settings.DEFAULT_DB}.pm_membership_levels.level_name, "
-            f"{settings.DEFAULT_DB}.pm_membership_levels.level_id "
-            f"FROM {settings.DEFAULT_DB}.pm_membership JOIN {settings.DEFAULT_DB}.pm_membership_levels "
-            f"ON {settings.DEFAULT_DB}.pm_membership.points >= {settings.DEFAULT_DB}.pm_membership_levels.points_threshold "
-            f"WHERE {settings.DEFAULT_DB}.pm_membership.user_id = {user_id} AND {settings.DEFAULT_DB}.pm_membership.is_delete = 0 "
-            f"AND {settings.DEFAULT_DB}.pm_membership.user_id = {user_id} "
-            f"AND {settings.DEFAULT_DB}.pm_membership.status =1 AND {settings.DEFAULT_DB}.pm_membership.is_delete = 0 "
-            f"AND {settings.DEFAULT_DB}.pm_membership_levels.is_delete = 0 "
-            f" ORDER BY {settings.DEFAULT_DB}.pm_membership.expire_at  DESC  LIMIT 1 ")
-
-        logger.info(sql_member_info)
-
-        member_info = {
-            "expire_date": "",
-            "level_name": "",
-            "user_id": "",
-            "level_id": "",
-            "status": False,
-        }
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_member_info)
-                query_data = MysqlOper.get_query_result(cursor)
-                for each_member in query_data:
-                    expire_date = each_member.get("expire_date")
-                    level_name = each_member.get("level_name")
-                    level_id = each_member.get("level_id")
-                    member_info["expire_date"] = expire_date
-                    member_info["level_name"] = level_name
-                    member_info["user_id"] = user_id
-                    member_info["level_id"] = level_id
+        # 暂时没有会员概念了,返回空结构体, 后期改回来的话 这边返回member_info
+        if MEMBERSHIP_ENABLED:
+            member_info = EntitlementCache.member_info(user_id) or {}
+        else:
+            member_info = {}
 
-            code = RET.OK
-            message = Language.get(code)
-            # 暂时没有会员概念了,返回空结构体, 后期改回来的话 这边返回member_info
-            return CstResponse(code=code, message=message, data={})
-        except Exception:
-            code = RET.DB_ERR
-            message = Language.get(code)
-            # Log the error traceback for debugging purposes
-            trace = str(traceback.format_exc())
-            logger.error(trace)
-            # Raise a custom exception with the error message and status code
-            raise CstException(code=code, message=message)
+        code = RET.OK
+        message = Language.get(code)
+        return CstResponse(code=code, message=message, data=member_info)
 
 
 class NewVisitorUser(APIView):
@@ -1991,7 +1856,6 @@ class FormSheetAlipay(APIView):
         param={"db": settings.DEFAULT_DB, "logger": logger}
     )
     def post(self, request):
-        worker_id = 1000
         data = request.data
         user_id = data.get("user_id")
         prod_id = data.get("prod_id")
@@ -2003,7 +1867,7 @@ class FormSheetAlipay(APIView):
         quantity = data.get("quantity")
         method = data.get("method")
         prod_cate_id = data.get("prod_cate_id")
-        order_id = get_distributed_id(worker_id=worker_id)
+        order_id = get_distributed_id()
 
         # 新增判断来源
         source = request.META.get("HTTP_SOURCE", "")
@@ -2023,16 +1887,15 @@ class FormSheetAlipay(APIView):
 
         save_id = transaction.savepoint()
 
-        unpaid_sql_order = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders (order_id, source, user_id,  total_amount, status,prod_cate_id ) "
-            f" VALUES ({order_id}, '{source}', {user_id}, {total_amount}, {order_status}, {prod_cate_id})")
-
-        logger.error(unpaid_sql_order)
-
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_order)
-                unpaid_row_count_order = cursor.rowcount
+            unpaid_row_count_order = PayQueries.INSERT_ORDER.execute({
+                "order_id": order_id,
+                "source": source,
+                "user_id": user_id,
+                "total_amount": total_amount,
+                "status": order_status,
+                "prod_cate_id": prod_cate_id,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -2041,15 +1904,16 @@ class FormSheetAlipay(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_orders_items = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders_items (order_id, prod_id, quantity, price, prod_cate_id, model_name, live_code) "
-            f" VALUES ({order_id}, {prod_id},{quantity}, {price}, {prod_cate_id}, '{model_name}', '{live_code}')")
-
         try:
-            logger.info(unpaid_sql_orders_items)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_orders_items)
-                unpaid_row_orders_items = cursor.rowcount
+            unpaid_row_orders_items = PayQueries.INSERT_ORDER_ITEM.execute({
+                "order_id": order_id,
+                "prod_id": prod_id,
+                "quantity": quantity,
+                "price": price,
+                "prod_cate_id": prod_cate_id,
+                "model_name": model_name,
+                "live_code": live_code,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -2058,15 +1922,13 @@ class FormSheetAlipay(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_payments = (
-            f"INSERT INTO {settings.DEFAULT_DB}.pp_payments (order_id, user_id, amount, status, payment_method, pay_data) "
-            f" VALUES ({order_id}, {user_id},{total_amount}, 0, 1, '')")
-
         try:
-            logger.info(unpaid_sql_payments)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_payments)
-                unpaid_row_sql_payments = cursor.rowcount
+            unpaid_row_sql_payments = PayQueries.INSERT_PAYMENT.execute({
+                "order_id": order_id,
+                "user_id": user_id,
+                "amount": total_amount,
+                "payment_method": 1,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -2078,6 +1940,7 @@ class FormSheetAlipay(APIView):
         if (unpaid_row_count_order +
                 unpaid_row_orders_items +
                 unpaid_row_sql_payments == 3):
+            OrderCountCache.invalidate(user_id)
 
             if int(method) == 1:
                 try:
@@ -2126,35 +1989,33 @@ class FormSheetAlipay(APIView):
             pay_url = "https://openapi.alipay.com/gateway.do?{}".format(
                 query_param)
 
-            pre_pay_sql_payments = f"""
-                        UPDATE {settings.DEFAULT_DB}.pp_payments
-                        SET pay_data = %s
-                        WHERE order_id = %s
-                    """
-
-            params = [pay_url, order_id]
+            params = {
+                "pay_data": pay_url,
+                "order_id": order_id,
+            }
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(pre_pay_sql_payments, params)
-                    pr_pay_row_sql_payments = cursor.rowcount
+                pr_pay_row_sql_payments = PayQueries.UPDATE_PAY_DATA.execute(params)
 
-                    if pr_pay_row_sql_payments > 0:
-                        code = RET.OK
-                        message = Language.get(code)
-                        ret_data = {
-                            "pay_url": pay_url,
-                            "total_amount": total_amount,
-                            "order_id": order_id,
-                        }
-                        transaction.savepoint_commit(save_id)
-                        return CstResponse(
-                            code=code, message=message, data=[ret_data])
-                    else:
-                        code = RET.ALIPAY_PAY_QR_FAIL
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        raise CstException(code=code, message=message)
+                if pr_pay_row_sql_payments > 0:
+                    code = RET.OK
+                    message = Language.get(code)
+                    ret_data = {
+                        "pay_url": pay_url,
+                        "total_amount": total_amount,
+                        "order_id": order_id,
+                    }
+                    # 提交后进入支付状态轮询队列, 回调丢失时由轮询补单
+                    QueryOrderStatusQueue.push_order_to_queue(
+                        {"order_id": order_id, "method": "alipay", "source": source})
+                    transaction.savepoint_commit(save_id)
+                    return CstResponse(
+                        code=code, message=message, data=[ret_data])
+                else:
+                    code = RET.ALIPAY_PAY_QR_FAIL
+                    message = Language.get(code)
+                    trace = str(traceback.format_exc())
+                    logger.error(trace)
+                    raise CstException(code=code, message=message)
 
             except Exception:
                 code = RET.ORDER_CREATE_ERR
@@ -2459,250 +2320,43 @@ class UpdateOrderAlipay(APIView):
     @transaction.atomic()
     def post(self, request):
 
-        body_str = request.body.decode("utf-8")
-        post_data = parse_qs(body_str)
-        post_dict = {}
-        for k, v in post_data.items():
-            post_dict[k] = v[0]
+        notify = AliPayNotify(request.body)
+        order_id = notify.get("out_trade_no")
+        pay_id = notify.get("trade_no")
+
+        # 重复通知在验签前返回
+        dedup = NotifyDedup(CHANNEL_ALIPAY, order_id, pay_id)
+        seen = dedup.begin()
+        if seen == NotifyDedup.DONE:
+            return HttpResponse("success")
+        elif seen == NotifyDedup.PENDING:
+            return HttpResponse("fail")
+
         save_id = transaction.savepoint()
-        sign = post_dict.pop("sign", None)
-        status = AliPay().verify(post_dict, sign)
+        status = AliPay().verify_notify(notify)
 
         if status:
-            order_id = post_dict.get("out_trade_no")
-            pay_id = post_dict.get("trade_no")
-
-            update_payment = f"UPDATE {settings.DEFAULT_DB}.pp_payments SET status = 1, pay_id = {pay_id} WHERE order_id = {order_id}"
-            update_order = f"UPDATE {settings.DEFAULT_DB}.po_orders SET status = 2, processed = 1 WHERE order_id = {order_id}"
 
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(update_payment)
-                    update_payment_rowcount = cursor.rowcount
-
-                with connection.cursor() as cursor:
-                    cursor.execute(update_order)
-                    update_order_rowcount = cursor.rowcount
+                if not dedup.record():
+                    transaction.savepoint_rollback(save_id)
+                    return HttpResponse("success")
+
+                update_payment_rowcount = PayQueries.MARK_PAYMENT_PAID.execute(
+                    {"pay_id": pay_id, "order_id": order_id})
+                update_order_rowcount = PayQueries.MARK_ORDER_PAID_PENDING.execute({"order_id": order_id})
+                if not update_order_rowcount and Fulfilment.already_paid(order_id):
+                    # 已由主动查询完成支付和履约
+                    dedup.commit()
+                    transaction.savepoint_commit(save_id)
+                    return HttpResponse("success")
 
                 if update_payment_rowcount + update_order_rowcount == 2:
-
-                    # 查询用户购买的产品类别
-                    sql_get_prod_cate = (
-                        f"SELECT a.user_id, a.prod_cate_id, b.prod_id, b.quantity,b.price, a.total_amount FROM {settings.DEFAULT_DB}.po_orders a "
-                        f"LEFT JOIN {settings.DEFAULT_DB}.po_orders_items b ON a.order_id = b.order_id "
-                        f" WHERE  a.order_id = {order_id}")
-
-                    logger.info(sql_get_prod_cate)
-
-                    try:
-                        with connection.cursor() as cursor:
-                            cursor.execute(sql_get_prod_cate)
-                            prod_cate_data = MysqlOper.get_query_result(cursor)
-
-                            if prod_cate_data:
-                                user_id = prod_cate_data[0].get("user_id")
-                                prod_id = prod_cate_data[0].get("prod_id")
-                                prod_cate_id = prod_cate_data[0].get(
-                                    "prod_cate_id")
-                                quantity = prod_cate_data[0].get("quantity")
-                                price = prod_cate_data[0].get("price")
-                                total_amount = prod_cate_data[0].get(
-                                    "total_amount")
-                            else:
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                transaction.savepoint_rollback(save_id)
-                                raise CstException(code=code, message=message)
-                    except Exception:
-                        code = RET.DB_ERR
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        transaction.savepoint_rollback(save_id)
-                        raise CstException(code=code, message=message)
-
-                    user_active_data = {"user_id": user_id}
-
-                    user_active_req = requests.post(
-                        url=settings.SERVER_BILL_URL
-                            + ":"
-                            + settings.SERVER_BILL_PORT
-                            + settings.IS_ACTIVE_ADDRESS,
-                        data=user_active_data,
-                    )
-                    if user_active_req.status_code == 200:
-                        user_active_req_data = json.loads(user_active_req.text)
-                        if user_active_req_data.get("code") == 20000:
-                            user_is_active = user_active_req_data.get("data")
-                        else:
-                            user_is_active = False
-                    else:
-                        user_is_active = False
-
-                    if user_is_active:
-                        req_url = (
-                                settings.SERVER_BILL_URL
-                                + ":"
-                                + settings.SERVER_BILL_PORT
-                                + settings.HASHRATE_ADDRESS
-                        )
-                    else:
-                        req_url = (
-                                settings.SERVER_BILL_URL
-                                + ":"
-                                + settings.SERVER_BILL_PORT
-                                + settings.HASHRATE_RENEW
-                        )
-
-                    insert_member_success = False
-                    insert_package_success = False
-                    call_distribution = False
-                    call_submit_voice = False
-                    call_out_video = False
-                    call_clone = False
-                    call_huoshan_sound = False
-                    # 会员类别，写入会员有效期等数据和写入算力值&算力值有效期
-                    if int(prod_cate_id) == 3:
-                        insert_member_config = gadgets.insert_new_member(
-                            order_id=order_id, conn=connection, pay=True
-                        )
-
-                        hashrate_data = {
-                            "user_id": user_id,
-                            "prod_id": prod_id,
-                            "quantity": quantity,
-                            "prod_cate_id": prod_cate_id,
-                        }
-
-                        insert_member_hashrate_req = requests.post(
-                            url=req_url, data=hashrate_data
-                        )
-                        if insert_member_hashrate_req.status_code == 200:
-                            insert_member_hashrate_data = json.loads(
-                                insert_member_hashrate_req.text
-                            )
-                            if insert_member_hashrate_data.get(
-                                    "code") == 20000:
-                                insert_member_hashrate = True
-                            else:
-                                insert_member_hashrate = False
-                        else:
-                            insert_member_hashrate = False
-
-                        if insert_member_config and insert_member_hashrate:
-                            insert_member_success = True
-                            insert_package_success = True
-                        else:
-                            insert_member_success = False
-                            insert_package_success = False
-                    # 流量包写入算力值和算力值有效期
-                    elif int(prod_cate_id) == 6:
-
-                        hashrate_data = {
-                            "user_id": user_id,
-                            "prod_id": prod_id,
-                            "quantity": quantity,
-                            "prod_cate_id": prod_cate_id,
-                        }
-                        insert_package_hashrate_req = requests.post(
-                            url=req_url, data=hashrate_data
-                        )
-                        if insert_package_hashrate_req.status_code == 200:
-                            insert_member_hashrate_data = json.loads(
-                                insert_package_hashrate_req.text
-                            )
-                            if insert_member_hashrate_data.get(
-                                    "code") == 20000:
-                                insert_package_success = True
-                                insert_member_success = True
-                    else:
-                        # 非会员和流量包外的其他逻辑
-                        insert_member_success = True
-                        insert_package_success = True
-
-                    # 分销逻辑
-                    if int(prod_cate_id) == 4:
-                        response_upgrade_level = (
-                            gadgets.extend_upgrade_distribution_level(user_id)
-                        )
-                        response_pay_commission = gadgets.extend_pay_commission(
-                            user_id, order_id, total_amount, "1")
-
-                        if response_upgrade_level and response_pay_commission:
-                            call_distribution = True
-                        else:
-                            call_distribution = False
-                        # insert_member_success = True
-                        # insert_package_success = True
-                        call_out_video = True
-                        call_clone = True
-                        call_submit_voice = True
-                        call_huoshan_sound = True
-
-                    elif int(prod_cate_id) in [7, 8, 9]:
-                        if int(prod_cate_id) in [7, 8]:
-                            call_distribution = True
-                            # insert_member_success = True
-                            # insert_package_success = True
-                            call_out_video = gadgets.update_out_video_status(
-                                order_id)
-                            call_clone = gadgets.update_clone_status(order_id)
-                            call_submit_voice = gadgets.submit_customized_voice(
-                                order_id)
-                            call_huoshan_sound = True
-                        elif int(prod_cate_id) == 9:
-                            call_huoshan_sound_req = gadgets.call_huoshan_sound_clone(order_id)
-                            if call_huoshan_sound_req:
-                                call_huoshan_sound = True
-                                call_submit_voice = True
-                                call_out_video = True
-                                call_clone = True
-                            else:
-                                call_huoshan_sound = False
-                                call_submit_voice = True
-                                call_out_video = True
-                                call_clone = True
-                        else:
-                            response_pay_commission = gadgets.extend_pay_commission(
-                                user_id, order_id, total_amount, "0")
-                            if response_pay_commission:
-                                call_distribution = True
-                            else:
-                                call_distribution = False
-
-                            call_submit_voice = True
-                            call_out_video = True
-                            call_clone = True
-                            call_huoshan_sound = True
-
-                    logger.info("insert_package_success: ", insert_package_success)
-                    logger.info("insert_member_success: ", insert_member_success)
-                    logger.info("call_distribution:", call_distribution)
-                    logger.info("call_submit_voice:", call_submit_voice)
-                    logger.info("call_out_video:", call_out_video)
-                    logger.info("call_clone:", call_clone)
-                    logger.info("call_huoshan_sound:", call_huoshan_sound)
-                    if (
-                            insert_package_success
-                            and insert_member_success
-                            and call_distribution
-                            and call_out_video
-                            and call_clone
-                            and call_submit_voice
-                            and call_huoshan_sound
-                    ):
-                        transaction.savepoint_commit(save_id)
-                        return HttpResponse("success")
-                    else:
-                        code = RET.DB_ERR
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        transaction.savepoint_rollback(save_id)
-
-                        raise CstException(code=code, message=message)
+                    # 会员/算力/分销等履约由 run_fulfilment 异步执行
+                    Fulfilment.enqueue(order_id)
+                    dedup.commit()
+                    transaction.savepoint_commit(save_id)
+                    return HttpResponse("success")
                 else:
 
                     code = RET.ALIPAY_PAY_CALLBACK_FAIL
@@ -2710,6 +2364,7 @@ class UpdateOrderAlipay(APIView):
                     trace = str(traceback.format_exc())
                     logger.error(trace)
                     transaction.savepoint_rollback(save_id)
+                    dedup.abort()
 
                     raise CstException(code=code, message=message)
 
@@ -2719,9 +2374,11 @@ class UpdateOrderAlipay(APIView):
                 trace = str(traceback.format_exc())
                 logger.error(trace)
                 transaction.savepoint_rollback(save_id)
+                dedup.abort()
 
                 raise CstException(code=code, message=message)
         else:
+            dedup.abort()
 
             code = RET.ALIPAY_PAY_CALLBACK_FAIL
             message = Language.get(code)
@@ -2816,49 +2473,34 @@ class QueryOrderStatus(APIView):
             order_id = our_trade_no
             pay_id = query_order.get("trade_no")
 
-            update_payment = f"UPDATE {settings.DEFAULT_DB}.pp_payments SET status = 1, pay_id = {pay_id} WHERE order_id = {order_id}"
-            update_order = f"UPDATE {settings.DEFAULT_DB}.po_orders SET status = 2, processed = 1  WHERE order_id = {order_id}"
-
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(update_payment)
-                    update_payment_rowcount = cursor.rowcount
-
-                with connection.cursor() as cursor:
-                    cursor.execute(update_order)
-                    update_order_rowcount = cursor.rowcount
+                update_payment_rowcount = PayQueries.MARK_PAYMENT_PAID.execute(
+                    {"pay_id": pay_id, "order_id": order_id})
+                update_order_rowcount = PayQueries.MARK_ORDER_PAID.execute({"order_id": order_id})
 
                 if update_payment_rowcount + update_order_rowcount == 2:
 
                     # 查询用户购买的产品类别
-                    sql_get_prod_cate = (
-                        f"SELECT a.user_id, a.prod_cate_id, b.prod_id, b.quantity, a.total_amount, b.price FROM {settings.DEFAULT_DB}.po_orders a "
-                        f"LEFT JOIN {settings.DEFAULT_DB}.po_orders_items b ON a.order_id = b.order_id "
-                        f" WHERE  a.order_id = {order_id}")
-
-                    logger.info(sql_get_prod_cate)
-
                     try:
-                        with connection.cursor() as cursor:
-                            cursor.execute(sql_get_prod_cate)
-                            prod_cate_data = MysqlOper.get_query_result(cursor)
-
-                            if prod_cate_data:
-                                user_id = prod_cate_data[0].get("user_id")
-                                prod_id = prod_cate_data[0].get("prod_id")
-                                prod_cate_id = prod_cate_data[0].get(
-                                    "prod_cate_id")
-                                quantity = prod_cate_data[0].get("quantity")
-                                price = prod_cate_data[0].get("price")
-                                total_amount = prod_cate_data[0].get(
-                                    "total_amount")
-                            else:
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                transaction.savepoint_rollback(save_id)
-                                raise CstException(code=code, message=message)
+                        prod_cate_data = PayQueries.FETCH_ORDER_PROD.fetch_all(
+                            {"order_id": order_id})
+
+                        if prod_cate_data:
+                            user_id = prod_cate_data[0].get("user_id")
+                            prod_id = prod_cate_data[0].get("prod_id")
+                            prod_cate_id = prod_cate_data[0].get(
+                                "prod_cate_id")
+                            quantity = prod_cate_data[0].get("quantity")
+                            price = prod_cate_data[0].get("price")
+                            total_amount = prod_cate_data[0].get(
+                                "total_amount")
+                        else:
+                            code = RET.DB_ERR
+                            message = Language.get(code)
+                            trace = str(traceback.format_exc())
+                            logger.error(trace)
+                            transaction.savepoint_rollback(save_id)
+                            raise CstException(code=code, message=message)
                     except Exception:
                         code = RET.DB_ERR
                         message = Language.get(code)
@@ -2924,6 +2566,8 @@ class QueryOrderStatus(APIView):
                     logger.error(call_distribution)
                     if insert_extend and call_distribution:
                         transaction.savepoint_commit(save_id)
+                        EntitlementCache.invalidate(user_id)
+                        OrderCountCache.invalidate(user_id)
                         return HttpResponse("success")
                     else:
                         code = RET.DB_ERR
@@ -3065,7 +2709,6 @@ class FormSheetWechat(APIView):
         param={"db": settings.DEFAULT_DB, "logger": logger}
     )
     def post(self, request):
-        workder_id = 1001
         data = request.data
         user_id = data.get("user_id")
 
@@ -3074,7 +2717,7 @@ class FormSheetWechat(APIView):
         total_amount = data.get("total_amount")
         price = data.get("price")
         quantity = data.get("quantity")
-        order_id = get_distributed_id(worker_id=workder_id)
+        order_id = get_distributed_id()
         order_status = 1
         trade_type = "NATIVE"
         prod_cate_id = data.get("prod_cate_id")
@@ -3092,15 +2735,15 @@ class FormSheetWechat(APIView):
 
         save_id = transaction.savepoint()
 
-        unpaid_sql_order = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders (order_id, source, user_id, total_amount, status,prod_cate_id ) "
-            f" VALUES ({order_id}, '{source}', {user_id}, {total_amount}, {order_status}, {prod_cate_id})")
         try:
-            logger.info(unpaid_sql_order)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_order)
-                unpaid_row_count_order = cursor.rowcount
-
+            unpaid_row_count_order = PayQueries.INSERT_ORDER.execute({
+                "order_id": order_id,
+                "source": source,
+                "user_id": user_id,
+                "total_amount": total_amount,
+                "status": order_status,
+                "prod_cate_id": prod_cate_id,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3109,15 +2752,16 @@ class FormSheetWechat(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_orders_items = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders_items (order_id, prod_id, quantity, price, prod_cate_id, model_name, live_code) "
-            f" VALUES ({order_id}, {prod_id},{quantity}, {price}, {prod_cate_id}, '{model_name}', '{live_code}')")
-
         try:
-            logger.info(unpaid_sql_orders_items)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_orders_items)
-                unpaid_row_orders_items = cursor.rowcount
+            unpaid_row_orders_items = PayQueries.INSERT_ORDER_ITEM.execute({
+                "order_id": order_id,
+                "prod_id": prod_id,
+                "quantity": quantity,
+                "price": price,
+                "prod_cate_id": prod_cate_id,
+                "model_name": model_name,
+                "live_code": live_code,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3126,15 +2770,13 @@ class FormSheetWechat(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_payments = (
-            f"INSERT INTO {settings.DEFAULT_DB}.pp_payments (order_id, user_id, amount, status, payment_method, pay_data) "
-            f" VALUES ({order_id}, {user_id},{total_amount}, 0, 2, '')")
-
         try:
-            logger.info(unpaid_sql_payments)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_payments)
-                unpaid_row_sql_payments = cursor.rowcount
+            unpaid_row_sql_payments = PayQueries.INSERT_PAYMENT.execute({
+                "order_id": order_id,
+                "user_id": user_id,
+                "amount": total_amount,
+                "payment_method": 2,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3146,6 +2788,7 @@ class FormSheetWechat(APIView):
         if (unpaid_row_count_order +
                 unpaid_row_orders_items +
                 unpaid_row_sql_payments == 3):
+            OrderCountCache.invalidate(user_id)
 
             try:
                 data_dict = wxpay(
@@ -3167,36 +2810,35 @@ class FormSheetWechat(APIView):
                 code_url = data_dict.get("code_url")
                 prepay_id = data_dict.get("prepay_id")
 
-                pre_pay_sql_payments = f"""
-                            UPDATE {settings.DEFAULT_DB}.pp_payments
-                            SET pay_data = %s, pre_pay_id= %s
-                            WHERE order_id = %s
-                        """
-
-                params = [code_url, prepay_id, order_id]
+                params = {
+                    "pay_data": code_url,
+                    "pre_pay_id": prepay_id,
+                    "order_id": order_id,
+                }
                 try:
-                    with connection.cursor() as cursor:
-                        cursor.execute(pre_pay_sql_payments, params)
-                        pr_pay_row_sql_payments = cursor.rowcount
+                    pr_pay_row_sql_payments = PayQueries.UPDATE_PAY_DATA.execute(params)
 
-                        if pr_pay_row_sql_payments > 0:
-                            code = RET.OK
-                            message = Language.get(code)
-                            ret_data = {
-                                "pay_url": code_url,
-                                "total_amount": total_amount,
-                                "order_id": order_id,
-                            }
-                            transaction.savepoint_commit(save_id)
-                            return CstResponse(
-                                code=code, message=message, data=[ret_data]
-                            )
-                        else:
-                            code = RET.ALIPAY_PAY_QR_FAIL
-                            message = Language.get(code)
-                            trace = str(traceback.format_exc())
-                            logger.error(trace)
-                            raise CstException(code=code, message=message)
+                    if pr_pay_row_sql_payments > 0:
+                        code = RET.OK
+                        message = Language.get(code)
+                        ret_data = {
+                            "pay_url": code_url,
+                            "total_amount": total_amount,
+                            "order_id": order_id,
+                        }
+                        # 提交后进入支付状态轮询队列, 回调丢失时由轮询补单
+                        QueryOrderStatusQueue.push_order_to_queue(
+                            {"order_id": order_id, "method": "wechat", "source": source})
+                        transaction.savepoint_commit(save_id)
+                        return CstResponse(
+                            code=code, message=message, data=[ret_data]
+                        )
+                    else:
+                        code = RET.ALIPAY_PAY_QR_FAIL
+                        message = Language.get(code)
+                        trace = str(traceback.format_exc())
+                        logger.error(trace)
+                        raise CstException(code=code, message=message)
                 except Exception:
                     code = RET.WECHAT_PAY_QR_FAIL
                     message = Language.get(code)
@@ -3350,7 +2992,6 @@ class FormSheetWechatMiniProgram(APIView):
     )
     def post(self, request):
 
-        worker_id = 1003
         data = request.data
         user_id = data.get("user_id")
 
@@ -3361,7 +3002,7 @@ class FormSheetWechatMiniProgram(APIView):
         price = data.get("price")
         open_id = data.get("open_id")
         quantity = data.get("quantity")
-        order_id = get_distributed_id(worker_id=worker_id)
+        order_id = get_distributed_id()
         trade_type = "JSAPI"
         order_status = 1
         model_name = data.get("model_name", None)
@@ -3383,15 +3024,15 @@ class FormSheetWechatMiniProgram(APIView):
         # open_id = get_openid('0b3iZk100D24YP1O7L200PhbSi4iZk1C')
         save_id = transaction.savepoint()
 
-        unpaid_sql_order = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders (order_id, source, user_id, total_amount, status,prod_cate_id ) "
-            f" VALUES ({order_id}, '{source}', {user_id}, {total_amount}, {order_status}, {prod_cate_id})")
         try:
-            logger.info(unpaid_sql_order)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_order)
-                unpaid_row_count_order = cursor.rowcount
-
+            unpaid_row_count_order = PayQueries.INSERT_ORDER.execute({
+                "order_id": order_id,
+                "source": source,
+                "user_id": user_id,
+                "total_amount": total_amount,
+                "status": order_status,
+                "prod_cate_id": prod_cate_id,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3400,15 +3041,16 @@ class FormSheetWechatMiniProgram(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_orders_items = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders_items (order_id, prod_id, quantity, price, prod_cate_id, model_name, live_code) "
-            f" VALUES ({order_id}, {prod_id},{quantity}, {price}, {prod_cate_id}, '{model_name}', '{live_code}')")
-
         try:
-            logger.info(unpaid_sql_orders_items)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_orders_items)
-                unpaid_row_orders_items = cursor.rowcount
+            unpaid_row_orders_items = PayQueries.INSERT_ORDER_ITEM.execute({
+                "order_id": order_id,
+                "prod_id": prod_id,
+                "quantity": quantity,
+                "price": price,
+                "prod_cate_id": prod_cate_id,
+                "model_name": model_name,
+                "live_code": live_code,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3417,15 +3059,13 @@ class FormSheetWechatMiniProgram(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_payments = (
-            f"INSERT INTO {settings.DEFAULT_DB}.pp_payments (order_id, user_id, amount, status, payment_method, pay_data) "
-            f" VALUES ({order_id}, {user_id},{total_amount}, 0, 2, '')")
-
         try:
-            logger.info(unpaid_sql_payments)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_payments)
-                unpaid_row_sql_payments = cursor.rowcount
+            unpaid_row_sql_payments = PayQueries.INSERT_PAYMENT.execute({
+                "order_id": order_id,
+                "user_id": user_id,
+                "amount": total_amount,
+                "payment_method": 2,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3437,6 +3077,7 @@ class FormSheetWechatMiniProgram(APIView):
         if (unpaid_row_count_order +
                 unpaid_row_orders_items +
                 unpaid_row_sql_payments == 3):
+            OrderCountCache.invalidate(user_id)
             try:
 
                 print(source)
@@ -3480,40 +3121,35 @@ class FormSheetWechatMiniProgram(APIView):
                 pre_pay_id = data_dict.get("prepay_id")
 
                 processed_ret_pay_data = get_pay_sign(data_dict, source)
-                pre_pay_sql_payments = f"""
-                                            UPDATE {settings.DEFAULT_DB}.pp_payments
-                                            SET pay_data = %s,pre_pay_id=%s
-                                            WHERE order_id = %s
-                                        """
-
-                params = [
-                    json.dumps(processed_ret_pay_data, ensure_ascii=False),
-                    pre_pay_id,
-                    order_id,
-                ]
+                params = {
+                    "pay_data": json.dumps(processed_ret_pay_data, ensure_ascii=False),
+                    "pre_pay_id": pre_pay_id,
+                    "order_id": order_id,
+                }
                 try:
-                    with connection.cursor() as cursor:
-                        cursor.execute(pre_pay_sql_payments, params)
-                        pr_pay_row_sql_payments = cursor.rowcount
+                    pr_pay_row_sql_payments = PayQueries.UPDATE_PAY_DATA.execute(params)
 
-                        if pr_pay_row_sql_payments > 0:
-                            code = RET.OK
-                            message = Language.get(code)
-                            ret_data = {
-                                "req_data": processed_ret_pay_data,
-                                "total_amount": total_amount,
-                                "order_id": order_id,
-                            }
-                            transaction.savepoint_commit(save_id)
-                            return CstResponse(
-                                code=code, message=message, data=[ret_data]
-                            )
-                        else:
-                            code = RET.ALIPAY_PAY_QR_FAIL
-                            message = Language.get(code)
-                            trace = str(traceback.format_exc())
-                            logger.error(trace)
-                            raise CstException(code=code, message=message)
+                    if pr_pay_row_sql_payments > 0:
+                        code = RET.OK
+                        message = Language.get(code)
+                        ret_data = {
+                            "req_data": processed_ret_pay_data,
+                            "total_amount": total_amount,
+                            "order_id": order_id,
+                        }
+                        # 提交后进入支付状态轮询队列, 回调丢失时由轮询补单
+                        QueryOrderStatusQueue.push_order_to_queue(
+                            {"order_id": order_id, "method": "wechat", "source": source})
+                        transaction.savepoint_commit(save_id)
+                        return CstResponse(
+                            code=code, message=message, data=[ret_data]
+                        )
+                    else:
+                        code = RET.ALIPAY_PAY_QR_FAIL
+                        message = Language.get(code)
+                        trace = str(traceback.format_exc())
+                        logger.error(trace)
+                        raise CstException(code=code, message=message)
                 except Exception:
                     code = RET.WECHAT_PAY_QR_FAIL
                     message = Language.get(code)
@@ -3671,7 +3307,6 @@ class FormSheetWechatH5(APIView):
     )
     def post(self, request):
 
-        worker_id = 1003
         data = request.data
         user_id = data.get("user_id")
 
@@ -3681,7 +3316,7 @@ class FormSheetWechatH5(APIView):
         total_amount = data.get("total_amount")
         price = data.get("price")
         quantity = data.get("quantity")
-        order_id = get_distributed_id(worker_id=worker_id)
+        order_id = get_distributed_id()
         trade_type = "MWEB"
         model_name = data.get("model_name", None)
         live_code = data.get("live_code", None)
@@ -3699,15 +3334,15 @@ class FormSheetWechatH5(APIView):
 
         save_id = transaction.savepoint()
 
-        unpaid_sql_order = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders (order_id, source, user_id, total_amount, status,prod_cate_id ) "
-            f" VALUES ({order_id}, '{source}', {user_id}, {total_amount}, {order_status}, {prod_cate_id})")
         try:
-            logger.info(unpaid_sql_order)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_order)
-                unpaid_row_count_order = cursor.rowcount
-
+            unpaid_row_count_order = PayQueries.INSERT_ORDER.execute({
+                "order_id": order_id,
+                "source": source,
+                "user_id": user_id,
+                "total_amount": total_amount,
+                "status": order_status,
+                "prod_cate_id": prod_cate_id,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3716,15 +3351,16 @@ class FormSheetWechatH5(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_orders_items = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders_items (order_id, prod_id, quantity, price, prod_cate_id, model_name, live_code) "
-            f" VALUES ({order_id}, {prod_id},{quantity}, {price}, {prod_cate_id}, '{model_name}', '{live_code}')")
-
         try:
-            logger.info(unpaid_sql_orders_items)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_orders_items)
-                unpaid_row_orders_items = cursor.rowcount
+            unpaid_row_orders_items = PayQueries.INSERT_ORDER_ITEM.execute({
+                "order_id": order_id,
+                "prod_id": prod_id,
+                "quantity": quantity,
+                "price": price,
+                "prod_cate_id": prod_cate_id,
+                "model_name": model_name,
+                "live_code": live_code,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3733,15 +3369,13 @@ class FormSheetWechatH5(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_payments = (
-            f"INSERT INTO {settings.DEFAULT_DB}.pp_payments (order_id, user_id, amount, status, payment_method, pay_data) "
-            f" VALUES ({order_id}, {user_id},{total_amount}, 0, 2, '')")
-
         try:
-            logger.info(unpaid_sql_payments)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_payments)
-                unpaid_row_sql_payments = cursor.rowcount
+            unpaid_row_sql_payments = PayQueries.INSERT_PAYMENT.execute({
+                "order_id": order_id,
+                "user_id": user_id,
+                "amount": total_amount,
+                "payment_method": 2,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -3753,6 +3387,7 @@ class FormSheetWechatH5(APIView):
         if (unpaid_row_count_order +
                 unpaid_row_orders_items +
                 unpaid_row_sql_payments == 3):
+            OrderCountCache.invalidate(user_id)
             try:
 
                 app_id = settings.APP_ID
@@ -3791,40 +3426,35 @@ class FormSheetWechatH5(APIView):
                 pre_pay_id = data_dict.get("prepay_id")
 
                 processed_ret_pay_data = get_pay_sign(data_dict, source)
-                pre_pay_sql_payments = f"""
-                                            UPDATE {settings.DEFAULT_DB}.pp_payments
-                                            SET pay_data = %s,pre_pay_id=%s
-                                            WHERE order_id = %s
-                                        """
-
-                params = [
-                    json.dumps(processed_ret_pay_data, ensure_ascii=False),
-                    pre_pay_id,
-                    order_id,
-                ]
+                params = {
+                    "pay_data": json.dumps(processed_ret_pay_data, ensure_ascii=False),
+                    "pre_pay_id": pre_pay_id,
+                    "order_id": order_id,
+                }
                 try:
-                    with connection.cursor() as cursor:
-                        cursor.execute(pre_pay_sql_payments, params)
-                        pr_pay_row_sql_payments = cursor.rowcount
+                    pr_pay_row_sql_payments = PayQueries.UPDATE_PAY_DATA.execute(params)
 
-                        if pr_pay_row_sql_payments > 0:
-                            code = RET.OK
-                            message = Language.get(code)
-                            ret_data = {
-                                "req_data": processed_ret_pay_data,
-                                "total_amount": total_amount,
-                                "order_id": order_id,
-                            }
-                            transaction.savepoint_commit(save_id)
-                            return CstResponse(
-                                code=code, message=message, data=[ret_data]
-                            )
-                        else:
-                            code = RET.ALIPAY_PAY_QR_FAIL
-                            message = Language.get(code)
-                            trace = str(traceback.format_exc())
-                            logger.error(trace)
-                            raise CstException(code=code, message=message)
+                    if pr_pay_row_sql_payments > 0:
+                        code = RET.OK
+                        message = Language.get(code)
+                        ret_data = {
+                            "req_data": processed_ret_pay_data,
+                            "total_amount": total_amount,
+                            "order_id": order_id,
+                        }
+                        # 提交后进入支付状态轮询队列, 回调丢失时由轮询补单
+                        QueryOrderStatusQueue.push_order_to_queue(
+                            {"order_id": order_id, "method": "wechat", "source": source})
+                        transaction.savepoint_commit(save_id)
+                        return CstResponse(
+                            code=code, message=message, data=[ret_data]
+                        )
+                    else:
+                        code = RET.ALIPAY_PAY_QR_FAIL
+                        message = Language.get(code)
+                        trace = str(traceback.format_exc())
+                        logger.error(trace)
+                        raise CstException(code=code, message=message)
                 except Exception:
                     code = RET.WECHAT_PAY_QR_FAIL
                     message = Language.get(code)
@@ -4135,13 +3765,24 @@ class UpdateOrderWechat(APIView):
 
         data_dict = trans_xml_to_dict(request.body)  # 回调数据转字典
         logger.info("支付回调结果", data_dict)
-        sign = data_dict.pop("sign")  # 取出签名
+
+        # 重复通知在验签前返回
+        dedup = NotifyDedup(
+            CHANNEL_WECHAT, data_dict.get("out_trade_no"), data_dict.get("transaction_id"))
+        seen = dedup.begin()
+        if seen == NotifyDedup.DONE:
+            return HttpResponse(
+                trans_dict_to_xml({"return_code": "SUCCESS", "return_msg": "OK"}))
+        elif seen == NotifyDedup.PENDING:
+            return HttpResponse(
+                trans_dict_to_xml({"return_code": "FAIL", "return_msg": "PROCESSING"}))
 
         print('2222222222')
         try:
-            back_sign = get_sign(data_dict, settings.API_KEY)  # 计算签名
+            verified = wechat_codec.verify(data_dict, settings.API_KEY)  # 校验签名
 
         except Exception:
+            dedup.abort()
             code = RET.ALIPAY_PAY_CALLBACK_FAIL
             message = Language.get(code)
             trace = str(traceback.format_exc())
@@ -4150,312 +3791,47 @@ class UpdateOrderWechat(APIView):
         print(333333)
         save_id = transaction.savepoint()
         # 验证签名是否与回调签名相同
-        if sign == back_sign and data_dict["return_code"] == "SUCCESS":
+        if verified and data_dict.get("return_code") == "SUCCESS":
             # 处理支付成功逻辑，根据订单号修改后台数据库状态
             # 返回接收结果给微信，否则微信会每隔8分钟发送post请求
 
             order_id = data_dict.get("out_trade_no")
             trade_id = data_dict.get("transaction_id")
 
-            update_payment = f"UPDATE {settings.DEFAULT_DB}.pp_payments SET status = 1, pay_id = {trade_id} WHERE order_id = {order_id}"
-            update_order = f"UPDATE {settings.DEFAULT_DB}.po_orders SET status = 2, processed = 1  WHERE order_id = {order_id}"
-
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(update_payment)
-                    update_payment_rowcount = cursor.rowcount
-
-                with connection.cursor() as cursor:
-                    cursor.execute(update_order)
-                    update_order_rowcount = cursor.rowcount
-                if update_order_rowcount + update_payment_rowcount == 2:
-
-                    # 查询用户购买的产品类别
-                    sql_get_prod_cate = (
-                        f"SELECT a.user_id, a.prod_cate_id, b.prod_id,b.price, b.quantity,a.total_amount FROM {settings.DEFAULT_DB}.po_orders a "
-                        f"LEFT JOIN {settings.DEFAULT_DB}.po_orders_items b ON a.order_id = b.order_id "
-                        f" WHERE  a.order_id = {order_id}")
-
-                    logger.info(sql_get_prod_cate)
-
-                    try:
-                        with connection.cursor() as cursor:
-                            cursor.execute(sql_get_prod_cate)
-                            prod_cate_data = MysqlOper.get_query_result(cursor)
-
-                            if prod_cate_data:
-                                user_id = prod_cate_data[0].get("user_id")
-                                prod_id = prod_cate_data[0].get("prod_id")
-                                prod_cate_id = prod_cate_data[0].get(
-                                    "prod_cate_id")
-                                quantity = prod_cate_data[0].get("quantity")
-                                price = prod_cate_data[0].get("price")
-                                total_amount = prod_cate_data[0].get(
-                                    "total_amount")
-                            else:
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                transaction.savepoint_rollback(save_id)
-                                raise CstException(code=code, message=message)
-                    except Exception:
-                        code = RET.DB_ERR
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        transaction.savepoint_rollback(save_id)
-                        raise CstException(code=code, message=message)
-
-                    user_active_data = {"user_id": user_id}
-
-                    req_url_active = (
-                            settings.SERVER_BILL_URL
-                            + ":"
-                            + settings.SERVER_BILL_PORT
-                            + settings.IS_ACTIVE_ADDRESS
-                    )
-                    user_active_req = requests.post(
-                        url=req_url_active, data=user_active_data
-                    )
-
-                    if user_active_req.status_code == 200:
-                        user_active_req_data = json.loads(user_active_req.text)
-                        if user_active_req_data.get("code") == 20000:
-                            user_is_active = user_active_req_data.get("data")
-                        else:
-                            user_is_active = False
-                    else:
-                        user_is_active = False
-
-                    print(user_is_active)
-                    print("user_is_activeuser_is_activeuser_is_activeuser_is_active")
-                    if user_is_active:
-                        req_url = (
-                                settings.SERVER_BILL_URL
-                                + ":"
-                                + settings.SERVER_BILL_PORT
-                                + settings.HASHRATE_RENEW
-                        )
-                    else:
-                        req_url = (
-                                settings.SERVER_BILL_URL
-                                + ":"
-                                + settings.SERVER_BILL_PORT
-                                + settings.HASHRATE_ADDRESS
-                        )
-
-                    insert_member_success = False
-                    insert_package_success = False
-                    call_distribution = False
-                    call_submit_voice = False
-                    call_out_video = False
-                    call_clone = False
-                    call_huoshan_sound = False
-                    # 会员类别，写入会员有效期等数据和写入算力值&算力值有效期
-                    if int(prod_cate_id) == 3:
-                        insert_member_config = gadgets.insert_new_member(
-                            order_id=order_id, conn=connection, pay=True
-                        )
-
-                        hashrate_data = {
-                            "user_id": user_id,
-                            "prod_id": prod_id,
-                            "quantity": quantity,
-                            "prod_cate_id": prod_cate_id,
-                        }
-                        insert_member_hashrate_req = requests.post(
-                            url=req_url, data=hashrate_data
-                        )
-                        if insert_member_hashrate_req.status_code == 200:
-
-                            insert_member_hashrate_data = json.loads(
-                                insert_member_hashrate_req.text
-                            )
-                            if insert_member_hashrate_data.get(
-                                    "code") == 20000:
-                                print(insert_member_hashrate_data)
-                                print(
-                                    "insert_member_hashrate_datainsert_member_hashrate_data"
-                                )
-                                insert_member_hashrate = True
-                            else:
-                                insert_member_hashrate = False
-                        else:
-                            insert_member_hashrate = False
-
-                        if insert_member_config and insert_member_hashrate:
-                            insert_member_success = True
-                            insert_package_success = True
-                        else:
-                            insert_member_success = False
-                            insert_package_success = False
-
-                    # 流量包写入算力值和算力值有效期
-                    elif int(prod_cate_id) == 6:
-
-                        hashrate_data = {
-                            "user_id": user_id,
-                            "prod_id": prod_id,
-                            "quantity": quantity,
-                            "prod_cate_id": prod_cate_id,
-                        }
-                        insert_package_hashrate_req = requests.post(
-                            url=req_url, data=hashrate_data
+                if not dedup.record():
+                    transaction.savepoint_rollback(save_id)
+                    return HttpResponse(
+                        trans_dict_to_xml(
+                            {"return_code": "SUCCESS", "return_msg": "OK"}
                         )
-                        if insert_package_hashrate_req.status_code == 200:
-                            insert_member_hashrate_data = json.loads(
-                                insert_package_hashrate_req.text
-                            )
-                            if insert_member_hashrate_data.get(
-                                    "code") == 20000:
-                                insert_package_success = True
-                                insert_member_success = True
-                    else:
-                        # 非会员和流量包外的其他逻辑
-                        insert_member_success = True
-                        insert_package_success = True
+                    )
 
-                    print(44444444444)
-                    # 分销逻辑
-                    if int(prod_cate_id) == 4:
-                        response_upgrade_level = (
-                            gadgets.extend_upgrade_distribution_level(user_id)
+                update_payment_rowcount = PayQueries.MARK_PAYMENT_PAID.execute(
+                    {"pay_id": trade_id, "order_id": order_id})
+                update_order_rowcount = PayQueries.MARK_ORDER_PAID_PENDING.execute({"order_id": order_id})
+                if not update_order_rowcount and Fulfilment.already_paid(order_id):
+                    # 已由主动查询完成支付和履约
+                    dedup.commit()
+                    transaction.savepoint_commit(save_id)
+                    return HttpResponse(
+                        trans_dict_to_xml(
+                            {"return_code": "SUCCESS", "return_msg": "OK"}
                         )
-                        response_pay_commission = gadgets.extend_pay_commission(
-                            user_id, order_id, total_amount, "1")
-
-                        if response_upgrade_level and response_pay_commission:
-                            call_distribution = True
-                        else:
-                            call_distribution = False
-                        insert_member_success = True
-                        insert_package_success = True
-                        call_out_video = True
-                        call_clone = True
-                        call_submit_voice = True
-
-
-                    elif int(prod_cate_id) in [7, 8, 9]:
-                        print(555555555)
-                        if int(prod_cate_id) in [7, 8]:
-
-                            call_distribution = True
-
-                            # insert_member_success = True
-
-                            # insert_package_success = True
-
-                            call_out_video = gadgets.update_out_video_status(
-
-                                order_id)
-
-                            call_clone = gadgets.update_clone_status(order_id)
-
-                            call_submit_voice = gadgets.submit_customized_voice(
-
-                                order_id)
-
-                            call_huoshan_sound = True
-
-                        elif int(prod_cate_id) == 9:
-                            print(666666)
-                            call_huoshan_sound_req = gadgets.call_huoshan_sound_clone(order_id)
-
-                            if call_huoshan_sound_req:
-
-                                call_huoshan_sound = True
-
-                                call_submit_voice = True
-
-                                call_out_video = True
-
-                                call_clone = True
-
-                                call_distribution = True
-
-                            else:
-
-                                call_huoshan_sound = False
-
-                                call_submit_voice = True
-
-                                call_out_video = True
-
-                                call_clone = True
-
-                                call_distribution = True
-
-
-                        else:
-
-                            response_pay_commission = gadgets.extend_pay_commission(
-
-                                user_id, order_id, total_amount, "0")
-
-                            if response_pay_commission:
-
-                                call_distribution = True
-
-                            else:
-
-                                call_distribution = False
-
-                            call_submit_voice = True
-
-                            call_out_video = True
-
-                            call_clone = True
-
-                            call_huoshan_sound = True
-
-                    print("insert_package_success: ", insert_package_success)
-
-                    print("insert_member_success: ", insert_member_success)
-
-                    print("call_distribution:", call_distribution)
-
-                    print("call_submit_voice:", call_submit_voice)
-
-                    print("call_out_video:", call_out_video)
-
-                    print("call_clone:", call_clone)
-
-                    print("call_huoshan_sound:", call_huoshan_sound)
-
-                    if (
-
-                            insert_package_success
-
-                            and insert_member_success
-
-                            and call_distribution
-
-                            and call_out_video
-
-                            and call_clone
-
-                            and call_submit_voice
-
-                            and call_huoshan_sound
-
-                    ):
-                        transaction.savepoint_commit(save_id)
-                        return HttpResponse(
-                            trans_dict_to_xml(
-                                {"return_code": "SUCCESS", "return_msg": "OK"}
-                            )
+                    )
+                if update_order_rowcount + update_payment_rowcount == 2:
+                    # 会员/算力/分销等履约由 run_fulfilment 异步执行
+                    Fulfilment.enqueue(order_id)
+                    dedup.commit()
+                    transaction.savepoint_commit(save_id)
+                    return HttpResponse(
+                        trans_dict_to_xml(
+                            {"return_code": "SUCCESS", "return_msg": "OK"}
                         )
-                    else:
-                        code = RET.DB_ERR
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        transaction.savepoint_rollback(save_id)
-
-                        raise CstException(code=code, message=message)
+                    )
                 else:
                     transaction.savepoint_rollback(save_id)
+                    dedup.abort()
                     return HttpResponse(
                         trans_dict_to_xml(
                             {"return_code": "FAIL", "return_msg": "SIGNERROR"}
@@ -4465,6 +3841,7 @@ class UpdateOrderWechat(APIView):
                 trace = str(traceback.format_exc())
                 logger.error(trace)
                 transaction.savepoint_rollback(save_id)
+                dedup.abort()
 
                 return HttpResponse(
                     trans_dict_to_xml(
@@ -4476,6 +3853,7 @@ class UpdateOrderWechat(APIView):
             trace = str(traceback.format_exc())
             logger.error(trace)
             transaction.savepoint_rollback(save_id)
+            dedup.abort()
 
             return HttpResponse(trans_dict_to_xml(
                 {"return_code": "FAIL", "return_msg": "SIGNERROR"}))
@@ -4556,48 +3934,33 @@ class QueryStatusWechat(APIView):
             order_id = pay_result.get("out_trade_no")
             trade_id = pay_result.get("transaction_id")
 
-            update_payment = f"UPDATE {settings.DEFAULT_DB}.pp_payments SET status = 1, pay_id = {trade_id} WHERE order_id = {order_id}"
-            update_order = f"UPDATE {settings.DEFAULT_DB}.po_orders SET status = 2, processed = 1  WHERE order_id = {order_id}"
-
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(update_payment)
-                    update_payment_rowcount = cursor.rowcount
-
-                with connection.cursor() as cursor:
-                    cursor.execute(update_order)
-                    update_order_rowcount = cursor.rowcount
+                update_payment_rowcount = PayQueries.MARK_PAYMENT_PAID.execute(
+                    {"pay_id": trade_id, "order_id": order_id})
+                update_order_rowcount = PayQueries.MARK_ORDER_PAID.execute({"order_id": order_id})
                 if update_order_rowcount + update_payment_rowcount == 2:
 
                     # 查询用户购买的产品类别
-                    sql_get_prod_cate = (
-                        f"SELECT a.user_id, a.prod_cate_id, b.prod_id,b.price, b.quantity,a.total_amount FROM {settings.DEFAULT_DB}.po_orders a "
-                        f"LEFT JOIN {settings.DEFAULT_DB}.po_orders_items b ON a.order_id = b.order_id "
-                        f" WHERE  a.order_id = {order_id}")
-
-                    logger.info(sql_get_prod_cate)
-
                     try:
-                        with connection.cursor() as cursor:
-                            cursor.execute(sql_get_prod_cate)
-                            prod_cate_data = MysqlOper.get_query_result(cursor)
-
-                            if prod_cate_data:
-                                user_id = prod_cate_data[0].get("user_id")
-                                prod_id = prod_cate_data[0].get("prod_id")
-                                prod_cate_id = prod_cate_data[0].get(
-                                    "prod_cate_id")
-                                quantity = prod_cate_data[0].get("quantity")
-                                price = prod_cate_data[0].get("price")
-                                total_amount = prod_cate_data[0].get(
-                                    "total_amount")
-                            else:
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                transaction.savepoint_rollback(save_id)
-                                raise CstException(code=code, message=message)
+                        prod_cate_data = PayQueries.FETCH_ORDER_PROD.fetch_all(
+                            {"order_id": order_id})
+
+                        if prod_cate_data:
+                            user_id = prod_cate_data[0].get("user_id")
+                            prod_id = prod_cate_data[0].get("prod_id")
+                            prod_cate_id = prod_cate_data[0].get(
+                                "prod_cate_id")
+                            quantity = prod_cate_data[0].get("quantity")
+                            price = prod_cate_data[0].get("price")
+                            total_amount = prod_cate_data[0].get(
+                                "total_amount")
+                        else:
+                            code = RET.DB_ERR
+                            message = Language.get(code)
+                            trace = str(traceback.format_exc())
+                            logger.error(trace)
+                            transaction.savepoint_rollback(save_id)
+                            raise CstException(code=code, message=message)
                     except Exception:
                         code = RET.DB_ERR
                         message = Language.get(code)
@@ -4661,6 +4024,8 @@ class QueryStatusWechat(APIView):
 
                     if insert_extend and call_distribution:
                         transaction.savepoint_commit(save_id)
+                        EntitlementCache.invalidate(user_id)
+                        OrderCountCache.invalidate(user_id)
                         return HttpResponse(
                             trans_dict_to_xml(
                                 {"return_code": "SUCCESS", "return_msg": "OK"}
@@ -4799,14 +4164,11 @@ class PayResult(APIView):
         order_id = data.get("order_id")
         # Query only the 'status' field for the first time to reduce server
         # load
-        sql_fetch_status = f"SELECT status FROM {settings.DEFAULT_DB}.pp_payments WHERE order_id = {order_id}"
         status = 0
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_fetch_status)
-                data = MysqlOper.get_query_result(cursor)
-                if data:
-                    status = data[0].get("status")
+            data = PayQueries.FETCH_PAYMENT_STATUS.fetch_all({"order_id": order_id})
+            if data:
+                status = data[0].get("status")
         except Exception:
             code = RET.DB_ERR
             message = Language.get(code)
@@ -4816,45 +4178,33 @@ class PayResult(APIView):
 
         if int(status) == 1:
             # Upon confirming a successful payment, retrieve all fields
-            sql_fetch_order_details = f"""
-            SELECT pp_payments.status, pp_payments.payment_method,pp_payments.created_at,
-            pp_payments.amount, pp_payments.pay_id, pp_payments.order_id,
-             pp_payments.created_at, po_orders_items.prod_id, pp_products.prod_name
-            FROM po_orders_items
-            INNER JOIN pp_products ON po_orders_items.prod_id = pp_products.prod_id
-            INNER JOIN pp_payments ON po_orders_items.order_id = pp_payments.order_id
-            WHERE po_orders_items.order_id = '{order_id}';
-            """
-
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(sql_fetch_order_details)
-                    data = MysqlOper.get_query_result(cursor)
-                    if data:
-                        data = data[0]
-                        status = data.get("status")
-                        payment_method = data.get("payment_method")
-                        pay_id = data.get("pay_id")
-                        order_id = data.get("order_id")
-                        prod_id = data.get("prod_id")
-                        prod_name = data.get("prod_name")
-                        amount = data.get("amount")
-                        created_at = data.get("created_at")
+                data = PayQueries.FETCH_PAYMENT_DETAIL.fetch_all({"order_id": order_id})
+                if data:
+                    data = data[0]
+                    status = data.get("status")
+                    payment_method = data.get("payment_method")
+                    pay_id = data.get("pay_id")
+                    order_id = data.get("order_id")
+                    prod_id = data.get("prod_id")
+                    prod_name = data.get("prod_name")
+                    amount = data.get("amount")
+                    created_at = data.get("created_at")
 
-                        code = RET.OK
-                        message = Language.get(code)
-                        ret_data = {
-                            "order_id": order_id,
-                            "payment_method": payment_method,
-                            "pay_id": pay_id,
-                            "prod_id": prod_id,
-                            "prod_name": prod_name,
-                            "status": status,
-                            "amount": amount,
-                            "created_at": created_at,
-                        }
-                        return CstResponse(
-                            code=code, message=message, data=[ret_data])
+                    code = RET.OK
+                    message = Language.get(code)
+                    ret_data = {
+                        "order_id": order_id,
+                        "payment_method": payment_method,
+                        "pay_id": pay_id,
+                        "prod_id": prod_id,
+                        "prod_name": prod_name,
+                        "status": status,
+                        "amount": amount,
+                        "created_at": created_at,
+                    }
+                    return CstResponse(
+                        code=code, message=message, data=[ret_data])
             except Exception:
                 code = RET.DB_ERR
                 message = Language.get(code)
@@ -5472,29 +4822,24 @@ class RePay(APIView):
         save_id = transaction.savepoint()
 
         # 查询订单
-        sql_query_order = (
-            f"SELECT user_id, pay_data, UNIX_TIMESTAMP(created_at) AS created_at FROM {settings.DEFAULT_DB}.pp_payments "
-            f"WHERE order_id = '{order_id}' AND is_delete = 0")
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_query_order)
-                result = MysqlOper.get_query_result(cursor)
-
-                if result:
-                    db_user_id = result[0]["user_id"]
+            result = PayQueries.FETCH_REPAY_ORDER.fetch_all({"order_id": order_id})
 
-                    if db_user_id != user_id:
-                        code = RET.NOT_YOUR_ORDER
-                        message = Language.get(code)
-                        return CstResponse(code=code, message=message, data=[])
+            if result:
+                db_user_id = result[0]["user_id"]
 
-                    pay_data = result[0]["pay_data"]
-                    created_at = result[0]["created_at"]
-                else:
-                    code = RET.DB_ERR
+                if db_user_id != user_id:
+                    code = RET.NOT_YOUR_ORDER
                     message = Language.get(code)
-                    logger.error(f"Order {order_id} not found")
-                    raise CstException(code=code, message=message)
+                    return CstResponse(code=code, message=message, data=[])
+
+                pay_data = result[0]["pay_data"]
+                created_at = result[0]["created_at"]
+            else:
+                code = RET.DB_ERR
+                message = Language.get(code)
+                logger.error(f"Order {order_id} not found")
+                raise CstException(code=code, message=message)
         except Exception as e:
             code = RET.DB_ERR
             message = Language.get(code)
@@ -5502,17 +4847,12 @@ class RePay(APIView):
             raise CstException(code=code, message=message)
 
         if (current_time - int(created_at)) > 900:
-            update_payments_status = f"UPDATE pp_payments SET status = 4 WHERE order_id = '{order_id}' AND is_delete = 0"
-            update_order_status = f"UPDATE po_orders SET status = 4 WHERE order_id = '{order_id}' AND is_delete = 0"
-            logger.error(update_payments_status)
-            logger.error(update_order_status)
             try:
-                with connection.cursor() as cursor:
-                    cursor.execute(update_payments_status)
-                    rowcount_payments = cursor.rowcount
-                with connection.cursor() as cursor:
-                    cursor.execute(update_order_status)
-                    rowcount_order = cursor.rowcount
+                rowcount_payments = PayQueries.EXPIRE_PAYMENT.execute(
+                    {"order_id": order_id})
+                rowcount_order = PayQueries.EXPIRE_ORDER.execute(
+                    {"order_id": order_id})
+                OrderCountCache.invalidate(user_id)
 
                 if rowcount_payments + rowcount_order == 2:
 
@@ -6032,8 +5372,8 @@ class UserCountManageRedis(APIView):
         operation_id="23",
         tags=["用户次数管理【新】"],
         operation_summary="获取用户当前所有剩余次数【新】。",
-        operation_description="redis key 存储格式[hset] name: {user_id: order_id} key: {prod_id: operate_type: flag }"
-                              'value: {json {"expire_date":"", "value": }} ',
+        operation_description="redis key 存储格式[set] name: {user_id: order_id: prod_id: operate_type: flag }"
+                              'value: {剩余次数}, 周期结束时过期 ',
         manual_parameters=[
             openapi.Parameter(
                 "user_id",
@@ -6153,306 +5493,9 @@ class UserCountManageRedis(APIView):
     def get(self, request):
         user_id = request.query_params.get("user_id")
 
-        # total_rest_count = settings.VIP_FRAME_LIMIT
-        total_rest_count = defaultdict(dict)
-
-        sql_check_vip = (
-            f"SELECT 1 FROM {settings.DEFAULT_DB}.pm_membership WHERE user_id = '{user_id}' AND UNIX_TIMESTAMP(NOW()) < expire_at "
-            f"AND status = 1 ORDER BY expire_at DESC LIMIT 1")
-
-        logger.error(sql_check_vip)
-
-        try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_check_vip)
-                rowcount = cursor.rowcount
-
-                if rowcount > 0:
-                    check_current_vip_content = (
-                        f"SELECT oi.prod_id, o.order_id FROM {settings.DEFAULT_DB}.po_orders_items oi INNER JOIN po_orders o ON "
-                        f"oi.order_id = o.order_id WHERE o.user_id = {user_id} AND o.status = 2 AND oi.prod_cate_id = 3 ORDER BY o.created_at DESC")
-
-                    with connection.cursor() as cursor:
-                        logger.error(check_current_vip_content)
-                        cursor.execute(check_current_vip_content)
-                        result = MysqlOper.get_query_result(cursor)
-
-                        if not result:
-                            code = RET.VIP_EXPIRED
-                            message = Language.get(code)
-                            return CstResponse(
-                                code=code,
-                                message=message,
-                                data=settings.VIP_FRAME_LIMIT,
-                            )
-
-                        order_id = result[0].get("order_id")
-                        prod_id = result[0].get("prod_id")
-                        check_name = f"{user_id}:{order_id}"
-
-                        check_redis_inited = None
-                        for key in settings.NEW_ADD_PRODUCTS:
-                            check_key = f"{int(prod_id)}:{key}:day"
-                            check_redis_inited = self.redis.hget(
-                                check_name, check_key)
-
-                        if check_redis_inited is None:
-
-                            # 取出上一个订单id， 获取redis 里用户id:order_id
-                            # 下剩余的次数，初始化的时候加上剩余次数
-                            sql_get_last_order = (
-                                f"SELECT order_id FROM {settings.DEFAULT_DB}.po_orders WHERE status = 2 AND "
-                                f"user_id = {user_id} ORDER BY created_at DESC LIMIT 2 ")
-
-                            try:
-
-                                with connection.cursor() as cursor:
-                                    logger.error(sql_get_last_order)
-                                    cursor.execute(sql_get_last_order)
-                                    result_last_order = MysqlOper.get_query_result(
-                                        cursor)
-                                    # 确认是有上个order_id
-                                    if len(result_last_order) > 1:
-
-                                        last_order_id = result_last_order[1].get(
-                                            "order_id")
-                                    else:
-                                        last_order_id = ""
-                                print(last_order_id)
-                            except Exception:
-                                print(traceback.format_exc())
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                raise CstException(code=code, message=message)
-                            try:
-                                print(prod_id)
-                                print("123456")
-                                for prod_name in settings.VIP_FRAME_LIMIT_USAGE[
-                                    int(prod_id)
-                                ]:
-                                    limit_content = settings.VIP_FRAME_LIMIT_USAGE[
-                                        int(prod_id)
-                                    ][prod_name]
-                                    for limit_flag in limit_content:
-
-                                        vip_limit_usage_name_last_order = (
-                                            f"{user_id}:{last_order_id}"
-                                        )
-                                        vip_limit_usage_name = f"{user_id}:{order_id}"
-                                        vip_limit_usage_hash_key = (
-                                            f"{prod_id}:{prod_name}:{limit_flag}"
-                                        )
-
-                                        if limit_flag == "day":
-                                            # 查询上个order_id 下对应的剩余的没有过期的次数
-                                            if last_order_id:
-                                                last_order_rest_count = self.redis.hget(
-                                                    vip_limit_usage_name_last_order, vip_limit_usage_hash_key, )
-                                                if last_order_rest_count:
-
-                                                    last_order_rest_count_detail = (
-                                                        json.loads(
-                                                            last_order_rest_count
-                                                        )
-                                                    )
-                                                    db_expire_date = last_order_rest_count_detail.get(
-                                                        "expire_date")
-                                                    db_rest_count = last_order_rest_count_detail.get(
-                                                        "value")
-                                                    have_rest_count = (
-                                                        gadgets.is_expired_count(db_expire_date))
-
-                                                    if have_rest_count:
-                                                        db_rest_count = int(
-                                                            db_rest_count
-                                                        )
-                                                    else:
-                                                        db_rest_count = 0
-                                                else:
-                                                    db_rest_count = 0
-
-                                                # 正常的过期时间
-                                                expire_date = (
-                                                    datetime.datetime.now().replace(
-                                                        hour=23, minute=59, second=59, microsecond=0, ))
-
-                                            else:
-                                                expire_date = (
-                                                    datetime.datetime.now().replace(
-                                                        hour=23, minute=59, second=59, microsecond=0, ))
-                                                db_rest_count = 0
-
-                                        elif limit_flag == "week":
-
-                                            if last_order_id:
-                                                last_order_rest_count = self.redis.hget(
-                                                    vip_limit_usage_name_last_order, vip_limit_usage_hash_key, )
-                                                if last_order_rest_count:
-                                                    last_order_rest_count_detail = (
-                                                        json.loads(
-                                                            last_order_rest_count
-                                                        )
-                                                    )
-                                                    db_expire_date = last_order_rest_count_detail.get(
-                                                        "expire_date")
-                                                    db_rest_count = last_order_rest_count_detail.get(
-                                                        "value")
-                                                    have_rest_count = (
-                                                        gadgets.is_expired_count(db_expire_date))
-
-                                                    if have_rest_count:
-                                                        db_rest_count = int(
-                                                            db_rest_count
-                                                        )
-                                                    else:
-                                                        db_rest_count = 0
-                                                else:
-                                                    db_rest_count = 0
-
-                                                # 计算一周后的日期时间
-                                                expire_date = (
-                                                        datetime.datetime.now() +
-                                                        datetime.timedelta(
-                                                            weeks=1))
-
-                                            else:
-                                                expire_date = (
-                                                        datetime.datetime.now() +
-                                                        datetime.timedelta(
-                                                            weeks=1))
-                                                db_rest_count = 0
-
-                                        elif limit_flag == "month":
-                                            if last_order_id:
-                                                last_order_rest_count = self.redis.hget(
-                                                    vip_limit_usage_name_last_order, vip_limit_usage_hash_key, )
-                                                if last_order_rest_count:
-                                                    last_order_rest_count_detail = (
-                                                        json.loads(
-                                                            last_order_rest_count
-                                                        )
-                                                    )
-                                                    db_expire_date = last_order_rest_count_detail.get(
-                                                        "expire_date")
-                                                    db_rest_count = last_order_rest_count_detail.get(
-                                                        "value")
-                                                    have_rest_count = (
-                                                        gadgets.is_expired_count(db_expire_date))
-
-                                                    if have_rest_count:
-                                                        db_rest_count = int(
-                                                            db_rest_count
-                                                        )
-                                                    else:
-                                                        db_rest_count = 0
-                                                else:
-                                                    db_rest_count = 0
-
-                                                # 计算一个月后的日期时间
-                                                expire_date = (
-                                                        datetime.datetime.now() +
-                                                        datetime.timedelta(
-                                                            days=30))
-
-                                            else:
-                                                expire_date = (
-                                                        datetime.datetime.now() +
-                                                        datetime.timedelta(
-                                                            days=30))
-                                                db_rest_count = 0
-                                        vip_limit_usage_hash_value = {
-                                            "expire_date": expire_date,
-                                            "value": limit_content[limit_flag]
-                                                     + db_rest_count,
-                                        }
-
-                                        try:
-                                            self.redis.hset(
-                                                vip_limit_usage_name,
-                                                vip_limit_usage_hash_key,
-                                                json.dumps(
-                                                    vip_limit_usage_hash_value,
-                                                    cls=DateTimeEncoder,
-                                                    ensure_ascii=False,
-                                                ),
-                                            )
-
-                                        except Exception:
-                                            code = RET.DB_ERR
-                                            message = Language.get(code)
-                                            trace = str(traceback.format_exc())
-                                            logger.error(trace)
-                                            raise CstException(
-                                                code=code, message=message
-                                            )
-
-                            except Exception:
-                                print(traceback.format_exc())
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                raise CstException(code=code, message=message)
-
-                        for (
-                                each_operate_target_key,
-                                each_operate_target_value,
-                        ) in settings.VIP_FRAME_LIMIT_USAGE[int(prod_id)].items():
-                            flags = list(each_operate_target_value.keys())
-
-                            print(flags)
-                            print("flagsflagsflagsflags")
-                            try:
-                                for flag in flags:
-                                    check_name = f"{user_id}:{order_id}"
-                                    check_key = f"{int(prod_id)}:{each_operate_target_key}:{flag}"
-                                    rest_value = self.redis.hget(
-                                        check_name, check_key)
-
-                                    print(check_name)
-                                    print(check_key)
-                                    print(rest_value)
-                                    if rest_value:
-                                        rest_value = json.loads(rest_value)
-                                        total_rest_count[each_operate_target_key][
-                                            flag
-                                        ] = rest_value.get("value")
-                                    else:
-                                        total_rest_count[each_operate_target_key][
-                                            flag
-                                        ] = 0
-
-                            except Exception:
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                raise CstException(code=code, message=message)
-                        code = RET.OK
-                        message = Language.get(code)
-
-                        return CstResponse(
-                            data=total_rest_count, code=code, message=message
-                        )
-
-                else:
-                    code = RET.VIP_EXPIRED
-                    message = Language.get(code)
-                    trace = str(traceback.format_exc())
-                    logger.error(trace)
-                    return CstResponse(
-                        code=code,
-                        message=message,
-                        data=settings.VIP_FRAME_LIMIT)
-
-        except Exception:
-            code = RET.DB_ERR
-            message = Language.get(code)
-            trace = str(traceback.format_exc())
-            logger.error(trace)
-            raise CstException(code=code, message=message)
+        code, data = EntitlementCache.vip_rest_count(user_id, self.redis)
+        message = Language.get(code)
+        return CstResponse(code=code, message=message, data=data)
 
     # 暂时废弃
     # def get(self, request):
@@ -6683,8 +5726,8 @@ class UserCountManageRedis(APIView):
         operation_id="22",
         tags=["用户次数管理【新】"],
         operation_summary="用户次数增减。",
-        operation_description="redis key 存储格式[hset] name: {user_id: order_id} key: {prod_id: operate_type: flag }"
-                              'value: {json {"expire_date":"", "value": }} ',
+        operation_description="redis key 存储格式[set] name: {user_id: order_id: prod_id: operate_type: flag }"
+                              'value: {剩余次数}, 周期结束时过期 ',
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=["user_id", "operate_count", "operate_type"],
@@ -6772,53 +5815,44 @@ class UserCountManageRedis(APIView):
         operate_type = data.get("operate_type")
         operate_target = map_operate_type.get(operate_type)
 
-        sql_check_vip = (
-            f"SELECT expire_at  FROM {settings.DEFAULT_DB}.pm_membership WHERE user_id = '{user_id}' "
-            f" AND  status = 1 ORDER BY expire_at DESC LIMIT 1")
-
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_check_vip)
-                result = MysqlOper.get_query_result(cursor)
-
-                if result:
-                    expire_at = result[0].get("expire_at")
-                    if int(time.time()) > int(expire_at):
-                        expire_at_bool = True
-                    else:
-                        expire_at_bool = False
+            result = PayQueries.FETCH_MEMBERSHIP_EXPIRE.fetch_all({"user_id": user_id})
 
+            if result:
+                expire_at = result[0].get("expire_at")
+                if int(time.time()) > int(expire_at):
+                    expire_at_bool = True
                 else:
                     expire_at_bool = False
 
-                if expire_at_bool:
-                    sql_update_status = f"UPDATE {settings.DEFAULT_DB}.pm_membership SET status = 2 WHERE user_id = '{user_id}'"
-                    try:
-                        with connection.cursor() as cursor:
-                            cursor.execute(sql_update_status)
-                            rowcount = cursor.rowcount
-                            # 会员过期
-                            if rowcount > 0:
-                                code = RET.VIP_EXPIRED
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.info(trace)
-                                return CstResponse(code=code, message=message)
+            else:
+                expire_at_bool = False
 
-                            else:
-                                code = RET.DB_ERR
-                                message = Language.get(code)
-                                trace = str(traceback.format_exc())
-                                logger.error(trace)
-                                raise CstException(code=code, message=message)
+            if expire_at_bool:
+                try:
+                    rowcount = PayQueries.EXPIRE_MEMBERSHIP.execute({"user_id": user_id})
+                    # 会员过期
+                    if rowcount > 0:
+                        code = RET.VIP_EXPIRED
+                        message = Language.get(code)
+                        trace = str(traceback.format_exc())
+                        logger.info(trace)
+                        return CstResponse(code=code, message=message)
 
-                    except Exception:
+                    else:
                         code = RET.DB_ERR
                         message = Language.get(code)
                         trace = str(traceback.format_exc())
                         logger.error(trace)
                         raise CstException(code=code, message=message)
 
+                except Exception:
+                    code = RET.DB_ERR
+                    message = Language.get(code)
+                    trace = str(traceback.format_exc())
+                    logger.error(trace)
+                    raise CstException(code=code, message=message)
+
         except Exception:
             code = RET.DB_ERR
             message = Language.get(code)
@@ -6826,198 +5860,42 @@ class UserCountManageRedis(APIView):
             logger.error(trace)
             raise CstException(code=code, message=message)
 
-        check_current_vip_content = (
-            f"SELECT oi.prod_id, o.order_id FROM po_orders_items oi INNER JOIN po_orders o ON "
-            f"oi.order_id = o.order_id WHERE o.user_id = {user_id} AND o.status = 2"
-            f" AND oi.prod_cate_id = 3 ORDER BY o.created_at DESC  ")
-
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(check_current_vip_content)
-                result = MysqlOper.get_query_result(cursor)
-
-                if result:
-                    order_id = result[0].get("order_id")
-                    prod_id = result[0].get("prod_id")
-                    total_rest_count = defaultdict(dict)
-                    current_time = datetime.datetime.now()
-                    for prod_name, limit_content in settings.VIP_FRAME_LIMIT_USAGE[
-                        int(prod_id)
-                    ].items():
-                        if prod_name != operate_target:
-                            continue
-
-                        for limit_flag, limit_value in limit_content.items():
-                            vip_limit_usage_name = f"{user_id}:{order_id}"
-                            vip_limit_usage_hash_key = (
-                                f"{prod_id}:{prod_name}:{limit_flag}"
-                            )
-                            vip_limit_usage_hash_value = self.redis.hget(
-                                vip_limit_usage_name, vip_limit_usage_hash_key
-                            )
-
-                            if vip_limit_usage_hash_value:
-
-                                vip_limit_usage_hash_value = json.loads(
-                                    vip_limit_usage_hash_value
-                                )
-                                vip_limit_usage_hash_value_expired_date = (
-                                    vip_limit_usage_hash_value.get("expire_date")
-                                )
-                                vip_limit_usage_hash_value_expired_date = (
-                                    datetime.datetime.fromisoformat(
-                                        vip_limit_usage_hash_value_expired_date
-                                    )
-                                )
-                                vip_limit_usage_hash_value_data = int(
-                                    vip_limit_usage_hash_value.get("value")
-                                )
-
-                                if limit_flag == "day":
-                                    day_expire_date = datetime.datetime.now().replace(
-                                        hour=23, minute=59, second=59, microsecond=0)
-                                    vip_limit_usage_hash_value_day = {
-                                        "expire_date": day_expire_date.isoformat(),
-                                        "value": limit_content[limit_flag],
-                                    }
-
-                                    if (current_time >
-                                            vip_limit_usage_hash_value_expired_date):
-                                        self.redis.hset(
-                                            vip_limit_usage_name,
-                                            vip_limit_usage_hash_key,
-                                            json.dumps(
-                                                vip_limit_usage_hash_value_day,
-                                                cls=DateTimeEncoder,
-                                                ensure_ascii=False,
-                                            ),
-                                        )
-                                        total_rest_count[operate_target][
-                                            limit_flag
-                                        ] = vip_limit_usage_hash_value_day["value"]
-                                    else:
-                                        vip_limit_usage_hash_value_day[
-                                            "value"
-                                        ] = vip_limit_usage_hash_value_data - int(
-                                            operate_count
-                                        )
-                                        total_rest_count[operate_target][
-                                            limit_flag
-                                        ] = vip_limit_usage_hash_value_day["value"]
-                                        self.redis.hset(
-                                            vip_limit_usage_name,
-                                            vip_limit_usage_hash_key,
-                                            json.dumps(
-                                                vip_limit_usage_hash_value_day,
-                                                cls=DateTimeEncoder,
-                                                ensure_ascii=False,
-                                            ),
-                                        )
-
-                                elif limit_flag == "week":
-                                    week_expire_date = (
-                                            datetime.datetime.now()
-                                            + datetime.timedelta(weeks=1)
-                                    )
-                                    vip_limit_usage_hash_value_week = {
-                                        "expire_date": week_expire_date.isoformat(),
-                                        "value": limit_content[limit_flag],
-                                    }
-
-                                    if (current_time >
-                                            vip_limit_usage_hash_value_expired_date):
-                                        self.redis.hset(
-                                            vip_limit_usage_name,
-                                            vip_limit_usage_hash_key,
-                                            json.dumps(
-                                                vip_limit_usage_hash_value_week,
-                                                cls=DateTimeEncoder,
-                                                ensure_ascii=False,
-                                            ),
-                                        )
-
-                                        total_rest_count[operate_target][
-                                            limit_flag
-                                        ] = vip_limit_usage_hash_value_week["value"]
-
-                                    else:
-                                        vip_limit_usage_hash_value_week[
-                                            "value"
-                                        ] = vip_limit_usage_hash_value_data - int(
-                                            operate_count
-                                        )
-                                        total_rest_count[operate_target][
-                                            limit_flag
-                                        ] = vip_limit_usage_hash_value_week["value"]
-                                        self.redis.hset(
-                                            vip_limit_usage_name,
-                                            vip_limit_usage_hash_key,
-                                            json.dumps(
-                                                vip_limit_usage_hash_value_week,
-                                                cls=DateTimeEncoder,
-                                                ensure_ascii=False,
-                                            ),
-                                        )
-
-                                elif limit_flag == "month":
-                                    month_expire_date = (
-                                            datetime.datetime.now()
-                                            + datetime.timedelta(days=30)
-                                    )
-                                    vip_limit_usage_hash_value_month = {
-                                        "expire_date": month_expire_date.isoformat(),
-                                        "value": limit_content[limit_flag],
-                                    }
-
-                                    if (current_time >
-                                            vip_limit_usage_hash_value_expired_date):
-                                        self.redis.hset(
-                                            vip_limit_usage_name,
-                                            vip_limit_usage_hash_key,
-                                            json.dumps(
-                                                vip_limit_usage_hash_value_month,
-                                                cls=DateTimeEncoder,
-                                                ensure_ascii=False,
-                                            ),
-                                        )
-
-                                        total_rest_count[operate_target][
-                                            limit_flag
-                                        ] = vip_limit_usage_hash_value_month["value"]
-
-                                    else:
-                                        vip_limit_usage_hash_value_month[
-                                            "value"
-                                        ] = vip_limit_usage_hash_value_data - int(
-                                            operate_count
-                                        )
-                                        total_rest_count[operate_target][
-                                            limit_flag
-                                        ] = vip_limit_usage_hash_value_month["value"]
-                                        self.redis.hset(
-                                            vip_limit_usage_name,
-                                            vip_limit_usage_hash_key,
-                                            json.dumps(
-                                                vip_limit_usage_hash_value_month,
-                                                cls=DateTimeEncoder,
-                                                ensure_ascii=False,
-                                            ),
-                                        )
+            result = PayQueries.FETCH_CURRENT_VIP_ORDER.fetch_all({"user_id": user_id})
+
+            if result:
+                order_id = result[0].get("order_id")
+                prod_id = result[0].get("prod_id")
+                total_rest_count = defaultdict(dict)
+                template = QuotaTemplate.get(prod_id)
+
+                # 扣减次数, 周期已过期重置为额度
+                counters = VipQuota.update(
+                    self.redis,
+                    f"{user_id}:{order_id}",
+                    template,
+                    template.entries_of(operate_target),
+                    "consume",
+                    lambda entry: int(operate_count),
+                )
+                for entry, value in counters:
+                    total_rest_count[operate_target][entry.flag] = value
 
-                    code = RET.OK
-                    message = Language.get(code)
-                    return CstResponse(
-                        data=total_rest_count[operate_target],
-                        code=code,
-                        message=message,
-                    )
+                EntitlementCache.invalidate(user_id, self.redis)
+                code = RET.OK
+                message = Language.get(code)
+                return CstResponse(
+                    data=total_rest_count[operate_target],
+                    code=code,
+                    message=message,
+                )
 
-                else:
-                    code = RET.VIP_EXPIRED
-                    message = Language.get(code)
-                    trace = str(traceback.format_exc())
-                    logger.error(trace)
-                    return CstResponse(code=code, message=message)
+            else:
+                code = RET.VIP_EXPIRED
+                message = Language.get(code)
+                trace = str(traceback.format_exc())
+                logger.error(trace)
+                return CstResponse(code=code, message=message)
 
         except Exception:
             code = RET.DB_ERR
@@ -7036,8 +5914,8 @@ class UserCountManageRedisNoVip(APIView):
         operation_id="25",
         tags=["赠送次数-0224需求"],
         operation_summary="获取当前剩余次数",
-        operation_description="redis key 存储格式[hset] name: {user_id } key: {prod_id: operate_type: flag }"
-                              'value: {json {"expire_date":"", "value": }} ',
+        operation_description="redis key 存储格式[set] name: {user_id: order_id: prod_id: operate_type: flag }"
+                              'value: {剩余次数}, 周期结束时过期 ',
         manual_parameters=[
             openapi.Parameter(
                 "user_id",
@@ -7165,116 +6043,17 @@ class UserCountManageRedisNoVip(APIView):
         user_id = request.query_params.get("user_id")
         user_type = request.query_params.get("user_type")
 
-        # 保持redis数据格式统一， 游客 order_id = 1  注册用户 order_id = 2 vip 为真实order_id
-
-        if int(user_type) == 1:
-            order_id = 1
-        else:
-            order_id = 2
-
-        if int(user_type) == 1:
-            prod_id = 9
-        else:
-            prod_id = 10
-
-        check_name = f"{user_id}:{order_id}"
-
-        check_redis_inited = None
-        for key in settings.NEW_ADD_PRODUCTS:
-            check_key = f"{int(prod_id)}:{key}:day"
-            check_redis_inited = self.redis.hget(check_name, check_key)
-
-        if check_redis_inited is None:
-            try:
-                for prod_name in settings.VIP_FRAME_LIMIT_USAGE[int(prod_id)]:
-                    limit_content = settings.VIP_FRAME_LIMIT_USAGE[int(
-                        prod_id)][prod_name]
-                    for limit_flag in limit_content:
-
-                        vip_limit_usage_name = f"{user_id}:{order_id}"
-                        vip_limit_usage_hash_key = f"{prod_id}:{prod_name}:{limit_flag}"
-
-                        if limit_flag == "day":
-                            expire_date = datetime.datetime.now().replace(
-                                hour=23, minute=59, second=59, microsecond=0
-                            )
-                        elif limit_flag == "week":
-                            # 计算一周后的日期时间
-                            expire_date = datetime.datetime.now() + datetime.timedelta(
-                                weeks=1
-                            )
-                        elif limit_flag == "month":
-                            # 计算一个月后的日期时间
-                            expire_date = datetime.datetime.now() + datetime.timedelta(
-                                days=30
-                            )
-
-                        vip_limit_usage_hash_value = {
-                            "expire_date": expire_date,
-                            "value": limit_content[limit_flag],
-                        }
-
-                        try:
-                            self.redis.hset(
-                                vip_limit_usage_name,
-                                vip_limit_usage_hash_key,
-                                json.dumps(
-                                    vip_limit_usage_hash_value,
-                                    cls=DateTimeEncoder,
-                                    ensure_ascii=False,
-                                ),
-                            )
-
-                        except Exception:
-                            code = RET.DB_ERR
-                            message = Language.get(code)
-                            trace = str(traceback.format_exc())
-                            logger.error(trace)
-                            raise CstException(code=code, message=message)
-            except Exception:
-                code = RET.DB_ERR
-                message = Language.get(code)
-                trace = str(traceback.format_exc())
-                logger.error(trace)
-                raise CstException(code=code, message=message)
-
-        total_rest_count = defaultdict(dict)
-        for (
-                each_operate_target_key,
-                each_operate_target_value,
-        ) in settings.VIP_FRAME_LIMIT_USAGE[int(prod_id)].items():
-            flags = list(each_operate_target_value.keys())
-            try:
-                for flag in flags:
-                    check_name = f"{user_id}:{order_id}"
-                    check_key = f"{int(prod_id)}:{each_operate_target_key}:{flag}"
-                    rest_value = self.redis.hget(check_name, check_key)
-                    if rest_value:
-                        rest_value = json.loads(rest_value)
-                        total_rest_count[each_operate_target_key][
-                            flag
-                        ] = rest_value.get("value")
-                    else:
-                        code = RET.USER_ABNORMAL
-                        message = Language.get(code)
-                        return CstResponse(code=code, message=message)
-            except Exception:
-                code = RET.DB_ERR
-                message = Language.get(code)
-                trace = str(traceback.format_exc())
-                logger.error(trace)
-                raise CstException(code=code, message=message)
-        code = RET.OK
+        code, data = EntitlementCache.no_vip_rest_count(
+            user_id, user_type, self.redis)
         message = Language.get(code)
-
-        return CstResponse(data=total_rest_count, code=code, message=message)
+        return CstResponse(code=code, message=message, data=data)
 
     @swagger_auto_schema(
         operation_id="26",
         tags=["赠送次数-0224需求"],
         operation_summary="用户次数增减。",
-        operation_description="redis key 存储格式[hset] name: {user_id: order_id} key: {prod_id: operate_type: flag }"
-                              'value: {json {"expire_date":"", "value": }} ',
+        operation_description="redis key 存储格式[set] name: {user_id: order_id: prod_id: operate_type: flag }"
+                              'value: {剩余次数}, 周期结束时过期 ',
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             required=["user_id", "operate_count", "operate_type"],
@@ -7379,182 +6158,29 @@ class UserCountManageRedisNoVip(APIView):
         operate_target = map_operate_type.get(operate_type)
 
         total_rest_count = defaultdict(dict)
-        current_time = datetime.datetime.now()
+        template = QuotaTemplate.get(prod_id)
 
-        for prod_name, limit_content in settings.VIP_FRAME_LIMIT_USAGE[
-            int(prod_id)
-        ].items():
-            if prod_name != operate_target:
-                continue
-
-            for limit_flag, limit_value in limit_content.items():
-                try:
-                    vip_limit_usage_name = f"{user_id}:{order_id}"
-                    vip_limit_usage_hash_key = f"{prod_id}:{prod_name}:{limit_flag}"
-                    vip_limit_usage_hash_value = self.redis.hget(
-                        vip_limit_usage_name, vip_limit_usage_hash_key
-                    )
-
-                    if vip_limit_usage_hash_value:
-                        vip_limit_usage_hash_value = json.loads(
-                            vip_limit_usage_hash_value
-                        )
-                        vip_limit_usage_hash_value_expired_date = (
-                            vip_limit_usage_hash_value.get("expire_date")
-                        )
-                        vip_limit_usage_hash_value_expired_date = (
-                            datetime.datetime.fromisoformat(
-                                vip_limit_usage_hash_value_expired_date
-                            )
-                        )
-                        vip_limit_usage_hash_value_data = int(
-                            vip_limit_usage_hash_value.get("value")
-                        )
-
-                        if limit_flag == "day":
-                            day_expire_date = datetime.datetime.now().replace(
-                                hour=23, minute=59, second=59, microsecond=0
-                            )
-                            vip_limit_usage_hash_value_day = {
-                                "expire_date": day_expire_date.isoformat(),
-                                "value": limit_content[limit_flag],
-                            }
-
-                            if current_time > vip_limit_usage_hash_value_expired_date:
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_day,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                                total_rest_count[operate_target][
-                                    limit_flag
-                                ] = vip_limit_usage_hash_value_day["value"]
-
-                            else:
-                                vip_limit_usage_hash_value_day[
-                                    "value"
-                                ] = vip_limit_usage_hash_value_data - int(operate_count)
-                                total_rest_count[operate_target][limit_flag] = (
-                                    vip_limit_usage_hash_value_day["value"]
-                                    if vip_limit_usage_hash_value_day["value"] > 0
-                                    else 0
-                                )
-
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_day,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                        elif limit_flag == "week":
-                            week_expire_date = (
-                                    datetime.datetime.now() +
-                                    datetime.timedelta(
-                                        weeks=1))
-                            vip_limit_usage_hash_value_week = {
-                                "expire_date": week_expire_date.isoformat(),
-                                "value": limit_content[limit_flag],
-                            }
-
-                            if current_time > vip_limit_usage_hash_value_expired_date:
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_week,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                                total_rest_count[operate_target][limit_flag] = (
-                                    vip_limit_usage_hash_value_week["value"]
-                                    if vip_limit_usage_hash_value_week["value"] >= 0
-                                    else 0
-                                )
-
-                            else:
-                                vip_limit_usage_hash_value_week[
-                                    "value"
-                                ] = vip_limit_usage_hash_value_data - int(operate_count)
-                                total_rest_count[operate_target][limit_flag] = (
-                                    vip_limit_usage_hash_value_week["value"]
-                                    if vip_limit_usage_hash_value_week["value"] > 0
-                                    else 0
-                                )
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_week,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                        elif limit_flag == "month":
-                            month_expire_date = (
-                                    datetime.datetime.now() +
-                                    datetime.timedelta(
-                                        days=30))
-                            vip_limit_usage_hash_value_month = {
-                                "expire_date": month_expire_date.isoformat(),
-                                "value": limit_content[limit_flag],
-                            }
-
-                            if current_time > vip_limit_usage_hash_value_expired_date:
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_month,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                                total_rest_count[operate_target][limit_flag] = (
-                                    vip_limit_usage_hash_value_month["value"]
-                                    if vip_limit_usage_hash_value_month["value"] >= 0
-                                    else 0
-                                )
-
-                            else:
-                                vip_limit_usage_hash_value_month[
-                                    "value"
-                                ] = vip_limit_usage_hash_value_data - int(operate_count)
-                                total_rest_count[operate_target][limit_flag] = (
-                                    vip_limit_usage_hash_value_month["value"]
-                                    if vip_limit_usage_hash_value_month["value"] > 0
-                                    else 0
-                                )
-
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_month,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
+        # 扣减次数, 周期已过期重置为额度
+        try:
+            counters = VipQuota.update(
+                self.redis,
+                f"{user_id}:{order_id}",
+                template,
+                template.entries_of(operate_target),
+                "consume",
+                lambda entry: int(operate_count),
+            )
+        except Exception:
+            code = RET.DB_ERR
+            message = Language.get(code)
+            trace = str(traceback.format_exc())
+            logger.error(trace)
+            raise CstException(code=code, message=message)
 
-                except Exception:
-                    code = RET.DB_ERR
-                    message = Language.get(code)
-                    trace = str(traceback.format_exc())
-                    logger.error(trace)
-                    raise CstException(code=code, message=message)
+        for entry, value in counters:
+            total_rest_count[operate_target][entry.flag] = value if value > 0 else 0
 
+        EntitlementCache.invalidate(user_id, self.redis)
         code = RET.OK
         message = Language.get(code)
         trace = str(traceback.format_exc())
@@ -7708,254 +6334,33 @@ class UserCountManageRedisNoVip(APIView):
         elif int(action) == 3:
             quota_value = settings.QUOTA_FRAME[3]
         else:
-            quota_value = settings.QUOTA_FRAME[2]
-
-        total_rest_count = defaultdict(dict)
-        current_time = datetime.datetime.now()
-
-        check_name = f"{user_id}:{order_id}"
-
-        check_redis_inited = None
-        for key in settings.NEW_ADD_PRODUCTS:
-            check_key = f"{int(prod_id)}:{key}:day"
-            check_redis_inited = self.redis.hget(check_name, check_key)
-
-        if check_redis_inited is None:
-            try:
-                for prod_name in settings.VIP_FRAME_LIMIT_USAGE[int(prod_id)]:
-                    limit_content = settings.VIP_FRAME_LIMIT_USAGE[int(
-                        prod_id)][prod_name]
-                    for limit_flag in limit_content:
-
-                        vip_limit_usage_name = f"{user_id}:{order_id}"
-                        vip_limit_usage_hash_key = f"{prod_id}:{prod_name}:{limit_flag}"
-
-                        if limit_flag == "day":
-                            expire_date = datetime.datetime.now().replace(
-                                hour=23, minute=59, second=59, microsecond=0
-                            )
-                        elif limit_flag == "week":
-                            # 计算一周后的日期时间
-                            expire_date = datetime.datetime.now() + datetime.timedelta(
-                                weeks=1
-                            )
-                        elif limit_flag == "month":
-                            # 计算一个月后的日期时间
-                            expire_date = datetime.datetime.now() + datetime.timedelta(
-                                days=30
-                            )
-
-                        vip_limit_usage_hash_value = {
-                            "expire_date": expire_date,
-                            "value": limit_content[limit_flag],
-                        }
-
-                        try:
-                            self.redis.hset(
-                                vip_limit_usage_name,
-                                vip_limit_usage_hash_key,
-                                json.dumps(
-                                    vip_limit_usage_hash_value,
-                                    cls=DateTimeEncoder,
-                                    ensure_ascii=False,
-                                ),
-                            )
-
-                        except Exception:
-                            code = RET.DB_ERR
-                            message = Language.get(code)
-                            trace = str(traceback.format_exc())
-                            logger.error(trace)
-                            raise CstException(code=code, message=message)
-            except Exception:
-                code = RET.DB_ERR
-                message = Language.get(code)
-                trace = str(traceback.format_exc())
-                logger.error(trace)
-                raise CstException(code=code, message=message)
-
-        for prod_name, limit_content in settings.VIP_FRAME_LIMIT_USAGE[
-            int(prod_id)
-        ].items():
-            # if prod_name != operate_target:
-            #     continue
-            for limit_flag, limit_value in limit_content.items():
-                try:
-                    vip_limit_usage_name = f"{user_id}:{order_id}"
-                    vip_limit_usage_hash_key = f"{prod_id}:{prod_name}:{limit_flag}"
-                    vip_limit_usage_hash_value = self.redis.hget(
-                        vip_limit_usage_name, vip_limit_usage_hash_key
-                    )
-
-                    if vip_limit_usage_hash_value:
-                        vip_limit_usage_hash_value = json.loads(
-                            vip_limit_usage_hash_value
-                        )
-                        vip_limit_usage_hash_value_expired_date = (
-                            vip_limit_usage_hash_value.get("expire_date")
-                        )
-                        vip_limit_usage_hash_value_expired_date = (
-                            datetime.datetime.fromisoformat(
-                                vip_limit_usage_hash_value_expired_date
-                            )
-                        )
-                        vip_limit_usage_hash_value_data = int(
-                            vip_limit_usage_hash_value.get("value")
-                        )
-
-                        if limit_flag == "day":
-                            day_expire_date = datetime.datetime.now().replace(
-                                hour=23, minute=59, second=59, microsecond=0
-                            )
-                            vip_limit_usage_hash_value_day = {
-                                "expire_date": day_expire_date.isoformat(),
-                                "value": quota_value[prod_name],
-                            }
-
-                            if current_time > vip_limit_usage_hash_value_expired_date:
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_day,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                                total_rest_count[prod_name][
-                                    limit_flag
-                                ] = vip_limit_usage_hash_value_day["value"]
-
-                            else:
-                                vip_limit_usage_hash_value_day["value"] = (
-                                        vip_limit_usage_hash_value_data
-                                        + quota_value[prod_name]
-                                )
-                                total_rest_count[prod_name][limit_flag] = (
-                                    vip_limit_usage_hash_value_day["value"]
-                                    if vip_limit_usage_hash_value_day["value"] > 0
-                                    else 0
-                                )
-
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_day,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                        elif limit_flag == "week":
-                            week_expire_date = (
-                                    datetime.datetime.now() +
-                                    datetime.timedelta(
-                                        weeks=1))
-                            vip_limit_usage_hash_value_week = {
-                                "expire_date": week_expire_date.isoformat(),
-                                "value": quota_value[prod_name],
-                            }
-
-                            if current_time > vip_limit_usage_hash_value_expired_date:
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_week,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                                total_rest_count[prod_name][limit_flag] = (
-                                    vip_limit_usage_hash_value_week["value"]
-                                    if vip_limit_usage_hash_value_week["value"] >= 0
-                                    else 0
-                                )
-
-                            else:
-                                vip_limit_usage_hash_value_week["value"] = (
-                                        vip_limit_usage_hash_value_data
-                                        + quota_value[prod_name]
-                                )
-                                total_rest_count[prod_name][limit_flag] = (
-                                    vip_limit_usage_hash_value_week["value"]
-                                    if vip_limit_usage_hash_value_week["value"] > 0
-                                    else 0
-                                )
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_week,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                        elif limit_flag == "month":
-                            month_expire_date = (
-                                    datetime.datetime.now() +
-                                    datetime.timedelta(
-                                        days=30))
-                            vip_limit_usage_hash_value_month = {
-                                "expire_date": month_expire_date.isoformat(),
-                                "value": quota_value[prod_name],
-                            }
-
-                            if current_time > vip_limit_usage_hash_value_expired_date:
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_month,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-
-                                total_rest_count[prod_name][limit_flag] = (
-                                    vip_limit_usage_hash_value_month["value"]
-                                    if vip_limit_usage_hash_value_month["value"] >= 0
-                                    else 0
-                                )
-
-                            else:
-                                vip_limit_usage_hash_value_month["value"] = (
-                                        vip_limit_usage_hash_value_data
-                                        + quota_value[prod_name]
-                                )
-                                total_rest_count[prod_name][limit_flag] = (
-                                    vip_limit_usage_hash_value_month["value"]
-                                    if vip_limit_usage_hash_value_month["value"] > 0
-                                    else 0
-                                )
-
-                                self.redis.hset(
-                                    vip_limit_usage_name,
-                                    vip_limit_usage_hash_key,
-                                    json.dumps(
-                                        vip_limit_usage_hash_value_month,
-                                        cls=DateTimeEncoder,
-                                        ensure_ascii=False,
-                                    ),
-                                )
-                    else:
-                        code = RET.DB_ERR
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        raise CstException(code=code, message=message)
+            quota_value = settings.QUOTA_FRAME[2]
 
-                except Exception:
-                    code = RET.DB_ERR
-                    message = Language.get(code)
-                    trace = str(traceback.format_exc())
-                    logger.error(trace)
-                    raise CstException(code=code, message=message)
+        total_rest_count = defaultdict(dict)
+        template = QuotaTemplate.get(prod_id)
+
+        # 未初始化时先按默认额度初始化, 周期已过期重置为赠送次数, 否则累加
+        try:
+            counters = VipQuota.update(
+                self.redis,
+                f"{user_id}:{order_id}",
+                template,
+                template.entries,
+                "gift",
+                lambda entry: quota_value[entry.prod_name],
+                init=True,
+            )
+        except Exception:
+            code = RET.DB_ERR
+            message = Language.get(code)
+            trace = str(traceback.format_exc())
+            logger.error(trace)
+            raise CstException(code=code, message=message)
+
+        for entry, value in counters:
+            total_rest_count[entry.prod_name][entry.flag] = value if value > 0 else 0
 
+        EntitlementCache.invalidate(user_id, self.redis)
         code = RET.OK
         message = Language.get(code)
         trace = str(traceback.format_exc())
@@ -8045,11 +6450,10 @@ class ActivateCodeConsume(APIView):
     )
     def post(self, request):
 
-        worker_id = 1004
         data = request.data
         user_id = data.get("user_id")
         activate_code = data.get("activate_code")
-        order_id = get_distributed_id(worker_id)
+        order_id = get_distributed_id()
         order_status = 1
 
         print(22222)
@@ -8078,37 +6482,29 @@ class ActivateCodeConsume(APIView):
         save_id = transaction.savepoint()
 
         # check activate_code details
-        sql_code_status = (
-            f"SELECT activate_code_id, generated_by, to_prod_id, status, expired_date FROM "
-            f"{settings.ADMIN_DB}.oa_activate_code WHERE activate_code = '{activate_code}' AND "
-            f" NOW() < expired_date AND is_delete = 0")
-
         try:
-            logger.info(sql_code_status)
-            with connections[settings.ADMIN_DB].cursor() as cursor:
-                cursor.execute(sql_code_status)
-                result = MysqlOper.get_query_result(cursor)
+            result = PayQueries.FETCH_ACTIVATE_CODE.fetch_all({"activate_code": activate_code})
 
-                if result:
+            if result:
 
-                    result = result[0]
-                    code_status = result.get("status")
-                    if int(code_status) == 1:
-                        code = RET.CODE_CONSUMED
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        transaction.savepoint_rollback(save_id)
-                        return CstResponse(code=code, message=message)
-                    else:
-                        to_prod_id = result.get("to_prod_id")
-                else:
-                    code = RET.CODE_INVALID
+                result = result[0]
+                code_status = result.get("status")
+                if int(code_status) == 1:
+                    code = RET.CODE_CONSUMED
                     message = Language.get(code)
                     trace = str(traceback.format_exc())
                     logger.error(trace)
                     transaction.savepoint_rollback(save_id)
                     return CstResponse(code=code, message=message)
+                else:
+                    to_prod_id = result.get("to_prod_id")
+            else:
+                code = RET.CODE_INVALID
+                message = Language.get(code)
+                trace = str(traceback.format_exc())
+                logger.error(trace)
+                transaction.savepoint_rollback(save_id)
+                return CstResponse(code=code, message=message)
 
         except Exception:
             code = RET.DB_ERR
@@ -8119,27 +6515,20 @@ class ActivateCodeConsume(APIView):
             raise CstException(code=code, message=message)
 
         # 跨表查询code 对应产品价格
-        sql_check_code_price = (
-            f"SELECT prod_price, prod_cate_id FROM {settings.DEFAULT_DB}.pp_products WHERE prod_id={to_prod_id} "
-            f"AND is_delete = 0")
-
         try:
-            logger.info(sql_check_code_price)
-            with connection.cursor() as cursor:
-                cursor.execute(sql_check_code_price)
-                result = MysqlOper.get_query_result(cursor)
+            result = PayQueries.FETCH_PRODUCT_PRICE.fetch_all({"prod_id": to_prod_id})
 
-                if result:
-                    result = result[0]
-                    price = result.get("prod_price")
-                    prod_cate_id = result.get("prod_cate_id")
-                else:
-                    code = RET.CODE_EXPIRED
-                    message = Language.get(code)
-                    trace = str(traceback.format_exc())
-                    logger.error(trace)
-                    transaction.savepoint_rollback(save_id)
-                    return CstResponse(code=code, message=message)
+            if result:
+                result = result[0]
+                price = result.get("prod_price")
+                prod_cate_id = result.get("prod_cate_id")
+            else:
+                code = RET.CODE_EXPIRED
+                message = Language.get(code)
+                trace = str(traceback.format_exc())
+                logger.error(trace)
+                transaction.savepoint_rollback(save_id)
+                return CstResponse(code=code, message=message)
 
         except Exception:
             code = RET.DB_ERR
@@ -8149,15 +6538,14 @@ class ActivateCodeConsume(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_order = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders (order_id, user_id, total_amount, status, prod_cate_id ) "
-            f" VALUES ({order_id}, {user_id}, {price}, {order_status}, {prod_cate_id})")
         try:
-            logger.info(unpaid_sql_order)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_order)
-                unpaid_row_count_order = cursor.rowcount
-
+            unpaid_row_count_order = PayQueries.INSERT_CODE_ORDER.execute({
+                "order_id": order_id,
+                "user_id": user_id,
+                "total_amount": price,
+                "status": order_status,
+                "prod_cate_id": prod_cate_id,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -8166,16 +6554,13 @@ class ActivateCodeConsume(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_orders_items = (
-            f"INSERT INTO {settings.DEFAULT_DB}.po_orders_items (order_id, prod_id, quantity, price, prod_cate_id) "
-            f" VALUES ({order_id}, {to_prod_id},1,  {price}, {prod_cate_id}) ")
-
         try:
-            logger.info(unpaid_sql_orders_items)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_orders_items)
-                unpaid_row_orders_items = cursor.rowcount
-
+            unpaid_row_orders_items = PayQueries.INSERT_CODE_ORDER_ITEM.execute({
+                "order_id": order_id,
+                "prod_id": to_prod_id,
+                "price": price,
+                "prod_cate_id": prod_cate_id,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -8184,16 +6569,13 @@ class ActivateCodeConsume(APIView):
             transaction.savepoint_rollback(save_id)
             raise CstException(code=code, message=message)
 
-        unpaid_sql_payments = (
-            f"INSERT INTO {settings.DEFAULT_DB}.pp_payments (order_id, user_id, amount, status, payment_method, pay_data) "
-            f" VALUES ({order_id}, {user_id},{price}, 0, 3, '')")
-
         try:
-            logger.info(unpaid_sql_payments)
-            with connection.cursor() as cursor:
-                cursor.execute(unpaid_sql_payments)
-                unpaid_row_sql_payments = cursor.rowcount
-
+            unpaid_row_sql_payments = PayQueries.INSERT_PAYMENT.execute({
+                "order_id": order_id,
+                "user_id": user_id,
+                "amount": price,
+                "payment_method": 3,
+            })
         except Exception:
             code = RET.ORDER_CREATE_ERR
             message = Language.get(code)
@@ -8205,30 +6587,17 @@ class ActivateCodeConsume(APIView):
         if (unpaid_row_count_order +
                 unpaid_row_orders_items +
                 unpaid_row_sql_payments == 3):
+            OrderCountCache.invalidate(user_id)
             # 插入阶段预提交
             transaction.savepoint_commit(save_id)
-            pay_id = get_distributed_id(worker_id=worker_id)
-
-            update_payment = f"UPDATE {settings.DEFAULT_DB}.pp_payments SET status = 1, pay_id = {pay_id} WHERE order_id = {order_id}"
-            update_order = f"UPDATE {settings.DEFAULT_DB}.po_orders SET status = 2, processed = 1  WHERE order_id = {order_id}"
-            # 更新消费者id
-            update_code_table = f"UPDATE {settings.ADMIN_DB}.oa_activate_code SET consumed_by = {user_id}, status = 1 WHERE activate_code = '{activate_code}'"
+            pay_id = get_distributed_id()
 
             try:
-                with connection.cursor() as cursor:
-                    logger.error(update_payment)
-                    cursor.execute(update_payment)
-                    update_payment_rowcount = cursor.rowcount
-
-                with connection.cursor() as cursor:
-                    logger.error(update_order)
-                    cursor.execute(update_order)
-                    update_order_rowcount = cursor.rowcount
-
-                with connections[settings.ADMIN_DB].cursor() as cursor:
-                    logger.error(update_code_table)
-                    cursor.execute(update_code_table)
-                    update_code_rowcount = cursor.rowcount
+                update_payment_rowcount = PayQueries.MARK_PAYMENT_PAID.execute(
+                    {"pay_id": pay_id, "order_id": order_id})
+                update_order_rowcount = PayQueries.MARK_ORDER_PAID_PENDING.execute({"order_id": order_id})
+                update_code_rowcount = PayQueries.CONSUME_ACTIVATE_CODE.execute(
+                    {"user_id": user_id, "activate_code": activate_code})
 
                 if (
                         update_payment_rowcount
@@ -8236,135 +6605,16 @@ class ActivateCodeConsume(APIView):
                         + update_code_rowcount
                         == 3
                 ):
-                    user_active_data = {"user_id": user_id}
-
-                    req_url_active = (
-                            settings.SERVER_BILL_URL
-                            + ":"
-                            + settings.SERVER_BILL_PORT
-                            + settings.IS_ACTIVE_ADDRESS
-                    )
-                    user_active_req = requests.post(
-                        url=req_url_active, data=user_active_data
+                    # 会员/算力履约由 run_fulfilment 异步执行
+                    Fulfilment.enqueue(order_id)
+                    code = RET.OK
+                    message = Language.get(code)
+                    return CstResponse(
+                        data={"activate_code": activate_code},
+                        code=code,
+                        message=message,
                     )
 
-                    if user_active_req.status_code == 200:
-                        user_active_req_data = json.loads(user_active_req.text)
-                        if user_active_req_data.get("code") == 20000:
-                            user_is_active = user_active_req_data.get("data")
-                        else:
-                            user_is_active = False
-                    else:
-                        user_is_active = False
-
-                    print(user_is_active)
-                    print("user_is_activeuser_is_activeuser_is_activeuser_is_active")
-                    if user_is_active:
-                        req_url = (
-                                settings.SERVER_BILL_URL
-                                + ":"
-                                + settings.SERVER_BILL_PORT
-                                + settings.HASHRATE_RENEW
-                        )
-                    else:
-                        req_url = (
-                                settings.SERVER_BILL_URL
-                                + ":"
-                                + settings.SERVER_BILL_PORT
-                                + settings.HASHRATE_ADDRESS
-                        )
-
-                    insert_member_success = False
-                    insert_package_success = False
-                    # 会员类别，写入会员有效期等数据和写入算力值&算力值有效期
-                    if int(prod_cate_id) == 3:
-                        insert_member_config = gadgets.insert_new_member(
-                            order_id=order_id, conn=connection, pay=True
-                        )
-
-                        hashrate_data = {
-                            "user_id": user_id,
-                            "prod_id": to_prod_id,
-                            "quantity": 1,
-                            "prod_cate_id": prod_cate_id,
-                        }
-                        print(hashrate_data)
-                        print(req_url)
-                        print("req_urlreq_urlreq_urlreq_urlreq_url")
-                        insert_member_hashrate_req = requests.post(
-                            url=req_url, data=hashrate_data
-                        )
-                        print(insert_member_hashrate_req.status_code)
-                        print(
-                            "insert_member_hashrate_req.status_codeinsert_member_hashrate_req.status_codeinsert_member_hashrate_req.status_code"
-                        )
-                        if insert_member_hashrate_req.status_code == 200:
-
-                            insert_member_hashrate_data = json.loads(
-                                insert_member_hashrate_req.text
-                            )
-                            if insert_member_hashrate_data.get(
-                                    "code") == 20000:
-                                print(insert_member_hashrate_data)
-                                print(
-                                    "insert_member_hashrate_datainsert_member_hashrate_data"
-                                )
-                                insert_member_hashrate = True
-                            else:
-                                insert_member_hashrate = False
-                        else:
-                            insert_member_hashrate = False
-
-                        if insert_member_config and insert_member_hashrate:
-                            insert_member_success = True
-                            insert_package_success = True
-                        else:
-                            insert_member_success = False
-                            insert_package_success = False
-                    # 流量包写入算力值和算力值有效期
-                    elif int(prod_cate_id) == 6:
-
-                        hashrate_data = {
-                            "user_id": user_id,
-                            "prod_id": to_prod_id,
-                            "quantity": 1,
-                            "prod_cate_id": prod_cate_id,
-                        }
-                        insert_package_hashrate_req = requests.post(
-                            url=req_url, data=hashrate_data
-                        )
-                        if insert_package_hashrate_req.status_code == 200:
-                            insert_member_hashrate_data = json.loads(
-                                insert_package_hashrate_req.text
-                            )
-                            if insert_member_hashrate_data.get(
-                                    "code") == 20000:
-                                insert_package_success = True
-                                insert_member_success = True
-                    else:
-                        # 非会员和流量包外的其他逻辑
-                        insert_member_success = True
-                        insert_package_success = True
-
-                    if insert_member_success and insert_package_success:
-                        code = RET.OK
-                        message = Language.get(code)
-                        # 追踪提交
-                        # transaction.savepoint_commit()
-                        return CstResponse(
-                            data={"activate_code": activate_code},
-                            code=code,
-                            message=message,
-                        )
-
-                    else:
-                        code = RET.DB_ERR
-                        message = Language.get(code)
-                        trace = str(traceback.format_exc())
-                        logger.error(trace)
-                        transaction.savepoint_rollback(save_id)
-
-                        raise CstException(code=code, message=message)
                 else:
 
                     code = RET.CODE_INVALID
@@ -9700,66 +7950,25 @@ class TokenConsume(APIView):
     )
     def post(self, request):
 
-        r_prod_id_maps = get_redis_connection("config")
         r_usage = get_redis_connection("usage")
         user_id = request.data.get("user_id")
         prod_name = request.data.get("prod_name")
         consumed_token = request.data.get("consumed_token")
         consumed_token = int(consumed_token)
-        prod_id_maps = json.loads(r_prod_id_maps.get("config:products:idMaps"))
+        prod_id_maps, _ = ProductMaps.get()
         prod_id = prod_id_maps.get(prod_name)
 
-        # 获取该用户购买的所有该类型的流量包的键值
-        package_keys = r_usage.zrange(f"packages:{user_id}:{prod_id}", 0, -1)
-
-        for earliest_package_key in package_keys:
-            earliest_package_info = r_usage.hgetall(earliest_package_key)
-
-            if earliest_package_info:
-                count = int(earliest_package_info["count"])
-                expire_at = float(earliest_package_info["expire_at"])
-
-                # 检查是否已过期
-
-                if (expire_at < datetime.datetime.now().timestamp()) or count <= 0:
-                    # 已过期，从 Sorted Set 中删除
-                    r_usage.zrem(
-                        f"packages:{user_id}:{prod_id}",
-                        earliest_package_key)
-                    r_usage.decr(
-                        f"total_count:{user_id}:{prod_id}", count
-                    )  # 更新用户的总剩余次数
-                    # 释放空间, 已经过期的没必要再留着了, mysql 中有订单记录可以用作回溯
-                    # r_usage.delete(earliest_package_key)
-
-                else:
-                    # 如果未过期则跳出循环，开始使用流量包
-                    break
-        else:
-            # 如果所有流量包都已过期，返回错误信息
-            code = RET.USED_UP
-            message = Language.get(code)
-            return CstResponse(code=code, message=message)
-        # 使用一次
-
-        if count > 0:
-            count -= int(consumed_token)
-            count = max(count, 0)
-            r_usage.hset(earliest_package_key, "count", count)
-            total_count = int(
-                r_usage.get(f"total_count:{user_id}:{prod_id}") or 0)
-            if total_count > 0:
-                total_count -= int(consumed_token)
-                total_count = max(total_count, 0)
-                r_usage.set(f"total_count:{user_id}:{prod_id}", total_count)
+        # 选包、清理过期包、扣减以及更新总次数在 Redis 端原子完成
+        consumed, _, _ = QuotaDeduction.consume_package(
+            r_usage, user_id, prod_id, consumed_token
+        )
+        if consumed:
+            EntitlementCache.invalidate(user_id, r_usage)
             code = RET.OK
-            message = Language.get(code)
-            return CstResponse(code=code, message=message)
-
         else:
             code = RET.USED_UP
-            message = Language.get(code)
-            return CstResponse(code=code, message=message)
+        message = Language.get(code)
+        return CstResponse(code=code, message=message)
 
     @swagger_auto_schema(
         operation_id="56",
@@ -9827,43 +8036,8 @@ class TokenConsume(APIView):
     def get(self, request):
         user_id = request.query_params.get("user_id")
 
-        r_prod_id_maps = get_redis_connection("config")
-        r_usage = get_redis_connection("usage")
-        prod_id_maps = json.loads(r_prod_id_maps.get("config:products:idMaps"))
-        ret_data = defaultdict(dict)
-
-        for prod_name, prod_id in prod_id_maps.items():
-            # 获取该用户购买的所有该类型的流量包的键值
-            package_keys = r_usage.zrange(
-                f"packages:{user_id}:{prod_id}", 0, -1)
-
-            for earliest_package_key in package_keys:
-                earliest_package_info = r_usage.hgetall(earliest_package_key)
-
-                if earliest_package_info:
-                    count = int(earliest_package_info["count"])
-                    expire_at = float(earliest_package_info["expire_at"])
-
-                    # 检查是否已过期
-                    if expire_at < datetime.datetime.now().timestamp():
-                        # 已过期，从 Sorted Set 中删除
-                        r_usage.zrem(
-                            f"packages:{user_id}:{prod_id}",
-                            earliest_package_key)
-                        r_usage.decr(
-                            f"total_count:{user_id}:{prod_id}", count
-                        )  # 更新用户的总剩余次数
-                        # 释放空间, 已经过期的没必要再留着了, mysql 中有订单记录可以用作回溯
-                        # r_usage.delete(earliest_package_key)
-                    else:
-                        # 如果未过期则跳出循环，开始使用流量包
-                        break
-
-            rest_count = r_usage.get(f"total_count:{user_id}:{prod_id}") or 0
-            total_count = r_usage.get(
-                f"total_count_origin:{user_id}:{prod_id}") or 0
-            ret_data[prod_name]["rest"] = rest_count
-            ret_data[prod_name]["total"] = total_count
+        # 一次 pipeline 读出用户所有产品余额, 产品映射走进程内缓存, 结果短时缓存
+        ret_data = EntitlementCache.package_data(user_id)
 
         code = RET.OK
         message = Language.get(code)
@@ -9938,155 +8112,23 @@ class TokenConsumeUniversal(APIView):
     )
     def post(self, request):
 
-        r_prod_id_maps = get_redis_connection("config")
         r_usage = get_redis_connection("usage")
         user_id = request.data.get("user_id")
-        prod_name = request.data.get("prod_name")
         consumed_token = request.data.get("consumed_token")
         consumed_token = int(consumed_token)
-        getcontext().prec = 10
 
         # 所有可能的产品ID
         possible_prod_ids = [18, 19, 20, 21, 22, 23, 24, 25, 26]
 
-        # 初始化最早的产品ID和时间戳
-        earliest_prod_id = None
-        earliest_timestamp = float("inf")
-
-        for prod_id in possible_prod_ids:
-            package_keys = r_usage.zrange(
-                f"universal_packages:{user_id}:{prod_id}", 0, -1
-            )
-
-            print(package_keys)
-            print("package_keyspackage_keyspackage_keyspackage_keyspackage_keys")
-            if package_keys:
-                for each_key in package_keys:
-                    package_info = r_usage.hgetall(each_key)
-                    if package_info:
-                        timestamp = float(
-                            package_info.get("expire_at", 0)
-                        )  # 使用购买时间作为排序依据
-
-                        # 计算消耗的价格
-                        # product_config = json.loads(r_prod_id_maps.get(f'config:{prod_id}'))
-                        # price_per_token = Decimal(product_config[prod_name]['price']) / Decimal(
-                        #     product_config[prod_name]['tokens'])
-                        # consumed_price = Decimal(consumed_token) * price_per_token
-                        # consumed_price = consumed_price.quantize(Decimal('0.00000000'))
-                        rest_total_price = Decimal(package_info["total_price"])
-
-                        # 如果剩余总价足够支付消耗的价格，才将其视为有效的候选产品
-                        if rest_total_price >= consumed_token:
-                            if timestamp < earliest_timestamp:
-                                print(package_info)
-                                print("earliest package data")
-                                earliest_timestamp = timestamp
-                                earliest_prod_id = prod_id
-                        else:
-                            # 边界情况，如果剩余余额总数小于10积分且rest_total_price -
-                            # consumed_token <=0, 允许用户使用最后一次
-                            if int(rest_total_price) <= 10:
-                                if timestamp < earliest_timestamp:
-                                    print(package_info)
-                                    print("earliest package data")
-                                    earliest_timestamp = timestamp
-                                    earliest_prod_id = prod_id
-
-        print(earliest_prod_id)
-        print("earliest_prod_idearliest_prod_idearliest_prod_idearliest_prod_id")
-        # 如果没有找到任何产品
-        if earliest_prod_id is None:
-            code = RET.USED_UP
-            message = Language.get(code)
-            return CstResponse(code=code, message=message)
-
-        prod_id = earliest_prod_id
-
-        # TODO prod_id 为 购买的所有 18,19,20,21 中时间靠前的 产品, 例如 我购买了 18 产品三份, 19 一份, 20 一份 21 一份,
-        #  时间依次增大, 我在使用了 18 中的一份余额接近耗尽的时候又购买了一份 18 的产品, 那么 还是将其优先级排在 21 之后,
-        #  因为他的购买时间晚于 21 的购买时间
-        product_config = json.loads(r_prod_id_maps.get(f"config:{prod_id}"))
-
-        # 获取该用户购买的所有该类型的流量包的键值
-        package_keys = r_usage.zrange(
-            f"universal_packages:{user_id}:{prod_id}", 0, -1)
-
-        print(package_keys)
-        print("lkljkkjkjkjkkj")
-        for earliest_package_key in package_keys:
-            print(earliest_package_key)
-            print("12345678")
-            earliest_package_info = r_usage.hgetall(earliest_package_key)
-
-            if earliest_package_info:
-                expire_at = float(earliest_package_info["expire_at"])
-                rest_total_price = float(earliest_package_info["total_price"])
-
-                print(earliest_package_info)
-                print("earliest_package_infoearliest_package_infoearliest_package_info")
-                print(rest_total_price)
-                # 检查是否已过期
-                if (
-                        expire_at < datetime.datetime.now().timestamp()
-                        or rest_total_price <= 1
-                ):
-                    print(f"current product {prod_id} used up")
-                    # 已过期，从 Sorted Set 中删除
-                    r_usage.zrem(
-                        f"universal_packages:{user_id}:{prod_id}",
-                        earliest_package_key)
-                    r_usage.incrbyfloat(
-                        f"total_price:{user_id}:{prod_id}", -rest_total_price
-                    )  # 更新用户的总剩余次数
-
-                    # 释放空间, 已经过期的没必要再留着了, mysql 中有订单记录可以用作回溯
-                    # r_usage.delete(earliest_package_key)
-                    continue
-
-                # 如果该产品是通用流量包，则令牌数等于总价格除以每个令牌的价格
-                if int(prod_id) in [18, 19, 20, 21, 22, 23, 24, 25, 26]:
-
-                    prod_total_price = Decimal(
-                        earliest_package_info["total_price"])
-                    total_price = r_usage.get(
-                        f"total_price:{user_id}:{prod_id}")
-                    if prod_total_price >= consumed_token:
-                        # 扣除费用
-                        prod_total_price = prod_total_price - consumed_token
-                        total_price = Decimal(total_price) - consumed_token
-                        r_usage.hset(
-                            earliest_package_key,
-                            "total_price",
-                            str(prod_total_price))
-                        r_usage.set(
-                            f"total_price:{user_id}:{prod_id}",
-                            str(total_price))
-                    else:
-                        # print(111111111)
-                        # total_price = Decimal(total_price) - consumed_price
-                        # # 如果达到临界值， 则强制归位0.00
-                        # if total_price < 0.009:
-                        #     print(f'{user_id}, {prod_id} reached border value')
-                        #     r_usage.hset(earliest_package_key, 'total_price', str(0.00))
-                        #     total_price = 0.00
-                        # r_usage.set(f"total_price:{user_id}:{prod_id}", str(total_price))
-                        continue
-                else:
-                    count = int(earliest_package_info["count"])
-                    if count <= 0:
-                        # 令牌数不足，跳过当前流量包
-                        continue
-
-                # 如果未过期则跳出循环，开始使用流量包
-                break
+        # 跨产品选出最早过期且余额足够的包, 清理过期包并扣减, 全部在 Redis 端原子完成
+        consumed, _, _, _ = QuotaDeduction.consume_universal(
+            r_usage, user_id, possible_prod_ids, consumed_token
+        )
+        if consumed:
+            EntitlementCache.invalidate(user_id, r_usage)
+            code = RET.OK
         else:
-            # 如果所有流量包都已过期，返回错误信息
             code = RET.USED_UP
-            message = Language.get(code)
-            return CstResponse(code=code, message=message)
-
-        code = RET.OK
         message = Language.get(code)
         return CstResponse(code=code, message=message)
 
@@ -10156,70 +8198,9 @@ class TokenConsumeUniversal(APIView):
     def get(self, request):
         user_id = request.query_params.get("user_id")
 
-        r_usage = get_redis_connection("usage")
-        r_config = get_redis_connection("config")
-        ret_data = defaultdict(dict)
-        universal_product_dict = r_config.get("config:products:universal")
-
-        if isinstance(universal_product_dict, str):
-            universal_product_dict = json.loads(universal_product_dict)
-
-        all_prod_rest = 0
-        for prod_name, prod_id in universal_product_dict.items():
-            try:
-                # 注意这里我们改用zrangebyscore函数，根据score（即order）进行排序
-                package_keys = r_usage.zrangebyscore(
-                    f"universal_packages:{user_id}:{prod_id}", "-inf", "+inf"
-                )
-                print(package_keys)
-                earliest_expire_at = None
-                for package_key in package_keys:
-                    package_info = r_usage.hgetall(package_key)
-
-                    if package_info:
-                        rest_total_price = float(package_info["total_price"])
-                        expire_at = float(package_info["expire_at"])
-
-                        # 更新最早的过期时间
-                        if earliest_expire_at is None or expire_at < earliest_expire_at:
-                            earliest_expire_at = expire_at
-
-                        # 检查是否已过期
-                        if expire_at < datetime.datetime.now().timestamp():
-                            # 已过期，从 Sorted Set 中删除
-                            r_usage.zrem(
-                                f"universal_packages:{user_id}:{prod_id}", package_key)
-                            r_usage.decr(
-                                f"total_price:{user_id}:{prod_id}",
-                                rest_total_price)  # 更新用户的总剩余次数
-
-                            # 释放空间, 已经过期的没必要再留着了, mysql 中有订单记录可以用作回溯
-                            # r_usage.delete(package_key)
-                            continue
-            except Exception:
-                print(traceback.format_exc())
-            try:
-                total_count = (
-                        r_usage.get(f"total_price_origin:{user_id}:{prod_id}") or 0
-                )
-                try:
-                    if Decimal(total_count) <= 0:
-                        total_count = 0
-                except Exception:
-                    total_count = 0
-                rest_count = r_usage.get(f"total_price:{user_id}:{prod_id}")
-                try:
-                    if Decimal(rest_count) <= 0:
-                        rest_count = 0
-                except Exception:
-                    rest_count = 0
-                # rest_count = r_usage.get(f"total_price:{user_id}:{prod_id}") or 0
-                ret_data[prod_name]["rest"] = rest_count
-                # ret_data[prod_name]['status'] = True if int(rest_count) > 0 else False
-                ret_data[prod_name]["total"] = total_count
-                all_prod_rest += float(rest_count)
-            except Exception:
-                print(traceback.format_exc())
+        snapshot = load_snapshot(user_id)
+        ret_data = snapshot.universal_data()
+        all_prod_rest = snapshot.universal_total
 
         code = RET.OK
         message = Language.get(code)
@@ -10373,277 +8354,20 @@ class TrafficControlRouter(APIView):
         user_id = request.query_params.get("user_id")
         user_type = request.query_params.get("user_type")
 
-        request_data = {"user_id": user_id}
+        # 直接在进程内计算会员、流量包及次数, 不再回环调用本服务的各个接口, 结果短时缓存
         try:
-            member_info = requests.post(
-                settings.SERVER_ADDRESS +
-                "/pay/members_manage/",
-                data=request_data)
-
-            member_info_res = member_info.json()
-
-            packages_info = requests.get(
-                settings.SERVER_ADDRESS +
-                "/pay/token_consume/",
-                params=request_data)
-            package_info_data = packages_info.json()
-
-            packages_info_universal = requests.get(
-                settings.SERVER_ADDRESS + "/pay/token_consume_universal/",
-                params=request_data,
-            )
-            package_info_data_universal = packages_info_universal.json()
-
-            ret_data = defaultdict(lambda: defaultdict(dict))
-            if (
-                    member_info_res.get("code") == 20000
-                    and package_info_data.get("code") == 20000
-                    and package_info_data_universal.get("code") == 20000
-            ):
-                member_info_data = member_info_res.get("data")
-                package_info_data = package_info_data.get("data")
-
-                if member_info_data:
-                    member_info_expire = member_info_data[0].get("expire_date")
-
-                    current_time = datetime.datetime.now()
-
-                    member_info_expire = datetime.datetime.strptime(
-                        member_info_expire, "%Y-%m-%d %H:%M:%S"
-                    )
-
-                    # 当前不是会员 或者会员过期
-                    print("opoppopopopopopopopop")
-                    if not member_info_data or current_time > member_info_expire:
-                        ret_data["member"]["status"] = False
-                        ret_data["member"]["data"]["count"] = {}
-
-                    else:
-                        ret_data["member"]["status"] = True
-                        meber_rest_count = requests.get(
-                            settings.SERVER_ADDRESS + "/pay/token_manage_redis/", params=request_data, )
-                        meber_rest_count_data = meber_rest_count.json()
-
-                        ret_data["member"]["data"] = member_info_data[0]
-                        if meber_rest_count_data.get("code") == 20000:
-                            ret_data["member"]["data"][
-                                "count"
-                            ] = meber_rest_count_data.get("data")
-                        else:
-                            ret_data["member"]["data"]["count"] = {}
-
-                # 没有找到数据, 非会员
-                else:
-                    ret_data["member"]["status"] = False
-
-                    request_data["user_type"] = user_type
-
-                    member_rest_count = requests.get(
-                        settings.SERVER_ADDRESS +
-                        "/pay/token_manage_redis_no_vip/",
-                        params=request_data,
-                    )
-                    member_rest_count_data = member_rest_count.json()
-
-                    if member_rest_count_data.get("code") == 20000:
-                        ret_data["member"]["data"][
-                            "count"
-                        ] = member_rest_count_data.get("data")
-                    else:
-                        ret_data["member"]["data"] = {}
-
-                package_data = defaultdict(lambda: defaultdict(dict))
-                if package_info_data:
-                    gpt35 = package_info_data[0].get("gpt35")
-                    gpt40 = package_info_data[0].get("gpt40")
-                    dalle2 = package_info_data[0].get("dalle2")
-                    baidu_drawing = package_info_data[0].get("baidu_drawing")
-                    wenxin = package_info_data[0].get("wenxin")
-                    xunfei = package_info_data[0].get("xunfei")
-                    mj = package_info_data[0].get("mj")
-                    claude = package_info_data[0].get("claude")
-                    chatglm = package_info_data[0].get("chatglm")
-                    stabel_diffusion = package_info_data[0].get(
-                        "stablediffusion")
-                    qianwen = package_info_data[0].get("qianwen")
-                    sensecore = package_info_data[0].get("sensecore")
-                    ai_360 = package_info_data[0].get("360")
-
-                    package_data["package"]["gpt35"]["status"] = (
-                        True if int(gpt35.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["gpt35"]["value"] = (
-                        int(gpt35.get("rest")) if int(gpt35.get("rest")) > 0 else 0
-                    )
-                    package_data["package"]["gpt40"]["status"] = (
-                        True if int(gpt40.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["gpt40"]["value"] = (
-                        int(gpt40.get("rest")) if int(gpt40.get("rest")) > 0 else 0
-                    )
-                    package_data["package"]["dalle2"]["status"] = (
-                        True if int(dalle2.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["dalle2"]["value"] = (
-                        int(dalle2.get("rest")) if int(dalle2.get("rest")) > 0 else 0
-                    )
-                    package_data["package"]["baidu_drawing"]["status"] = (
-                        True if int(baidu_drawing.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["baidu_drawing"]["value"] = (
-                        int(baidu_drawing.get("rest"))
-                        if int(baidu_drawing.get("rest")) > 0
-                        else 0
-                    )
-
-                    package_data["package"]["wenxin"]["status"] = (
-                        True if int(wenxin.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["wenxin"]["value"] = (
-                        int(wenxin.get("rest")) if int(wenxin.get("rest")) > 0 else 0
-                    )
-
-                    package_data["package"]["claude"]["status"] = (
-                        True if int(claude.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["claude"]["value"] = (
-                        int(claude.get("rest")) if int(claude.get("rest")) > 0 else 0
-                    )
-                    package_data["package"]["chatglm"]["status"] = (
-                        True if int(chatglm.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["chatglm"]["value"] = (
-                        int(chatglm.get("rest")) if int(chatglm.get("rest")) > 0 else 0
-                    )
-
-                    package_data["package"]["xunfei"]["status"] = (
-                        True if int(xunfei.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["xunfei"]["value"] = (
-                        int(xunfei.get("rest")) if int(xunfei.get("rest")) > 0 else 0
-                    )
-
-                    package_data["package"]["mj"]["status"] = (
-                        True if int(mj.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["mj"]["value"] = (
-                        int(mj.get("rest")) if int(mj.get("rest")) > 0 else 0
-                    )
-
-                    package_data["package"]["stablediffusion"]["status"] = (
-                        True if int(stabel_diffusion.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["stablediffusion"]["value"] = (
-                        int(mj.get("rest"))
-                        if int(stabel_diffusion.get("rest")) > 0
-                        else 0
-                    )
-
-                    package_data["package"]["qianwen"]["status"] = (
-                        True if int(qianwen.get("rest")) > 0 else False
-                    )
-                    package_data["package"]["qianwen"]["value"] = (
-                        int(qianwen.get("rest")) if int(qianwen.get("rest")) > 0 else 0
-                    )
-
-                    package_data["package"]["sensecore"]["value"] = (
-                        int(sensecore.get("rest"))
-                        if int(sensecore.get("rest")) > 0
-                        else 0
-                    )
-                    package_data["package"]["sensecore"]["status"] = (
-                        True if int(sensecore.get("rest")) > 0 else False
-                    )
-                    print(ai_360)
-                    package_data["package"]["360"]["value"] = (
-                        int(ai_360.get("rest")) if int(ai_360.get("rest")) > 0 else 0
-                    )
-                    package_data["package"]["360"]["status"] = (
-                        True if int(ai_360.get("rest")) > 0 else False
-                    )
-                else:
-                    package_data["package"]["gpt35"]["status"] = False
-                    package_data["package"]["gpt35"]["value"] = 0
-                    package_data["package"]["gpt40"]["status"] = False
-                    package_data["package"]["gpt40"]["value"] = 0
-                    package_data["package"]["dalle2"]["status"] = False
-                    package_data["package"]["dalle2"]["value"] = 0
-                    package_data["package"]["baidu_drawing"]["status"] = False
-                    package_data["package"]["baidu_drawing"]["value"] = 0
-
-                    package_data["package"]["wenxin"]["status"] = False
-                    package_data["package"]["wenxin"]["value"] = 0
-
-                    package_data["package"]["claude"]["status"] = False
-                    package_data["package"]["claude"]["value"] = 0
-                    package_data["package"]["chatglm"]["status"] = False
-                    package_data["package"]["chatglm"]["value"] = 0
-
-                    package_data["package"]["xunfei"]["status"] = False
-                    package_data["package"]["xunfei"]["value"] = 0
-
-                    package_data["package"]["mj"]["status"] = False
-                    package_data["package"]["mj"]["value"] = 0
-
-                    package_data["package"]["stablediffusion"]["status"] = False
-                    package_data["package"]["stablediffusion"]["value"] = 0
-
-                    package_data["package"]["qianwen"]["status"] = False
-                    package_data["package"]["qianwen"]["value"] = 0
-
-                    package_data["package"]["sensecore"]["status"] = False
-                    package_data["package"]["sensecore"]["value"] = 0
-                    package_data["package"]["360"]["value"] = 0
-
-                if package_info_data_universal:
-                    package_data["package"]["universal"]["total"] = float(
-                        package_info_data_universal.get("total")
-                    )
-                    packages_info_universal_data = package_info_data_universal.get(
-                        "data"
-                    )[0]
-                    package_data["package"]["universal"][
-                        "universal"
-                    ] = packages_info_universal_data.get("universal")
-                    package_data["package"]["universal"][
-                        "universal_9"
-                    ] = packages_info_universal_data.get("universal_9")
-                    package_data["package"]["universal"][
-                        "universal_8"
-                    ] = packages_info_universal_data.get("universal_8")
-                    package_data["package"]["universal"][
-                        "universal_5"
-                    ] = packages_info_universal_data.get("universal_5")
-                    package_data["package"]["universal"][
-                        "universal_hidden_2"
-                    ] = packages_info_universal_data.get("universal_hidden_2")
-                    package_data["package"]["universal"][
-                        "universal_hidden_10"
-                    ] = packages_info_universal_data.get("universal_hidden_10")
-                else:
-                    package_data["package"]["universal"]["total"] = 0.00
-                    package_data["package"]["universal"]["universal"] = 0.00
-                    package_data["package"]["universal"]["universal_9"] = 0.00
-                    package_data["package"]["universal"]["universal_8"] = 0.00
-                    package_data["package"]["universal"]["universal_5"] = 0.00
-                    package_data["package"]["universal"]["universal_hidden_2"] = 0.00
-                    package_data["package"]["universal"]["universal_hidden_10"] = 0.00
-                ret_data.update(package_data)
-                code = RET.OK
-                message = Language.get(code)
-                return CstResponse(code=code, message=message, data=ret_data)
-            else:
-                code = RET.NETWORK_ERROR
-                message = Language.get(code)
-
-                return CstResponse(code=code, message=message)
-        except Exception as e:
+            ret_data = EntitlementCache.traffic_control(user_id, user_type)
+        except Exception:
             print(traceback.format_exc())
             code = RET.DB_ERR
             message = Language.get(code)
 
             return CstResponse(code=code, message=message)
 
+        code = RET.OK
+        message = Language.get(code)
+        return CstResponse(code=code, message=message, data=ret_data)
+
 
 class OmtMessageCenterManage(APIView):
     def __init__(self):
@@ -10725,66 +8449,16 @@ class OmtMessageCenterManage(APIView):
             logger.error(trace)
             raise CstException(code=code, message=message)
 
-        if message_ids:
-            message_ids = set(message_ids)
-
-            # Convert message_ids set to list of VALUES strings
-            values_str_list = [
-                f"({user_id}, {message_id}, 1)" for message_id in message_ids
-            ]
-            values_str = ", ".join(values_str_list)
-
-            if not values_str:
-                sql_update_read = False
+        try:
+            # 已读状态写入 redis 位图, 由 flush_message_reads 批量写回数据库
+            reads = MessageReads(user_id)
+            if message_ids:
+                reads.mark(set(message_ids))
             else:
-                # Generate SQL statement
-                sql_update_read = f"INSERT INTO  {settings.ADMIN_DB}.omt_message_read_status (user_id, message_id, is_read) VALUES {values_str}"
-        else:
-            sql_get_user_unread_message = f"""
-                    SELECT m.message_id
-                    FROM {settings.ADMIN_DB}.omt_message_center AS m
-                    LEFT JOIN {settings.ADMIN_DB}.omt_message_read_status AS r
-                    ON m.message_id = r.message_id AND r.user_id = {user_id}
-                    WHERE r.message_id IS NULL
-            """
-
-            # 如果没有提供message_ids，那么需要查找用户的所有未读消息
-            with connections[settings.ADMIN_DB].cursor() as cursor:
-                cursor.execute(sql_get_user_unread_message)
-                unread_data = MysqlOper.get_query_result(cursor)
-                message_ids = [each.get("message_id") for each in unread_data]
-                message_ids = set(message_ids)
-
-                # Convert message_ids set to list of VALUES strings
-                values_str_list = [
-                    f"({user_id}, {message_id}, 1)" for message_id in message_ids]
-                values_str = ", ".join(values_str_list)
-
-                if not values_str:
-                    sql_update_read = False
-                else:
-                    # Generate SQL statement
-                    sql_update_read = f"INSERT INTO  {settings.ADMIN_DB}.omt_message_read_status (user_id, message_id, is_read) VALUES {values_str}"
-
-        logger.info(sql_update_read)
-
-        if not sql_update_read:
+                reads.mark_all()
             code = RET.OK
             message = Language.get(code)
             return CstResponse(code=code, message=message)
-
-        try:
-            with connections[settings.ADMIN_DB].cursor() as cursor:
-                cursor.execute(sql_update_read)
-                rowcount = cursor.rowcount
-                if len(message_ids) == rowcount:
-                    code = RET.OK
-                    message = Language.get(code)
-                    return CstResponse(code=code, message=message)
-                else:
-                    code = RET.NETWORK_ERROR
-                    message = Language.get(code)
-                    raise CstException(code=code, message=message)
         except Exception:
             code = RET.DB_ERR
             message = Language.get(code)
@@ -10934,17 +8608,12 @@ class OmtMessageCenterManage(APIView):
         if int(message_type) != 2:
             sql_get_messages = f"""
                         SELECT m.id, m.message_id, m.title, m.content,m.cate, m.desc, m.start_time, m.end_time,
-                         m.target_type, m.message_type, m.is_arousel, m.status, m.create_time, m.update_time,
-                        IF(r.message_id IS NULL, 0, 1) AS is_read
+                         m.target_type, m.message_type, m.is_arousel, m.status, m.create_time, m.update_time
                         FROM {settings.ADMIN_DB}.omt_message_center AS m
-                        LEFT JOIN {settings.ADMIN_DB}.omt_message_read_status AS r
-                        ON m.message_id = r.message_id AND r.user_id = {user_id}
                         WHERE m.start_time <= '{current_date}' AND m.status = '1' AND m.message_type = {message_type} """
             sql_get_messages_raw = f"""
                                 SELECT COUNT(DISTINCT(m.message_id)) AS total
                                 FROM {settings.ADMIN_DB}.omt_message_center AS m
-                                LEFT JOIN {settings.ADMIN_DB}.omt_message_read_status AS r
-                                ON m.message_id = r.message_id AND r.user_id = {user_id}
                                 WHERE m.start_time <= '{current_date}' AND m.status = '1' AND m.message_type = {message_type} """
             if is_arousel:
                 sql_get_messages += f" AND is_arousel = {str(is_arousel)} "
@@ -10984,6 +8653,12 @@ class OmtMessageCenterManage(APIView):
             with connections[settings.ADMIN_DB].cursor() as cursor:
                 cursor.execute(sql_get_messages)
                 query_data = MysqlOper.get_query_result(cursor)
+                if int(message_type) != 2:
+                    # 已读状态从 redis 位图读取, 一次 BITFIELD 取整页
+                    read_flags = MessageReads(user_id).read_flags(
+                        [each.get("id") for each in query_data])
+                    for each_message, is_read in zip(query_data, read_flags):
+                        each_message["is_read"] = str(is_read)
                 for each_message in query_data:
                     dict_each_message = {}
                     message_id = each_message.get("message_id")
@@ -11137,17 +8812,9 @@ class OmtMessageCenterContentManage(APIView):
         user_id = data.get("user_id")
         message_id = data.get("message_id")
 
-        # First, mark the message as read by inserting a new record
-        sql_mark_as_read = f"""
-                INSERT INTO omt_message_read_status (message_id, user_id, is_read)
-                VALUES ({message_id}, {user_id}, 1)
-                ON DUPLICATE KEY UPDATE is_read = 1"""
-
-        logger.info(sql_mark_as_read)
-
+        # First, mark the message as read, 由 flush_message_reads 批量写回数据库
         try:
-            with connections[settings.ADMIN_DB].cursor() as cursor:
-                cursor.execute(sql_mark_as_read)
+            MessageReads(user_id).mark([message_id])
 
         except Exception:
             print(traceback.format_exc())
@@ -11765,7 +9432,7 @@ class BillingCenter(APIView):
                         + settings.HASHRATE_ADDRESS
                         + f"/{user_id}"
                 )
-                get_hashrate_req = requests.get(url=url)
+                get_hashrate_req = http.get(url=url)
 
                 if get_hashrate_req.status_code == 200:
                     get_hashrate_data = json.loads(get_hashrate_req.text)
@@ -5,15 +5,12 @@ import traceback
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 
-import requests
 from django.conf import settings
 from django.db import connection, connections
 from django.http import QueryDict
 from django_redis import get_redis_connection
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from requests.adapters import HTTPAdapter
-from requests_futures.sessions import FuturesSession
 from rest_framework import status
 from rest_framework.views import APIView
 
@@ -21,6 +18,7 @@ from language.language_pack import RET, Language
 from utils.cst_class import CstException, CstResponse
 from utils.distributed_id_generator.get_id import get_distributed_id
 from utils.gadgets import gadgets
+from utils.http_client import http
 from utils.mq_utils import RabbitMqUtil
 from utils.prompts import generate_structured_prompt, generate_structured_prompt_tutor
 from utils.sql_oper import MysqlOper
@@ -231,7 +229,7 @@ class UQDUserQuestionDetailsView(APIView):
                 settings.ADMIN_PUBLIC_API_DOMAIN + settings.ADMIN_USER_BUILD_MODEL
         )
 
-        response = requests.post(url=user_build_model_api, json=request.data)
+        response = http.post(url=user_build_model_api, json=request.data)
         if response.status_code == 200:
             api_data = json.loads(response.text)
 
@@ -250,7 +248,7 @@ class UQDUserQuestionDetailsView(APIView):
                     q_data = QueryDict("", mutable=True)
                     q_data.update(mutable_data)
 
-                    response_auto_review = requests.put(
+                    response_auto_review = http.put(
                         url=user_build_model_api, json=mutable_data
                     )
                     if response_auto_review.status_code == 200:
@@ -416,7 +414,7 @@ class UQDUserQuestionDetailsView(APIView):
                 settings.ADMIN_PUBLIC_API_DOMAIN + settings.ADMIN_USER_BUILD_MODEL
         )
 
-        response = requests.put(user_build_model_api, json=data)
+        response = http.put(user_build_model_api, json=data)
 
         if response.status_code == 200:
             api_data = json.loads(response.text)
@@ -499,7 +497,7 @@ class UQDUserQuestionDetailsView(APIView):
                 settings.ADMIN_PUBLIC_API_DOMAIN + settings.ADMIN_USER_BUILD_MODEL
         )
 
-        response = requests.delete(url=user_build_model_api, json=data)
+        response = http.delete(url=user_build_model_api, json=data)
 
         if response.status_code == 200:
             api_data = json.loads(response.text)
@@ -1189,13 +1187,9 @@ class RemoteDictView(APIView):
 
         # 创建一个线程池
         with ThreadPoolExecutor(max_workers=6) as executor:
-            # 创建一个session对象
-            session = FuturesSession(executor=executor)
-            session.mount("http://", HTTPAdapter(max_retries=3))
-            session.mount("https://", HTTPAdapter(max_retries=3))
-
-            # 并发发送请求
-            futures = {key: session.get(url) for key, url in url_dict.items()}
+            # 并发发送请求, 连接与重试由 http 客户端统一管理
+            futures = {key: executor.submit(http.get, url)
+                       for key, url in url_dict.items()}
 
             # 获取所有响应
             responses = {key: future.result()
@@ -1242,7 +1236,6 @@ class RemoteDictView(APIView):
 
 
 class SvaMeList(APIView):
-    worker_id = 100001
 
     @swagger_auto_schema(
         operation_id="109",
@@ -1358,7 +1351,7 @@ class SvaMeList(APIView):
         image_url = data.get("image_url", "")
         video_url = data.get("video_url", "")
         extend = data.get("extend", [])
-        me_id = get_distributed_id(worker_id=self.worker_id)
+        me_id = get_distributed_id()
 
         required_params = ["photo", "name"]
 
@@ -1987,7 +1980,6 @@ class SvaMeList(APIView):
 
 
 class SvaTutorList(APIView):
-    worker_id = 100002
 
     @swagger_auto_schema(
         operation_id="199",
@@ -2100,7 +2092,7 @@ class SvaTutorList(APIView):
         website = data.get("website")
         me_id = data.get("me_id")
         extend = data.get("extend")
-        tutor_id = get_distributed_id(self.worker_id)
+        tutor_id = get_distributed_id()
         unbinded_tutor_id = data.get("unbinded_tutor_id")
         sort = data.get("sort")
         is_copied = data.get("is_copied", 0)
@@ -3357,11 +3349,10 @@ class PromptManage(APIView):
         },
     )
     def post(self, request):
-        worker_id = 100003
         data = request.data
         user_id = data.get("user_id")
         prompt = data.get('prompt_content')
-        prompt_id = get_distributed_id(worker_id=worker_id)
+        prompt_id = get_distributed_id()
         if not user_id or not prompt:
             code = RET.PARAM_MISSING
             message = Language.get(code)
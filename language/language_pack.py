@@ -51,6 +51,7 @@ class RET:
     ERROR_CONSUME_HASHRATE = 30033
     SOUND_NOT_CLEAR = 30034
     GROUP_DUPLICATE = 30035
+    PARAM_ERR = 30036
 
 
 # 元组中第一个为中文，第二个为英文，第三个为繁体
@@ -93,6 +94,7 @@ language_pack = {
     RET.ERROR_CONSUME_HASHRATE: ("扣费失败,请留意算力余额",),
     RET.SOUND_NOT_CLEAR: ("声音文件不清晰",),
     RET.GROUP_DUPLICATE: ("已经有相同分组了",),
+    RET.PARAM_ERR: ("参数错误",),
 }
 
 
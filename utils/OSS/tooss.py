@@ -1,9 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import oss2
-import requests
 from django.conf import settings
 
+from utils.http_client import http
+
 
 class Tooss(object):
     """
@@ -47,7 +48,7 @@ class Tooss(object):
             # 如果是网络图片，先下载，然后上传
             try:
                 print(imageUrl)
-                response = requests.get(imageUrl, timeout=10)
+                response = http.get(imageUrl, timeout=10)
                 response.raise_for_status()  # 如果请求返回的状态码不是200，将引发HTTPError异常
                 bucket.put_object(objectName, response.content)
             except Exception as e:
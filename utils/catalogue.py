@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 23:20
+# @Author  : payne
+# @File    : catalogue.py
+# @Description : 商品目录进程内快照, 商品列表与下单价格校验直接读取, 不再查询 pp_products
+#
+# - 首次使用时整表加载, 按分类预先渲染商品列表 JSON
+# - 版本号存放在 config 库 config:products:version, 后台修改商品后 INCR 该键(或执行 refresh_catalogue),
+#   各进程每 CATALOGUE_CHECK_INTERVAL 秒检查一次版本, 变化时重新加载; 超过 CATALOGUE_MAX_AGE 秒也会重新加载
+# - 重新加载期间其他线程继续使用旧快照
+import logging
+import math
+import threading
+import time
+import traceback
+from collections import defaultdict
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from rest_framework.renderers import JSONRenderer
+
+from utils.sql_oper import QueryRegistry
+
+logger = logging.getLogger("view")
+
+CATALOGUE_VERSION_KEY = "config:products:version"
+
+FETCH_CATALOGUE = QueryRegistry.register(
+    "catalogue.fetch_products",
+    "SELECT prod_id, prod_name, prod_description, prod_details, prod_rules, "
+    "prod_origin_price, prod_price, continuous_annual_sub_price, prod_cate_id, "
+    "directed_hashrate, universal_hashrate, hashrate, is_show FROM {db}.pp_products "
+    "ORDER BY prod_price DESC",
+)
+
+
+def render_product(each_prod):
+    """
+    商品列表中的单个商品, 与原 ProductsList 逐行拼装的结果一致
+    """
+    prod_cate_id = each_prod.get("prod_cate_id")
+    prod_desc = each_prod.get("prod_description")
+    prod_details = each_prod.get("prod_details")
+
+    prod_desc_object = {}
+    if prod_desc and "|" in prod_desc:
+        prod_desc = prod_desc.split("|")
+        prod_desc_object["count"] = prod_desc[0].strip()
+        prod_desc_object["valid"] = prod_desc[1].strip()
+
+    prod_details_object = {}
+    if int(prod_cate_id) == 3:
+        prod_details = prod_details.split("|")
+        prod_details_object["version_3_5"] = prod_details[0]
+        prod_details_object["version_4_0"] = prod_details[1]
+    else:
+        prod_details_object["value"] = prod_details
+
+    return {
+        "prod_id": each_prod.get("prod_id"),
+        "prod_name": each_prod.get("prod_name"),
+        "prod_desc": prod_desc_object,
+        "prod_details": prod_details_object,
+        "prod_origin_price": each_prod.get("prod_origin_price"),
+        "prod_price": each_prod.get("prod_price"),
+        "prod_rules": each_prod.get("prod_rules"),
+        "prod_points": str(math.ceil(
+            float(each_prod.get("prod_origin_price")) * settings.POINTS_UNIT)),
+        "prod_cate_id": prod_cate_id,
+        "hashrate": each_prod.get("hashrate"),
+        "directed_hashrate": each_prod.get("directed_hashrate"),
+        "universal_hashrate": each_prod.get("universal_hashrate"),
+        "continuous_annual_sub_price": each_prod.get("continuous_annual_sub_price"),
+    }
+
+
+class CatalogueSnapshot(object):
+    """
+    某一版本的商品目录, 构建后只读
+    - prices     {prod_id: prod_price}, 包含未上架商品
+    - categories 上架商品的分类, 按商品价格降序首次出现的顺序
+    - listings   {prod_cate_id: 该分类商品列表 JSON}
+    """
+
+    __slots__ = ("version", "loaded_at", "prices", "categories", "listings")
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.prices = {}
+
+        grouped = defaultdict(list)
+        for each_prod in rows:
+            self.prices[each_prod.get("prod_id")] = each_prod.get("prod_price")
+            if each_prod.get("is_show") != "1":
+                continue
+            prod_cate_id = each_prod.get("prod_cate_id")
+            products = grouped[prod_cate_id]
+            if products is None:
+                continue
+            try:
+                products.append(render_product(each_prod))
+            except Exception:
+                # 数据有误的商品只影响所在分类的列表, 不影响价格校验
+                logger.error(f"catalogue product {each_prod.get('prod_id')}: {traceback.format_exc()}")
+                grouped[prod_cate_id] = None
+
+        renderer = JSONRenderer()
+        self.categories = tuple(grouped)
+        self.listings = {
+            prod_cate_id: renderer.render(products) if products is not None else None
+            for prod_cate_id, products in grouped.items()
+        }
+
+    def price(self, prod_id):
+        """
+        :return: 商品价格字符串, 商品不存在时为 None
+        """
+        return self.prices.get(str(prod_id))
+
+    def listing(self, prod_cate_ids):
+        """
+        :param prod_cate_ids: 分类 id 列表
+        :return: 商品列表 data 部分的 JSON, {分类: [商品]}; 没有商品时为 None
+        """
+        wanted = {str(int(each)) for each in prod_cate_ids}
+        parts = []
+        for prod_cate_id in self.categories:
+            if prod_cate_id not in wanted:
+                continue
+            listing = self.listings[prod_cate_id]
+            if listing is None:
+                raise ValueError(f"catalogue category {prod_cate_id} is invalid")
+            parts.append(b'"' + prod_cate_id.encode() + b'":' + listing)
+        if not parts:
+            return None
+        return b"{" + b",".join(parts) + b"}"
+
+
+class Catalogue(object):
+    _lock = threading.Lock()
+    _snapshot = None
+    _checked_at = 0
+
+    @classmethod
+    def _version(cls, r_config=None):
+        r_config = r_config or get_redis_connection("config")
+        version = r_config.get(CATALOGUE_VERSION_KEY)
+        if isinstance(version, bytes):
+            version = version.decode()
+        return version
+
+    @classmethod
+    def _load(cls):
+        try:
+            version = cls._version()
+        except Exception:
+            logger.warning(f"catalogue version unavailable: {traceback.format_exc()}")
+            version = None
+        # 先读版本再读表, 加载期间发生的修改会在下次检查时重新加载
+        snapshot = CatalogueSnapshot(version, FETCH_CATALOGUE.fetch_all())
+        cls._snapshot = snapshot
+        cls._checked_at = time.monotonic()
+        return snapshot
+
+    @classmethod
+    def _stale(cls, snapshot):
+        now = time.monotonic()
+        if now - snapshot.loaded_at > getattr(settings, "CATALOGUE_MAX_AGE", 300):
+            return True
+        if now - cls._checked_at < getattr(settings, "CATALOGUE_CHECK_INTERVAL", 5):
+            return False
+        cls._checked_at = now
+        try:
+            return cls._version() != snapshot.version
+        except Exception:
+            logger.warning(f"catalogue version check failed: {traceback.format_exc()}")
+            return False
+
+    @classmethod
+    def get(cls):
+        """
+        :return: 当前 CatalogueSnapshot
+        """
+        snapshot = cls._snapshot
+        if snapshot is None:
+            with cls._lock:
+                snapshot = cls._snapshot
+                if snapshot is None:
+                    snapshot = cls._load()
+            return snapshot
+
+        if cls._stale(snapshot) and cls._lock.acquire(blocking=False):
+            try:
+                snapshot = cls._load()
+            except Exception:
+                # 加载失败继续使用旧快照
+                logger.error(traceback.format_exc())
+            finally:
+                cls._lock.release()
+        return snapshot
+
+    @classmethod
+    def price(cls, prod_id):
+        """
+        商品价格, 快照中不存在时(可能是新上架商品)重新加载一次
+        :return: 商品价格字符串, 商品不存在时为 None
+        """
+        snapshot = cls.get()
+        price = snapshot.price(prod_id)
+        if price is None and time.monotonic() - snapshot.loaded_at > 1:
+            with cls._lock:
+                if cls._snapshot is snapshot:
+                    snapshot = cls._load()
+                else:
+                    snapshot = cls._snapshot
+            price = snapshot.price(prod_id)
+        return price
+
+    @classmethod
+    def bump(cls, r_config=None):
+        """
+        商品修改后调用, 所有进程在下次检查时重新加载
+        """
+        r_config = r_config or get_redis_connection("config")
+        cls._snapshot = None
+        return r_config.incr(CATALOGUE_VERSION_KEY)
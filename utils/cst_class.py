@@ -8,6 +8,8 @@
 """
 import logging
 
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from language.language_pack import Language
@@ -34,6 +36,19 @@ class CstResponse(Response):
         super(CstResponse, self).__init__(dic_data, **kwargs)
 
 
+class CstRawResponse(HttpResponse):
+    def __init__(self, code, message=None, data=None, total=1):
+        """
+        与 CstResponse 格式相同, data 为预先渲染好的 JSON(bytes)
+        """
+        if not message:
+            message = Language.get(code)
+
+        head = JSONRenderer().render(dict(code=int(code), msg=message, total=total))
+        body = head[:-1] + b',"data":' + (data or b"[]") + b"}"
+        super(CstRawResponse, self).__init__(body, content_type="application/json")
+
+
 class CstException(Exception):
     """
     业务异常类
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 18:20
+# @Author  : payne
+# @File    : delayed_queue.py
+# @Description : 基于 redis 有序集合的延迟/重试队列, 多进程竞争消费, 领取后在租约期内不可见
+#
+# 有序集合 {name} 的 member 为任务标识, score 为下次可执行时间戳;
+# 领取时在脚本内把 score 推后一个租约, 消费者崩溃后任务在租约到期时重新可见, 确认后删除
+import time
+
+# 领取到期任务并设置租约, 返回 member 列表
+CLAIM_SCRIPT = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[3]))
+for _, member in ipairs(members) do
+    redis.call('ZADD', KEYS[1], ARGV[2], member)
+end
+return members
+"""
+
+
+class DelayedQueue(object):
+    def __init__(self, name, redis_conn, lease=120):
+        """
+        :param name: 有序集合 key
+        :param redis_conn: redis 连接
+        :param lease: 领取后的不可见时间(秒), 超过后视为消费者失联, 任务重新可见
+        """
+        self.name = name
+        self.redis = redis_conn
+        self.lease = lease
+        self._claim = redis_conn.register_script(CLAIM_SCRIPT)
+
+    def push(self, member, delay=0, replace=False):
+        """
+        :param replace: False 时已在队列中的任务保持原有执行时间
+        :return: 是否新加入
+        """
+        score = time.time() + delay
+        if replace:
+            return bool(self.redis.zadd(self.name, {member: score}))
+        return bool(self.redis.zadd(self.name, {member: score}, nx=True))
+
+    def push_many(self, members, delay=0):
+        if not members:
+            return 0
+        score = time.time() + delay
+        return self.redis.zadd(
+            self.name, {member: score for member in members}, nx=True)
+
+    def claim(self, count=1):
+        now = time.time()
+        members = self._claim(
+            keys=[self.name], args=[now, now + self.lease, count])
+        return [
+            member.decode() if isinstance(member, bytes) else member
+            for member in members
+        ]
+
+    def ack(self, member):
+        self.redis.zrem(self.name, member)
+
+    def retry(self, member, delay):
+        self.redis.zadd(self.name, {member: time.time() + delay})
+
+    def size(self):
+        return self.redis.zcard(self.name)
+
+    def contains(self, members):
+        pipe = self.redis.pipeline(transaction=False)
+        for member in members:
+            pipe.zscore(self.name, member)
+        return [score is not None for score in pipe.execute()]
@@ -6,7 +6,7 @@
 # coding=UTF-8
 
 
-from . import options, snowflake_m1
+from . import options, snowflake_m1, snowflake_sharded
 
 
 class DefaultIdGenerator:
@@ -25,7 +25,10 @@ class DefaultIdGenerator:
         if option.base_time < 100000:
             raise ValueError("base time error.")
 
-        self.snowflake = snowflake_m1.SnowFlakeM1(option)
+        if option.shard_bit_length > 0:
+            self.snowflake = snowflake_sharded.SnowFlakeSharded(option)
+        else:
+            self.snowflake = snowflake_m1.SnowFlakeM1(option)
 
     def next_id(self) -> int:
         """
@@ -35,3 +38,21 @@ class DefaultIdGenerator:
         if self.snowflake is None:
             raise ValueError("please set id generator at first.")
         return self.snowflake.next_id()
+
+    def next_ids(self, count) -> list:
+        """
+        批量获取新的UUID
+        """
+
+        if self.snowflake is None:
+            raise ValueError("please set id generator at first.")
+        return self.snowflake.next_ids(count)
+
+    def last_time_tick(self) -> int:
+        """
+        已发出的最大时间戳, 未设置生成器时为 0
+        """
+
+        if self.snowflake is None:
+            return 0
+        return self.snowflake.last_time_tick()
@@ -4,20 +4,139 @@
 # @Author  : payne
 # @File    : get_id.py
 # @Description : 获取分布式ID
+#
+# 每个进程一个生成器, 序列号状态在调用之间保留, 同一毫秒内的 ID 不再重复;
+# 机器码通过 idregister.Register 在 redis 中租用, 不再由各视图写死; 租约丢失或即将到期
+# (续期线程未能及时续期)时, 下次取号前重新租用
+import logging
+import os
+import threading
+import time
 
+from django.conf import settings
+from django_redis import get_redis_connection
 
 from utils.distributed_id_generator import generator, options
+from utils.distributed_id_generator.idregister import Register
 
+logger = logging.getLogger("view")
 
-def get_distributed_id(worker_id):
-    # 声明id生成器参数，需要自己构建一个worker_id
-    option = options.IdGeneratorOptions(worker_id=worker_id)
-    # 参数中，worker_id_bit_length 默认值6，支持的 worker_id 最大值为2^6-1，若 worker_id
-    # 超过64，可设置更大的 worker_id_bit_length
-    idgen = generator.DefaultIdGenerator()
-    # 保存参数
-    idgen.set_id_generator(option)
-    # 生成id
-    uid = idgen.next_id()
-    # 打印出来查看
-    return uid
+
+class WorkerIdUnavailable(Exception):
+    """
+    无法租用机器码, 订单号等不能退回到可能与其他进程重复的机器码
+    """
+
+
+class IdGenerator(object):
+    """
+    进程内单例, fork 后的子进程重新租用机器码
+    - ID_WORKER_ID_BIT_LENGTH 机器码位长, 默认 6, 最多 64 个进程同时持有
+    - ID_SEQ_BIT_LENGTH 序列数位长, 默认 6
+    - ID_SHARD_BIT_LENGTH 分片位长, 默认 0; 高并发时可设为 3 并将序列数位长调到 12, 每个线程独占分片取号
+    """
+
+    # 租用失败时的重试次数与间隔(秒), 仍失败则抛出 WorkerIdUnavailable, 不使用可能重复的机器码
+    LEASE_ATTEMPTS = 3
+    LEASE_RETRY_DELAY = 0.2
+    # 租约剩余时间少于该值(秒)时不再用当前机器码发号, 先重新租用
+    LEASE_SAFETY_MARGIN = 3
+
+    _lock = threading.Lock()
+    _generator = None
+    _register = None
+    _pid = None
+    # 被替换的生成器, 新生成器在系统时间越过其最后时间戳之前不发号
+    _retired = None
+
+    @classmethod
+    def _expired(cls):
+        return (
+            cls._generator is None
+            or cls._pid != os.getpid()
+            or not cls._register.alive(cls.LEASE_SAFETY_MARGIN)
+        )
+
+    @classmethod
+    def get(cls):
+        if cls._expired():
+            with cls._lock:
+                if cls._expired():
+                    cls._retired = cls._generator or cls._retired
+                    # 租用失败时不保留旧生成器, 下次取号继续重新租用
+                    cls._generator = None
+                    cls._generator = cls._build()
+                    cls._retired = None
+                    cls._pid = os.getpid()
+        return cls._generator
+
+    @classmethod
+    def _lost(cls, worker_id):
+        logger.error(f"worker id {worker_id} lease lost, re-lease on next call")
+        with cls._lock:
+            cls._retired = cls._generator or cls._retired
+            cls._generator = None
+
+    @classmethod
+    def _build(cls):
+        worker_id_bit_length = getattr(settings, "ID_WORKER_ID_BIT_LENGTH", 6)
+        option = options.IdGeneratorOptions(
+            worker_id=cls._lease((1 << worker_id_bit_length) - 1),
+            worker_id_bit_length=worker_id_bit_length,
+            seq_bit_length=getattr(settings, "ID_SEQ_BIT_LENGTH", 6),
+            shard_bit_length=getattr(settings, "ID_SHARD_BIT_LENGTH", 0),
+        )
+        idgen = generator.DefaultIdGenerator()
+        idgen.set_id_generator(option)
+        cls._wait_past(cls._retired, option.base_time)
+        return idgen
+
+    @classmethod
+    def _wait_past(cls, retired, base_time):
+        """
+        旧生成器可能领先系统时间(漂移或分片预留, 最多 top_over_cost_count 毫秒),
+        重新租到同一机器码时, 等系统时间越过旧生成器的最后时间戳再发号, 避免重复
+        """
+        if retired is None:
+            return
+        ahead = retired.last_time_tick() + base_time - time.time_ns() // 1000000
+        if ahead >= 0:
+            logger.info(f"wait {ahead + 1}ms for retired id generator")
+            time.sleep((ahead + 1) / 1000)
+
+    @classmethod
+    def _lease(cls, max_worker_id):
+        if cls._register is not None and cls._pid == os.getpid():
+            cls._register.stop()
+        cls._register = None
+
+        for attempt in range(cls.LEASE_ATTEMPTS):
+            if attempt:
+                time.sleep(cls.LEASE_RETRY_DELAY * attempt)
+            try:
+                register = Register(
+                    max_worker_id=max_worker_id,
+                    redis_impl=get_redis_connection("default"),
+                    on_lost=cls._lost,
+                )
+                worker_id = register.get_worker_id()
+            except Exception as exe:
+                logger.error(f"lease worker id failed: {exe}")
+                continue
+            if worker_id > -1:
+                cls._register = register
+                return worker_id
+            logger.error("no worker id available")
+        # 生成器未建立, 下次取号时重新租用
+        raise WorkerIdUnavailable("lease worker id failed")
+
+
+def get_distributed_id():
+    return IdGenerator.get().next_id()
+
+
+def get_distributed_ids(count):
+    """
+    批量获取, 用于批量插入
+    """
+    return IdGenerator.get().next_ids(count)
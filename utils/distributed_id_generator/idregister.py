@@ -7,11 +7,44 @@ worker id generator
 
 
 import logging
+import threading
 import time
-from threading import Thread
+import uuid
 
 import redis
 
+WORKER_ID_INDEX = "IdGen:WorkerId:Index"
+WORKER_ID_VALUE = "IdGen:WorkerId:Value:"
+
+# 从游标位置开始轮询一圈, 第一个未被占用的 worker_id 写入本进程的 token
+LEASE_SCRIPT = """
+local max_worker_id = tonumber(ARGV[1])
+local start = redis.call('INCR', KEYS[1]) % (max_worker_id + 1)
+for i = 0, max_worker_id do
+    local worker_id = (start + i) % (max_worker_id + 1)
+    if redis.call('SET', ARGV[4] .. worker_id, ARGV[3], 'NX', 'EX', ARGV[2]) then
+        redis.call('SET', KEYS[1], worker_id)
+        return worker_id
+    end
+end
+return -1
+"""
+
+# 仍由本进程持有时续期, 否则返回 0
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
 
 class Register:
     """
@@ -20,116 +53,103 @@ class Register:
     - port 代表redis端口
     - max_worker_id worker_id的最大值, 默认为100
     - password redis的密码, 默认为空
+    - redis_impl 已有的 redis 连接(连接池), 传入时忽略 host/port/password
+    - on_lost 租约丢失时的回调, 参数为丢失的 worker_id
     """
 
-    def __init__(self, host, port, max_worker_id=100, password=None):
-        self.redis_impl = redis.StrictRedis(
+    def __init__(self, host=None, port=None, max_worker_id=100, password=None, redis_impl=None,
+                 on_lost=None):
+        self.redis_impl = redis_impl or redis.StrictRedis(
             host=host, port=port, db=0, password=password
         )
-        self.loop_count = 0
-        self.max_loop_count = 10
         self.worker_id_expire_time = 15
         self.max_worker_id = max_worker_id
         self.worker_id = -1
-        self.is_stop = False
+        # 租约的最晚到期时间(monotonic), 按续期请求发出前的时间计算
+        self.deadline = 0
+        self.on_lost = on_lost
+        # 区分持有者, 续期和释放时只操作自己的租约
+        self.token = uuid.uuid4().hex
+        self.lost = threading.Event()
+        self.__stopping = threading.Event()
+        self.__lease = self.redis_impl.register_script(LEASE_SCRIPT)
+        self.__renew = self.redis_impl.register_script(RENEW_SCRIPT)
+        self.__release = self.redis_impl.register_script(RELEASE_SCRIPT)
+
+    @property
+    def is_stop(self):
+        return self.__stopping.is_set()
+
+    def alive(self, margin=0):
+        """
+        租约在 margin 秒后仍未到期
+        """
+
+        return self.worker_id > -1 and time.monotonic() < self.deadline - margin
 
     def get_lock(self, key):
         """
         获取分布式全局锁,并设置过期时间为30秒
         """
 
-        if self.redis_impl.setnx(key, 1):
-            self.redis_impl.expire(key, 30)
-            return True
-        if self.redis_impl.ttl(key) < 0:
-            self.redis_impl.expire(key, 30)
-        return False
+        return bool(self.redis_impl.set(key, 1, nx=True, ex=30))
 
     def stop(self):
         """
-        退出注册器的线程
+        退出注册器的线程并释放 worker_id
         """
 
-        self.is_stop = True
+        self.__stopping.set()
+        if self.worker_id < 0:
+            return
+        try:
+            self.__release(
+                keys=[f"{WORKER_ID_VALUE}{self.worker_id}"], args=[self.token])
+        except Exception as exe:
+            logging.error(exe)
 
     def get_worker_id(self):
         """
-        获取全局唯一worker_id, 会创建一个线程给worker id续期
+        获取全局唯一worker_id, 一次脚本调用完成, 并创建一个线程给worker id续期
         失败返回-1
         """
 
-        self.loop_count = 0
-
-        def extern_life(my_id):
-            while True:
-                time.sleep(self.worker_id_expire_time / 3)
-                # 是否关闭了
-                if self.is_stop:
-                    return
-                # 更新生命周期
-                if self.worker_id != my_id:
-                    break
-                try:
-                    self.redis_impl.expire(
-                        f"IdGen:WorkerId:Value:{my_id}",
-                        self.worker_id_expire_time)
-                except Exception as exe:
-                    logging.error(exe)
-                continue
-
-        self.worker_id = self.__get_next_worker_id()
+        start = time.monotonic()
+        self.worker_id = int(self.__lease(
+            keys=[WORKER_ID_INDEX],
+            args=[self.max_worker_id, self.worker_id_expire_time, self.token, WORKER_ID_VALUE],
+        ))
         if self.worker_id > -1:
-            Thread(target=extern_life, args=[self.worker_id]).start()
+            self.deadline = start + self.worker_id_expire_time
+            self.lost.clear()
+            threading.Thread(
+                target=self.__extern_life, args=[self.worker_id], daemon=True).start()
         return self.worker_id
 
-    def __get_next_worker_id(self):
+    def __extern_life(self, my_id):
         """
-        获取全局唯一worker id内部实现
+        每 1/3 过期时间续期一次; 租约已被他人持有, 或到期前仍未续期成功时视为丢失
+        续期成功时到期时间从请求发出前算起, 请求耗时不会让本地认为的到期时间晚于 redis
         """
 
-        cur = self.redis_impl.incrby("IdGen:WorkerId:Index", 1)
-
-        def can_reset():
-            try:
-                reset_value = self.redis_impl.incr("IdGen:WorkerId:Value:Edit")
-                return reset_value != 1
-            except Exception as ept:
-                logging.error(ept)
-                return False
-
-        def end_reset():
-            try:
-                self.redis_impl.set("IdGen:WorkerId:Value:Edit", 0)
-            except Exception as ept:
-                logging.error(ept)
-
-        def is_available(worker_id: int):
+        key = f"{WORKER_ID_VALUE}{my_id}"
+        while not self.__stopping.wait(self.worker_id_expire_time / 3):
+            if self.worker_id != my_id:
+                return
+            start = time.monotonic()
             try:
-                rst = self.redis_impl.get(f"IdGen:WorkerId:Value:{worker_id}")
-                return rst != "Y"
-            except Exception as ept:
-                logging.error(ept)
-                return False
-
-        if cur > self.max_worker_id:
-            if can_reset():
-                self.redis_impl.set("IdGen:WorkerId:Index", -1)
-                end_reset()
-                self.loop_count += 1
-
-                if self.loop_count > self.max_loop_count:
-                    self.loop_count = 0
-                    return -1
-
-                time.sleep(0.2 * self.loop_count)
-                return self.__get_next_worker_id()
-            time.sleep(0.2)
-            return self.__get_next_worker_id()
-        if is_available(cur):
-            self.redis_impl.setex(
-                f"IdGen:WorkerId:Value:{cur}", self.worker_id_expire_time, "Y"
-            )
-            self.loop_count = 0
-            return cur
-
-        return self.__get_next_worker_id()
+                if self.__renew(keys=[key], args=[self.token, self.worker_id_expire_time]):
+                    self.deadline = start + self.worker_id_expire_time
+                    continue
+                logging.error(f"worker id {my_id} lease taken by another process")
+            except Exception as exe:
+                logging.error(exe)
+                if time.monotonic() < self.deadline:
+                    continue
+                logging.error(f"worker id {my_id} lease expired")
+
+            self.worker_id = -1
+            self.lost.set()
+            if self.on_lost is not None:
+                self.on_lost(my_id)
+            return
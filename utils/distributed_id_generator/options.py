@@ -12,9 +12,10 @@ class IdGeneratorOptions:
     - worker_id 全局唯一id, 区分不同uuid生成器实例
     - worker_id_bit_length 生成的uuid中worker_id占用的位数
     - seq_bit_length 生成的uuid中序列号占用的位数
+    - shard_bit_length 序列号中分片号占用的位数, 0 为不分片
     """
 
-    def __init__(self, worker_id=0, worker_id_bit_length=6, seq_bit_length=6):
+    def __init__(self, worker_id=0, worker_id_bit_length=6, seq_bit_length=6, shard_bit_length=0):
 
         # 雪花计算方法,（1-漂移算法|2-传统算法）, 默认1。目前只实现了1。
         self.method = 1
@@ -40,4 +41,9 @@ class IdGeneratorOptions:
         self.min_seq_number = 5
 
         # 最大漂移次数（含）, 默认2000, 推荐范围500-10000（与计算能力有关）
+        # 分片模式下为最多领先系统时间的毫秒数
         self.top_over_cost_count = 2000
+
+        # 分片位长, 默认值0, 不分片。大于0时使用分片生成器, 序列数高位为分片号,
+        # 最多 2^shard_bit_length-1 个线程各自独占一个分片, 取值范围 [1, seq_bit_length-3]
+        self.shard_bit_length = shard_bit_length
@@ -16,3 +16,17 @@ class SnowFlake:
         """
 
         return 0
+
+    def next_ids(self, count) -> list:
+        """
+        批量获取新的UUID
+        """
+
+        return [self.next_id() for _ in range(count)]
+
+    def last_time_tick(self) -> int:
+        """
+        已发出的最大时间戳(相对 base_time 的毫秒数)
+        """
+
+        return 0
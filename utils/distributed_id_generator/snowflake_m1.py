@@ -146,3 +146,19 @@ class SnowFlakeM1(SnowFlake):
             else:
                 nextid = self.__next_normal_id()
             return nextid
+
+    def last_time_tick(self) -> int:
+        return self.__last_time_tick
+
+    def next_ids(self, count) -> list:
+        """
+        批量获取, 只加一次锁
+        """
+        with self.__id_lock:
+            ids = []
+            for _ in range(count):
+                if self.__is_over_cost:
+                    ids.append(self.__next_over_cost_id())
+                else:
+                    ids.append(self.__next_normal_id())
+            return ids
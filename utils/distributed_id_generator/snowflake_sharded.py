@@ -0,0 +1,124 @@
+"""
+分片生成器
+"""
+
+# !/usr/bin/python
+# coding=UTF-8
+
+import itertools
+import threading
+import time
+import weakref
+
+from .options import IdGeneratorOptions
+from .snowflake import SnowFlake
+
+
+class _ShardState:
+    """
+    线程私有的分片状态, 线程结束时回收分片
+    """
+
+    __slots__ = ("shard", "buffer", "__weakref__")
+
+    def __init__(self, shard):
+        self.shard = shard
+        self.buffer = iter(())
+
+
+class SnowFlakeSharded(SnowFlake):
+    """
+    分片规则ID生成器
+    - 序列数高 shard_bit_length 位为分片号, 每个线程独占一个分片, 取号不加锁;
+      同一线程内的 asyncio 任务不会并发取号, 共用线程的分片
+    - 分片 0 保留给分片用尽时的线程, 这些线程共用分片 0 并加锁
+    - 时间取单调时钟, 不会回拨, 不需要 M1 的回拨预留位
+    - 每次为当前分片预留一整毫秒的序列号, 用完后直接预留下一毫秒,
+      最多领先系统时间 top_over_cost_count 毫秒, 超出时等待
+    - 分片的最后时间戳在线程结束后保留, 分片被新线程复用时从该时间之后继续
+    """
+
+    def __init__(self, options: IdGeneratorOptions):
+        self.base_time = int(options.base_time) or 1582136402000
+        self.worker_id_bit_length = int(options.worker_id_bit_length) or 6
+        self.worker_id = options.worker_id
+        self.seq_bit_length = int(options.seq_bit_length) or 6
+        self.shard_bit_length = int(options.shard_bit_length)
+        self.local_bit_length = self.seq_bit_length - self.shard_bit_length
+        if self.shard_bit_length < 1 or self.local_bit_length < 3:
+            raise ValueError("shard_bit_length must be in [1, seq_bit_length - 3].")
+        self.max_ahead = int(options.top_over_cost_count)
+
+        self.__timestamp_shift = self.worker_id_bit_length + self.seq_bit_length
+        self.__block_size = 1 << self.local_bit_length
+        # 单调时钟换算为毫秒时间戳的偏移
+        self.__clock_offset = time.time_ns() // 1000000 - time.monotonic_ns() // 1000000 - self.base_time
+
+        self.__free_shards = list(range((1 << self.shard_bit_length) - 1, 0, -1))
+        self.__last_time_ticks = [0] * (1 << self.shard_bit_length)
+        self.__shard_lock = threading.Lock()
+        self.__shared_state = _ShardState(0)
+        self.__shared_lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __get_current_time_tick(self) -> int:
+        return time.monotonic_ns() // 1000000 + self.__clock_offset
+
+    def __acquire_state(self):
+        with self.__shard_lock:
+            if not self.__free_shards:
+                return None
+            state = _ShardState(self.__free_shards.pop())
+        weakref.finalize(state, self.__release_shard, state.shard)
+        return state
+
+    def __release_shard(self, shard):
+        with self.__shard_lock:
+            self.__free_shards.append(shard)
+
+    def __refill(self, state):
+        current_time_tick = self.__get_current_time_tick()
+        time_tick = max(current_time_tick, self.__last_time_ticks[state.shard] + 1)
+        if time_tick - current_time_tick > self.max_ahead:
+            time.sleep((time_tick - current_time_tick - self.max_ahead) / 1000)
+        self.__last_time_ticks[state.shard] = time_tick
+        base = (
+            (time_tick << self.__timestamp_shift)
+            + (self.worker_id << self.seq_bit_length)
+            + (state.shard << self.local_bit_length)
+        )
+        state.buffer = iter(range(base, base + self.__block_size))
+
+    def __take(self, state, count):
+        ids = list(itertools.islice(state.buffer, count))
+        while len(ids) < count:
+            self.__refill(state)
+            ids.extend(itertools.islice(state.buffer, count - len(ids)))
+        return ids
+
+    def __state(self):
+        state = getattr(self.__local, "state", None)
+        if state is None:
+            state = self.__local.state = self.__acquire_state() or self.__shared_state
+        return state
+
+    def last_time_tick(self) -> int:
+        return max(self.__last_time_ticks)
+
+    def next_ids(self, count) -> list:
+        state = self.__state()
+        if state is self.__shared_state:
+            with self.__shared_lock:
+                return self.__take(state, count)
+        return self.__take(state, count)
+
+    def next_id(self) -> int:
+        state = self.__state()
+        if state is self.__shared_state:
+            with self.__shared_lock:
+                return self.__take(state, 1)[0]
+        nextid = next(state.buffer, None)
+        if nextid is None:
+            self.__refill(state)
+            nextid = next(state.buffer)
+        return nextid
@@ -28,7 +28,10 @@ from openai import OpenAI
 from rest_framework_extensions.key_constructor.constructors import \
     DefaultKeyConstructor
 
+from utils.http_client import http
 from utils.OSS.tooss import Tooss
+from utils.quota.ledger import (FAMILY_PACKAGE, FAMILY_UNIVERSAL,
+                                BalanceLedger)
 from utils.sql_oper import MysqlOper
 
 
@@ -202,47 +205,30 @@ class gadgets(object):
                         json.loads(product_tokens)["price"]
                     ) * Decimal(quantity)
 
-                    # 直接存储通用流量包的总价格和有效期到 Redis
+                    # 直接存储通用流量包的总价格和有效期到 Redis 账本
                     r_usage = get_redis_connection("usage")
-                    package_key = (
-                        f"universal_package:{user_id}:{id_to_update}:{order_id}"
-                    )
-                    r_usage.hmset(
-                        package_key, {
-                            "total_price": str(
-                                int(total_price) * settings.POINTS_UNIT), "expire_at": str(expire_at), }, )
-                    r_usage.zadd(
-                        f"universal_packages:{user_id}:{id_to_update}",
-                        {package_key: str(expire_at)},
-                    )
-
-                    r_usage.incrbyfloat(
-                        f"total_price:{user_id}:{id_to_update}",
-                        int(total_price) * settings.POINTS_UNIT,
-                    )
-                    r_usage.incrbyfloat(
-                        f"total_price_origin:{user_id}:{id_to_update}",
+                    BalanceLedger.add_package(
+                        r_usage,
+                        FAMILY_UNIVERSAL,
+                        user_id,
+                        id_to_update,
+                        order_id,
                         int(total_price) * settings.POINTS_UNIT,
+                        expire_at,
                     )
                     sucess_count += 1
                 else:
                     count = int(r_config.get(f"config:{id_to_update}"))
 
                     r_usage = get_redis_connection("usage")
-
-                    package_key = f"package:{user_id}:{id_to_update}:{order_id}"
-                    r_usage.hmset(
-                        package_key, {
-                            "count": count, "expire_at": str(expire_at)})
-                    r_usage.zadd(
-                        f"packages:{user_id}:{id_to_update}",
-                        {package_key: str(expire_at)},
-                    )
-
-                    r_usage.incrbyfloat(
-                        f"total_count:{user_id}:{id_to_update}", count)
-                    r_usage.incrbyfloat(
-                        f"total_count_origin:{user_id}:{id_to_update}", count
+                    BalanceLedger.add_package(
+                        r_usage,
+                        FAMILY_PACKAGE,
+                        user_id,
+                        id_to_update,
+                        order_id,
+                        count,
+                        expire_at,
                     )
                     sucess_count += 1
             except Exception:
@@ -266,7 +252,7 @@ class gadgets(object):
                 "amount": amount,
                 "is_upgrade": is_upgrade,
             }
-            response = requests.post(url=api_pay_commission, data=data)
+            response = http.post(url=api_pay_commission, data=data)
 
             print(response.text)
             content = response.json()
@@ -284,7 +270,7 @@ class gadgets(object):
         try:
             api_upgrade_distribution_level = settings.UPGRADE_DISTRIBUTION_LEVEL
             data = {"user_code": user_id, "level_type": "2"}
-            response = requests.post(
+            response = http.post(
                 url=api_upgrade_distribution_level, data=data)
             print(response.text)
             content = response.json()
@@ -325,12 +311,11 @@ class gadgets(object):
     @staticmethod
     def user_rest_value_redis(prod_id, user_id, prod_cate_id, r_connect):
         if int(prod_cate_id) == 6:
-
-            key = f"total_price:{user_id}:{prod_id}"
+            family = FAMILY_UNIVERSAL
         else:
-            key = f"total_count:{user_id}:{prod_id}"
+            family = FAMILY_PACKAGE
 
-        value = r_connect.get(key)
+        value = BalanceLedger.rest_value(r_connect, family, user_id, prod_id)
         return str(value) if value else "0"
 
     @staticmethod
@@ -456,7 +441,7 @@ class gadgets(object):
         if int(prod_id) != 43:
             return True
 
-        response = requests.post(
+        response = http.post(
             data={
                 'user_code': user_id
             },
@@ -502,7 +487,7 @@ class gadgets(object):
                 else:
                     form_data = {"voice_code": live_code}
                     print(settings.SUBMIT_VOICE)
-                    call_submit_customized_voice = requests.put(
+                    call_submit_customized_voice = http.put(
                         url=settings.SUBMIT_VOICE, data=form_data
                     )
                     if call_submit_customized_voice.status_code == 200:
@@ -535,7 +520,7 @@ class gadgets(object):
     def download_file(url, save_path):
 
         try:
-            response = requests.get(url, stream=True)
+            response = http.get(url, stream=True)
             response.raise_for_status()  # 检查请求是否成功
 
             with open(save_path, "wb") as f:
@@ -583,7 +568,7 @@ class gadgets(object):
                 "user_id": user_id,
                 "scene": scene,
                 "hashrate": hashrate}
-            response = requests.put(url=req_url, data=req_data)
+            response = http.put(url=req_url, data=req_data)
 
             if response.status_code == 200:
                 res_data = json.loads(response.text)
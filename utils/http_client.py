@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 22:50
+# @Author  : payne
+# @File    : http_client.py
+# @Description : 出站 HTTP 客户端, 所有对外请求(计费、分销、支付渠道、OSS 下载等)统一经过这里
+#
+# - 进程内共享一个 Session, 按 host 维护 keep-alive 连接池
+# - 默认连接/读取超时, 单次调用可覆盖
+# - 只读方法(GET/HEAD/OPTIONS)在连接失败或 502/503/504 时重试, 重试受每个上游的预算限制;
+#   计费、分销等写接口默认不重试, 可安全重试的调用自行传入 retries
+# - 每个上游一个熔断器, 连续失败达到阈值后在冷却期内直接失败, 冷却结束放行一个试探请求
+# - 每个上游记录耗时直方图, http.stats() 查看
+#
+# 用法: from utils.http_client import http
+#       response = http.post(url, data=data)
+import bisect
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("view")
+
+# 耗时直方图上界(毫秒), 最后一个桶为超过 10s
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+RETRY_STATUS = frozenset((502, 503, 504))
+
+
+class UpstreamUnavailable(requests.exceptions.ConnectionError):
+    """
+    熔断打开期间的请求直接抛出, 调用方原有的 RequestException/Exception 处理保持有效
+    """
+
+
+class Upstream(object):
+    """
+    单个上游(host:port)的熔断、重试预算与耗时统计
+    """
+
+    def __init__(self, name, failure_threshold, cooldown, retry_ratio, retry_burst):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.retry_ratio = retry_ratio
+        self.retry_burst = retry_burst
+
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        # 每个请求存入 retry_ratio, 每次重试消耗 1, 上限 retry_burst
+        self.retry_tokens = float(retry_burst)
+
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            self.retry_tokens = min(
+                self.retry_tokens + self.retry_ratio, self.retry_burst)
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self.probing:
+                return False
+            # 半开, 只放行一个试探请求
+            self.probing = True
+            return True
+
+    def take_retry(self):
+        with self._lock:
+            if self.retry_tokens >= 1:
+                self.retry_tokens -= 1
+                return True
+            return False
+
+    def record(self, elapsed_ms, ok):
+        with self._lock:
+            self.calls += 1
+            self.total_ms += elapsed_ms
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed_ms)] += 1
+            if ok:
+                if self.opened_at is not None:
+                    logger.warning("upstream %s recovered", self.name)
+                self.failures = 0
+                self.opened_at = None
+                self.probing = False
+                return
+
+            self.errors += 1
+            self.failures += 1
+            if self.probing or (
+                    self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    logger.error(
+                        "upstream %s circuit opened after %s failures", self.name, self.failures)
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_ms": round(self.total_ms / self.calls, 2) if self.calls else 0,
+                "open": self.opened_at is not None,
+                "histogram": {
+                    (f"<={bound}ms" if bound else f">{LATENCY_BUCKETS[-1]}ms"): count
+                    for bound, count in zip(LATENCY_BUCKETS + (None,), self.buckets)
+                },
+            }
+
+
+class HttpClient(object):
+    def __init__(self, pool_size=None):
+        """
+        :param pool_size: 每个 host 的最大连接数, 默认取 HTTP_POOL_SIZE
+        """
+        self.pool_size = pool_size or getattr(settings, "HTTP_POOL_SIZE", 20)
+        self.timeout = (
+            getattr(settings, "HTTP_CONNECT_TIMEOUT", 3),
+            getattr(settings, "HTTP_READ_TIMEOUT", 30),
+        )
+        self.max_retries = getattr(settings, "HTTP_MAX_RETRIES", 2)
+        self.upstreams = {}
+        self._lock = threading.Lock()
+
+        self.session = requests.Session()
+        # pool_connections 为缓存的 host 连接池个数, pool_maxsize 为每个 host 的连接数
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=self.pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def upstream(self, url):
+        parts = urlsplit(url)
+        name = parts.netloc or parts.path
+        upstream = self.upstreams.get(name)
+        if upstream is None:
+            with self._lock:
+                upstream = self.upstreams.get(name)
+                if upstream is None:
+                    upstream = self.upstreams[name] = Upstream(
+                        name,
+                        failure_threshold=getattr(settings, "HTTP_BREAKER_FAILURES", 5),
+                        cooldown=getattr(settings, "HTTP_BREAKER_COOLDOWN", 30),
+                        retry_ratio=getattr(settings, "HTTP_RETRY_RATIO", 0.1),
+                        retry_burst=getattr(settings, "HTTP_RETRY_BURST", 10),
+                    )
+        return upstream
+
+    def request(self, method, url, timeout=None, retries=None, **kwargs):
+        """
+        参数与 requests.request 一致
+        :param timeout: 默认 (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        :param retries: 最大重试次数, 只读方法默认 HTTP_MAX_RETRIES, 其余默认不重试
+        """
+        method = method.upper()
+        upstream = self.upstream(url)
+        if retries is None:
+            retries = self.max_retries if method in SAFE_METHODS else 0
+
+        attempt = 0
+        while True:
+            if not upstream.allow():
+                raise UpstreamUnavailable(f"upstream {upstream.name} circuit open")
+
+            start = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                upstream.record((time.perf_counter() - start) * 1000, False)
+                if attempt < retries and upstream.take_retry():
+                    attempt += 1
+                    continue
+                raise
+
+            failed = response.status_code >= 500
+            upstream.record((time.perf_counter() - start) * 1000, not failed)
+            if (response.status_code in RETRY_STATUS and attempt < retries
+                    and upstream.take_retry()):
+                attempt += 1
+                response.close()
+                continue
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self):
+        """
+        :return: {上游: {"calls", "errors", "avg_ms", "open", "histogram"}}
+        """
+        return {name: upstream.snapshot() for name, upstream in list(self.upstreams.items())}
+
+
+class LazyHttpClient(object):
+    # 首次使用时创建, 导入本模块时不读取 django 配置
+    _client = None
+    _lock = threading.Lock()
+
+    def __getattr__(self, name):
+        client = LazyHttpClient._client
+        if client is None:
+            with LazyHttpClient._lock:
+                client = LazyHttpClient._client
+                if client is None:
+                    client = LazyHttpClient._client = HttpClient()
+        return getattr(client, name)
+
+
+http = LazyHttpClient()
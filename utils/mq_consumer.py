@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 02:40
+# @Author  : payne
+# @File    : mq_consumer.py
+# @Description : RabbitMQ 并发消费, 回调在线程池或进程池中执行, 确认统一回到 I/O 线程
+#
+# - basic_qos(prefetch_count) 限制未确认消息数, 同时也是线程池/进程池的排队上限
+# - pika 连接只在 I/O 线程(调用 run 的线程)上使用, 工作线程的 ack/nack/reject
+#   经 add_callback_threadsafe 交给 I/O 线程执行
+# - thread 模式: 回调签名与 bin_func 相同 (ch, method, properties, body), ch 为线程安全的代理;
+#   回调未自行确认时, 正常返回则确认, 抛出异常则拒绝(requeue_on_error 决定是否重新排队)
+# - process 模式: 回调为模块级函数 callback(body), 在子进程中执行, 由运行时确认或拒绝
+# - stop() 后取消订阅, 等待已分发的消息处理完(最多 shutdown_timeout 秒)再关闭连接,
+#   未确认的消息由 broker 重新投递
+import functools
+import logging
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from utils.mq_utils import RabbitMqUtil
+
+logger = logging.getLogger("django")
+
+POOL_TYPES = ("thread", "process")
+
+
+class DeliveryChannel(object):
+    """
+    单条消息的通道代理, 交给工作线程中的回调使用
+    """
+
+    def __init__(self, connection, channel, delivery_tag):
+        # 确认只能在收到消息的连接上执行, 重连后旧消息的确认直接放弃
+        self._connection = connection
+        self._channel = channel
+        self.delivery_tag = delivery_tag
+        self.settled = False
+
+    def schedule(self, func, **kwargs):
+        """
+        在 I/O 线程上执行 func; 连接已断开时放弃, 消息由 broker 重新投递
+        """
+        def settle():
+            # 在 I/O 线程上再检查一次, 通道已关闭时不再确认
+            if self._channel.is_open:
+                func(**kwargs)
+            else:
+                logger.error(f"mq channel closed, delivery {self.delivery_tag} left to redeliver")
+
+        try:
+            if self._connection.is_open:
+                self._connection.add_callback_threadsafe(settle)
+                return
+        except Exception as exe:
+            logger.error(f"schedule on mq connection failed: {exe!r}")
+        logger.error(f"mq connection closed, delivery {self.delivery_tag} left to redeliver")
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.settled = True
+        self.schedule(self._channel.basic_ack, delivery_tag=delivery_tag, multiple=multiple)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self.settled = True
+        self.schedule(
+            self._channel.basic_nack, delivery_tag=delivery_tag, multiple=multiple, requeue=requeue)
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.settled = True
+        self.schedule(self._channel.basic_reject, delivery_tag=delivery_tag, requeue=requeue)
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+
+class MqConsumerRuntime(object):
+    def __init__(self, data, workers=None, prefetch=None, pool="thread", requeue_on_error=False,
+                 shutdown_timeout=None):
+        """
+        :param data: 与 RabbitMqUtil.bin_handle 相同, 包含 type/queue/exchange/routing_key/callback/delay
+        :param workers: 线程数或进程数, 默认 CPU 核数
+        :param prefetch: 预取数, 默认 workers 的 2 倍
+        :param pool: thread 或 process
+        """
+        if pool not in POOL_TYPES:
+            raise Exception("无此并发类型")
+        mq_cls = RabbitMqUtil.bin_param.get(data.get("type"))
+        if not mq_cls:
+            raise Exception("无此类型")
+        self.mq_cls = mq_cls
+        self.data = data
+        self.callback = data.get("callback")
+        self.workers = workers or os.cpu_count() or 1
+        self.prefetch = prefetch or self.workers * 2
+        self.pool = pool
+        self.requeue_on_error = requeue_on_error
+        self.shutdown_timeout = shutdown_timeout or getattr(settings, "MQ_SHUTDOWN_TIMEOUT", 30)
+
+        self.connection = None
+        self.executor = None
+        self.counters = {"received": 0, "acked": 0, "rejected": 0}
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        # 只设置标志, 可以在信号处理函数中调用
+        self._stopping.set()
+
+    @property
+    def is_stop(self):
+        return self._stopping.is_set()
+
+    def _executor(self):
+        if self.executor is None:
+            if self.pool == "process":
+                # 子进程 fork 时不继承数据库连接
+                connections.close_all()
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="mq-consumer")
+        return self.executor
+
+    def _call(self, proxy, method, properties, body):
+        try:
+            return self.callback(proxy, method, properties, body)
+        finally:
+            close_old_connections()
+
+    def _on_message(self, channel, method, properties, body):
+        proxy = DeliveryChannel(channel.connection, channel, method.delivery_tag)
+        with self._lock:
+            self._inflight += 1
+            self.counters["received"] += 1
+        try:
+            if self.pool == "process":
+                future = self._executor().submit(self.callback, body)
+            else:
+                future = self._executor().submit(self._call, proxy, method, properties, body)
+        except Exception:
+            with self._lock:
+                self._inflight -= 1
+            raise
+        future.add_done_callback(functools.partial(self._done, proxy))
+
+    def _done(self, proxy, future):
+        try:
+            if future.cancelled() or proxy.settled:
+                return
+            error = future.exception()
+            if error is None:
+                proxy.basic_ack(delivery_tag=proxy.delivery_tag)
+                key = "acked"
+            else:
+                logger.error("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+                proxy.basic_reject(delivery_tag=proxy.delivery_tag, requeue=self.requeue_on_error)
+                key = "rejected"
+            with self._lock:
+                self.counters[key] += 1
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def _drain(self):
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self._inflight and time.monotonic() < deadline:
+            self.connection.process_data_events(time_limit=0.2)
+        # 处理最后一批确认
+        self.connection.process_data_events(time_limit=0)
+        if self._inflight:
+            logger.error(f"mq consumer stopped with {self._inflight} deliveries unacked")
+
+    def run(self):
+        """
+        阻塞消费直到 stop(); 连接异常时抛出, 由调用方重连
+        """
+        # 执行器在建立 mq 连接之前创建, 进程池创建前已关闭数据库连接
+        self._executor()
+        mq_obj = self.mq_cls()
+        queue = mq_obj.declare(self.data)
+        channel = mq_obj.channel
+        self.connection = mq_obj.connection
+        try:
+            channel.basic_qos(prefetch_count=self.prefetch)
+            consumer_tag = channel.basic_consume(queue, self._on_message, auto_ack=False)
+            logger.info(
+                f"mq consumer on {queue}: pool={self.pool} workers={self.workers} prefetch={self.prefetch}")
+            while not self._stopping.is_set():
+                self.connection.process_data_events(time_limit=1)
+
+            channel.basic_cancel(consumer_tag)
+            self._drain()
+        finally:
+            if self.connection.is_open:
+                self.connection.close()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, inflight=self._inflight)
@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 02:10
+# @Author  : payne
+# @File    : mq_producer.py
+# @Description : RabbitMQ 发布连接池, mq_utils 的 send_func/send_handle 统一经过这里
+#
+# - 进程内最多 MQ_POOL_SIZE 个长连接, 按需创建; BlockingConnection 不是线程安全的,
+#   每个连接同一时间只借给一个线程
+# - 每个连接一个 confirm 通道, 单条发布等待 broker 确认, 被拒绝(nack)时抛出 NackError
+# - 批量发布走同一连接上的事务通道, 整批一次 tx_commit
+# - 交换机在每个连接上只声明一次
+# - 连接断开时丢弃该连接, 新建连接后重试一次; 断开发生在 broker 收到消息之后时消息可能重复(至少一次)
+# - 空闲超过 MQ_IDLE_CHECK 秒的连接借出前先处理一次心跳, 失效的直接重建
+#
+# 用法: from utils.mq_producer import producer
+#       producer.publish(exchange, routing_key, body)
+import logging
+import os
+import queue
+import threading
+import time
+
+import pika
+from django.conf import settings
+
+logger = logging.getLogger("django")
+
+
+def connection_parameters(alias="ty", **kwargs):
+    """
+    :param kwargs: 追加的 pika.ConnectionParameters 参数, 如 heartbeat
+    """
+    mq_config = settings.MQ[alias]
+    credentials = pika.PlainCredentials(mq_config.get("USER"), mq_config.get("PASSWORD"))
+    return pika.ConnectionParameters(
+        host=mq_config.get("HOST"),
+        port=mq_config.get("PORT"),
+        virtual_host=mq_config.get("vhost"),
+        credentials=credentials,
+        **kwargs
+    )
+
+
+class ProducerPoolExhausted(pika.exceptions.AMQPConnectionError):
+    """
+    等待 MQ_POOL_TIMEOUT 秒仍没有空闲连接
+    """
+
+
+class PooledConnection(object):
+    """
+    一个长连接, confirm 通道用于单条发布, 事务通道在首次批量发布时创建
+    """
+
+    def __init__(self, parameters):
+        self.connection = pika.BlockingConnection(parameters)
+        self.channel = self.connection.channel()
+        self.channel.confirm_delivery()
+        self.tx_channel = None
+        self.declared = set()
+        self.used_at = time.monotonic()
+
+    def declare(self, exchange, exchange_type, durable):
+        if not exchange or not exchange_type:
+            return
+        key = (exchange, exchange_type, durable)
+        if key not in self.declared:
+            self.channel.exchange_declare(
+                exchange=exchange, exchange_type=exchange_type, durable=durable)
+            self.declared.add(key)
+
+    def publish(self, message):
+        self.declare(message["exchange"], message.get("exchange_type"), message.get("durable", True))
+        self.channel.basic_publish(
+            exchange=message["exchange"],
+            routing_key=message["routing_key"],
+            body=message["body"],
+            properties=message.get("properties"),
+        )
+
+    def publish_many(self, messages):
+        for message in messages:
+            self.declare(message["exchange"], message.get("exchange_type"), message.get("durable", True))
+        if self.tx_channel is None or not self.tx_channel.is_open:
+            self.tx_channel = self.connection.channel()
+            self.tx_channel.tx_select()
+        for message in messages:
+            self.tx_channel.basic_publish(
+                exchange=message["exchange"],
+                routing_key=message["routing_key"],
+                body=message["body"],
+                properties=message.get("properties"),
+            )
+        self.tx_channel.tx_commit()
+
+    def alive(self):
+        if not self.connection.is_open or not self.channel.is_open:
+            return False
+        try:
+            self.connection.process_data_events(time_limit=0)
+        except pika.exceptions.AMQPError:
+            return False
+        return True
+
+    def close(self):
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except Exception as exe:
+            logger.error(f"close mq connection failed: {exe}")
+
+
+class MqProducer(object):
+    def __init__(self, alias="ty", pool_size=None):
+        """
+        :param pool_size: 最大连接数, 默认取 MQ_POOL_SIZE
+        """
+        self.parameters = connection_parameters(
+            alias,
+            heartbeat=getattr(settings, "MQ_HEARTBEAT", 60),
+            blocked_connection_timeout=getattr(settings, "MQ_BLOCKED_TIMEOUT", 30),
+        )
+        self.pool_size = pool_size or getattr(settings, "MQ_POOL_SIZE", 4)
+        self.pool_timeout = getattr(settings, "MQ_POOL_TIMEOUT", 5)
+        self.idle_check = getattr(settings, "MQ_IDLE_CHECK", 30)
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # fork 后父进程的连接不能复用, 直接丢弃
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self.counters = {"published": 0, "batches": 0, "connects": 0, "reconnects": 0, "failures": 0}
+
+    def _connect(self):
+        pooled = PooledConnection(self.parameters)
+        with self._lock:
+            self.counters["connects"] += 1
+        return pooled
+
+    def _discard(self, pooled):
+        pooled.close()
+        with self._lock:
+            self._created -= 1
+
+    def _checkout(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+        try:
+            pooled = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                pooled = self._idle.get(timeout=self.pool_timeout)
+            except queue.Empty:
+                raise ProducerPoolExhausted(f"no idle mq connection in {self.pool_timeout}s")
+
+        if time.monotonic() - pooled.used_at > self.idle_check and not pooled.alive():
+            self._discard(pooled)
+            with self._lock:
+                self._created += 1
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return pooled
+
+    def _checkin(self, pooled):
+        pooled.used_at = time.monotonic()
+        self._idle.put(pooled)
+
+    def _run(self, func):
+        for attempt in range(2):
+            pooled = self._checkout()
+            try:
+                result = func(pooled)
+            except pika.exceptions.AMQPConnectionError as exe:
+                self._discard(pooled)
+                with self._lock:
+                    self.counters["reconnects" if attempt == 0 else "failures"] += 1
+                if attempt:
+                    raise
+                logger.error(f"mq connection lost, reconnect and retry: {exe!r}")
+                continue
+            except (pika.exceptions.NackError, pika.exceptions.UnroutableError):
+                # 通道仍可用, 消息被 broker 拒绝
+                self._checkin(pooled)
+                with self._lock:
+                    self.counters["failures"] += 1
+                raise
+            except Exception:
+                # 通道被 broker 关闭(如交换机参数不一致)或状态未知, 连接不再复用
+                self._discard(pooled)
+                with self._lock:
+                    self.counters["failures"] += 1
+                raise
+            self._checkin(pooled)
+            return result
+
+    def publish(self, exchange, routing_key, body, properties=None, exchange_type=None, durable=True):
+        """
+        发布一条消息并等待 broker 确认
+        :param exchange_type: 传入时先声明交换机(每个连接一次)
+        """
+        self._run(lambda pooled: pooled.publish({
+            "exchange": exchange,
+            "routing_key": routing_key,
+            "body": body,
+            "properties": properties,
+            "exchange_type": exchange_type,
+            "durable": durable,
+        }))
+        with self._lock:
+            self.counters["published"] += 1
+
+    def publish_many(self, messages):
+        """
+        批量发布, 一次事务提交
+        :param messages: [{"exchange", "routing_key", "body", "properties", "exchange_type", "durable"}]
+        """
+        if not messages:
+            return
+        self._run(lambda pooled: pooled.publish_many(messages))
+        with self._lock:
+            self.counters["published"] += len(messages)
+            self.counters["batches"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, open=self._created, idle=self._idle.qsize())
+
+
+class LazyMqProducer(object):
+    # 首次使用时创建, 导入本模块时不读取 django 配置
+    _producer = None
+    _lock = threading.Lock()
+
+    def __getattr__(self, name):
+        producer = LazyMqProducer._producer
+        if producer is None:
+            with LazyMqProducer._lock:
+                producer = LazyMqProducer._producer
+                if producer is None:
+                    producer = LazyMqProducer._producer = MqProducer()
+        return getattr(producer, name)
+
+
+producer = LazyMqProducer()
@@ -12,23 +12,17 @@ import traceback
 from datetime import datetime
 
 import pika
-from django.conf import settings
+
+from utils.mq_producer import connection_parameters, producer
 
 logger = logging.getLogger("django")
 
 
 class RabbitMqObj:
     def __init__(self):
-        mq_config = settings.MQ["ty"]
-        user = mq_config.get("USER")
-        password = mq_config.get("PASSWORD")
-        host = mq_config.get("HOST")
-        port = mq_config.get("PORT")
-        vhost = mq_config.get("vhost")
-        credentials = pika.PlainCredentials(user, password)
-        self.connection = pika.BlockingConnection(pika.ConnectionParameters(
-            host=host, port=port, virtual_host=vhost, credentials=credentials))
-        self.channel = self.connection.channel()
+        # 连接在消费端(bin_func)首次使用时建立, 发布统一走 mq_producer 连接池
+        self.connection = None
+        self._channel = None
         self.queue_durable = True  # 管道持久化 True为开启 Fale为不持久化
         self.exchange_durable = True  # 交换机持久化 True为开启 Fale为不持久化
         self.auto_ack = False  # 应答模式 True为自动应答 Fale为手动确认
@@ -36,6 +30,13 @@ class RabbitMqObj:
             delivery_mode=2
         )  # delivery_mode = 2 声明消息在队列中持久化，delivery_mod = 1 消息非持久化
 
+    @property
+    def channel(self):
+        if self._channel is None:
+            self.connection = pika.BlockingConnection(connection_parameters())
+            self._channel = self.connection.channel()
+        return self._channel
+
     def set_queue_durable(self, durable_bool: bool):
         # 管道持久化 True为开启Fale为不持久化
         self.queue_durable = durable_bool
@@ -73,12 +74,33 @@ class RabbitMqObj:
     def send_vail(self, *args, **kwargs):
         pass
 
-    def bin_func(self, *args, **kwargs):
+    def declare(self, data):
+        """
+        声明队列(及交换机、绑定)
+        :return: 队列名
+        """
         pass
 
-    def send_func(self, *args, **kwargs):
+    def bin_func(self, data):
+        queue = self.declare(data)
+        # 每次最多预取 prefetch 条未确认的消息, 未设置时不限制
+        prefetch = data.get("prefetch")
+        if prefetch:
+            self.channel.basic_qos(prefetch_count=prefetch)
+        # 告诉rabbitmq，用callback来接收消息
+        self.channel.basic_consume(queue, data.get("callback"), auto_ack=self.auto_ack)
+        # 开始接收信息，并进入阻塞状态，队列里有信息才会调用callback进行处理
+        self.channel.start_consuming()
+
+    def message(self, data):
+        """
+        :return: producer.publish 的参数
+        """
         pass
 
+    def send_func(self, data):
+        producer.publish(**self.message(data))
+
 
 class RabbitMqConsumer(RabbitMqObj):
     # 生产者，消费者模式
@@ -105,11 +127,10 @@ class RabbitMqConsumer(RabbitMqObj):
         if not msg:
             raise Exception("msg")
 
-    def bin_func(self, data):
+    def declare(self, data):
         # 参数校验
         self.bin_vail(data)
         queue = data.get("queue")
-        callback = data.get("callback")
         delay = data.get("delay")
         # 死信设置
         arguments = self.set_delay(delay)
@@ -117,21 +138,17 @@ class RabbitMqConsumer(RabbitMqObj):
         result = self.channel.queue_declare(
             queue=queue, durable=self.queue_durable, arguments=arguments
         )
-        # 告诉rabbitmq，用callback来接收消息
-        self.channel.basic_consume(
-            result.method.queue, callback, auto_ack=self.auto_ack
-        )
-        # 开始接收信息，并进入阻塞状态，队列里有信息才会调用callback进行处理
-        self.channel.start_consuming()
+        return result.method.queue
 
-    def send_func(self, data):
+    def message(self, data):
         # 参数校验
         self.send_vail(data)
-        queue = data.get("queue")
-        msg = json.dumps(data.get("msg"))
         # 投入管道
-        self.channel.basic_publish(exchange="", routing_key=queue, body=msg)
-        self.connection.close()
+        return {
+            "exchange": "",
+            "routing_key": data.get("queue"),
+            "body": json.dumps(data.get("msg")),
+        }
 
 
 class RabbitMqFanout(RabbitMqObj):
@@ -163,16 +180,14 @@ class RabbitMqFanout(RabbitMqObj):
         if not msg:
             raise Exception("msg")
 
-    def bin_func(self, data):
+    def declare(self, data):
         # 校验
         self.bin_vail(data)
         queue = data.get("queue")
-        callback = data.get("callback")
         exchange = data.get("exchange")
         delay = data.get("delay")
         # 死信设置
         arguments = self.set_delay(delay)
-        print(arguments)
         # 声明队列
         result = self.channel.queue_declare(
             queue=queue, durable=self.queue_durable, arguments=arguments
@@ -184,28 +199,19 @@ class RabbitMqFanout(RabbitMqObj):
             exchange_type="fanout")
         # 交换机和管道绑定
         self.channel.queue_bind(exchange=exchange, queue=result.method.queue)
-        # 管道和方法绑定
-        self.channel.basic_consume(
-            result.method.queue, callback, auto_ack=self.auto_ack
-        )
-        self.channel.start_consuming()
+        return result.method.queue
 
-    def send_func(self, data):
+    def message(self, data):
         self.send_vail(data)
-        exchange = data.get("exchange")
-        msg = json.dumps(data.get("msg"))
-        # 声明
-        self.channel.exchange_declare(
-            exchange=exchange,
-            durable=self.exchange_durable,
-            exchange_type="fanout")
-        # 消息投掷到交换机
-        self.channel.basic_publish(
-            exchange=exchange,
-            routing_key="",
-            body=msg,
-            properties=self.properties)
-        self.connection.close()
+        # 消息投掷到交换机, 交换机由连接池声明
+        return {
+            "exchange": data.get("exchange"),
+            "routing_key": "",
+            "body": json.dumps(data.get("msg")),
+            "properties": self.properties,
+            "exchange_type": "fanout",
+            "durable": self.exchange_durable,
+        }
 
 
 class RabbitMqDirect(RabbitMqObj):
@@ -245,11 +251,10 @@ class RabbitMqDirect(RabbitMqObj):
         if not msg:
             raise Exception("msg")
 
-    def bin_func(self, data):
+    def declare(self, data):
         # 校验
         self.bin_vail(data)
         queue = data.get("queue")
-        callback = data.get("callback")
         exchange = data.get("exchange")
         routing_key = data.get("routing_key")
         type = data.get("type")
@@ -270,30 +275,19 @@ class RabbitMqDirect(RabbitMqObj):
             exchange=exchange,
             queue=result.method.queue,
             routing_key=routing_key)
-        self.channel.basic_consume(
-            result.method.queue, callback, auto_ack=self.auto_ack
-        )
-        self.channel.start_consuming()
+        return result.method.queue
 
-    def send_func(self, data):
+    def message(self, data):
         self.send_vail(data)
-        exchange = data.get("exchange")
-        routing_key = data.get("routing_key")
-        type = data.get("type")
-        msg = json.dumps(data.get("msg"))
-        # 声明
-        self.channel.exchange_declare(
-            exchange=exchange,
-            durable=self.exchange_durable,
-            exchange_type=type)
-        # 消息投掷到交换机
-        self.channel.basic_publish(
-            exchange=exchange,
-            routing_key=routing_key,
-            body=msg,
-            properties=self.properties,
-        )
-        self.connection.close()
+        # 消息投掷到交换机, 交换机由连接池声明
+        return {
+            "exchange": data.get("exchange"),
+            "routing_key": data.get("routing_key"),
+            "body": json.dumps(data.get("msg")),
+            "properties": self.properties,
+            "exchange_type": data.get("type"),
+            "durable": self.exchange_durable,
+        }
 
 
 class RabbitMqUtil(object):
@@ -328,6 +322,23 @@ class RabbitMqUtil(object):
         mq_obj = mq_obj()
         mq_obj.send_func(data)
 
+    def send_many_handle(self, data_list):
+        """
+        批量发布, 参数同 send_handle, 一次事务提交
+        """
+        if not data_list:
+            raise Exception("缺少参数")
+        messages = []
+        for data in data_list:
+            type = data.get("type")
+            if not type:
+                raise Exception("缺少类型")
+            mq_obj = self.bin_param.get(type)
+            if not mq_obj:
+                raise Exception("无此类型")
+            messages.append(mq_obj().message(data))
+        producer.publish_many(messages)
+
     def handel_error(self, fun):
         # 丢弃任务
         def wrapper(self, ch, method, properties, body):
@@ -13,6 +13,7 @@ import wrapt as wrapt
 from django.conf import settings
 from django.db import connection, connections
 from language.language_pack import RET, Language
+from utils.catalogue import Catalogue
 from utils.cst_class import CstException, CstResponse
 from utils.sql_oper import MysqlOper
 
@@ -41,14 +42,12 @@ class ValidateAmount(object):
         if int(prod_id) == 34:
             args[0].__dict__["validate_amount_pass"] = True
 
-        sql_check_price = f"SELECT  prod_price FROM {settings.DEFAULT_DB}.pp_products WHERE prod_id = {prod_id}"
-
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(sql_check_price)
-                query_data = MysqlOper.get_query_result(cursor)
-                prod_price = query_data[0].get("prod_price")
-                total_amount_check = Decimal(prod_price) * Decimal(quantity)
+            # 价格来自商品目录快照, 不查询数据库
+            prod_price = Catalogue.price(prod_id)
+            if prod_price is None:
+                raise ValueError(f"product {prod_id} not found")
+            total_amount_check = Decimal(prod_price) * Decimal(quantity)
 
         except Exception:
             code = RET.DB_ERR
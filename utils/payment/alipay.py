@@ -4,12 +4,13 @@ Date :
 Author :
 Desc :
 """
+import hashlib
 import json
 import logging
+import threading
 from base64 import decodebytes, encodebytes
 from datetime import datetime
-from urllib.parse import quote_plus
-from urllib.request import urlopen
+from urllib.parse import quote_plus, unquote_to_bytes
 
 from Crypto.Hash import SHA256
 from Crypto.PublicKey import RSA
@@ -17,10 +18,194 @@ from Crypto.Signature import PKCS1_v1_5
 
 from config import *
 from utils.exception import AliPayException, AliPayValidationError
+from utils.http_client import http
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+except ImportError:
+    serialization = None
 
 logger = logging.getLogger("views")
 
 
+class HashlibSHA256(object):
+    """
+    hashlib 的 SHA256, 补上 pycryptodome PKCS1_v1_5 验签用到的 oid
+    逐段 update 时比 Crypto.Hash.SHA256 的调用开销小
+    """
+
+    __slots__ = ("_hash",)
+
+    oid = SHA256.SHA256Hash.oid
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+
+    def update(self, data):
+        self._hash.update(data)
+
+    def digest(self):
+        return self._hash.digest()
+
+
+class AliPayKeys(object):
+    """
+    解析后的应用私钥/支付宝公钥及签名、验签对象, 按密钥文件路径在进程内缓存
+    安装了 cryptography 时签名和验签走 OpenSSL, 否则使用 pycryptodome 的 PKCS1_v1_5
+    """
+
+    _lock = threading.Lock()
+    _cache = {}
+
+    def __init__(self, private_pem, public_pem, fast=True):
+        self.app_private_key = RSA.importKey(private_pem)
+        self.alipay_public_key = RSA.importKey(public_pem)
+        # PKCS1_v1_5 对象只持有密钥, 可跨请求、跨线程复用
+        self.signer = PKCS1_v1_5.new(self.app_private_key)
+        self.verifier = PKCS1_v1_5.new(self.alipay_public_key)
+
+        self.private_key = self.public_key = None
+        if fast and serialization is not None:
+            self.private_key = serialization.load_der_private_key(
+                self.app_private_key.export_key(format="DER"), password=None)
+            self.public_key = serialization.load_der_public_key(
+                self.alipay_public_key.export_key(format="DER"))
+
+    @classmethod
+    def load(cls, private_key_path, public_key_path):
+        cache_key = (private_key_path, public_key_path)
+        keys = cls._cache.get(cache_key)
+        if keys is None:
+            with cls._lock:
+                keys = cls._cache.get(cache_key)
+                if keys is None:
+                    with open(private_key_path) as fp:
+                        private_pem = fp.read()
+                    with open(public_key_path) as fp:
+                        public_pem = fp.read()
+                    keys = cls._cache[cache_key] = cls(private_pem, public_pem)
+        return keys
+
+    def sign(self, message):
+        """
+        :param message: bytes
+        :return: RSA2(SHA256withRSA) 签名 bytes
+        """
+        if self.private_key is not None:
+            return self.private_key.sign(
+                message, padding.PKCS1v15(), hashes.SHA256())
+        return self.signer.sign(SHA256.new(message))
+
+    def verify(self, message, signature):
+        if self.public_key is not None:
+            try:
+                self.public_key.verify(
+                    signature, message, padding.PKCS1v15(), hashes.SHA256())
+                return True
+            except InvalidSignature:
+                return False
+        return self.verifier.verify(SHA256.new(message), signature)
+
+    def new_digest(self):
+        """
+        :return: 增量 SHA256 对象, 配合 verify_digest 使用
+        """
+        if self.public_key is not None:
+            return hashlib.sha256()
+        return HashlibSHA256()
+
+    def verify_digest(self, digest, signature):
+        """
+        :param digest: new_digest 返回并已写入待签名内容的对象
+        """
+        if self.public_key is not None:
+            try:
+                self.public_key.verify(
+                    signature, digest.digest(), padding.PKCS1v15(), Prehashed(hashes.SHA256()))
+                return True
+            except InvalidSignature:
+                return False
+        return self.verifier.verify(digest, signature)
+
+
+# base64 签名中会被编码的字符
+SIGN_ESCAPES = (
+    (b"%2B", b"+"), (b"%2b", b"+"),
+    (b"%2F", b"/"), (b"%2f", b"/"),
+    (b"%3D", b"="), (b"%3d", b"="),
+)
+
+
+def unquote_plus_bytes(value):
+    # 只含 + 的值(如时间)不经过逐字节解码
+    value = value.replace(b"+", b" ")
+    if b"%" in value:
+        value = unquote_to_bytes(value)
+    return value
+
+
+class AliPayNotify(object):
+    """
+    支付宝异步通知报文(application/x-www-form-urlencoded), 只解析一次
+    - 与 parse_qs 取值一致: 空值参数丢弃, 同名参数取第一个
+    - 验签时按参数名排序后把 k=v 直接写入增量摘要, 不拼接待签名字符串
+    """
+
+    __slots__ = ("fields",)
+
+    EXCLUDED = (b"sign", b"sign_type")
+
+    def __init__(self, body):
+        """
+        :param body: request.body
+        """
+        fields = self.fields = {}
+        for pair in body.split(b"&"):
+            key, _, value = pair.partition(b"=")
+            if not value:
+                continue
+            if b"%" in key or b"+" in key:
+                key = unquote_plus_bytes(key)
+            if key not in fields:
+                fields[key] = value
+
+    def get(self, name, default=None):
+        value = self.fields.get(name.encode("utf8"))
+        if value is None:
+            return default
+        return unquote_plus_bytes(value).decode("utf8", "replace")
+
+    def signature(self):
+        sign = self.fields.get(b"sign")
+        if not sign:
+            return None
+        sign = sign.replace(b"+", b" ")
+        for escaped, char in SIGN_ESCAPES:
+            sign = sign.replace(escaped, char)
+        if b"%" in sign:
+            sign = unquote_to_bytes(sign)
+        return decodebytes(sign)
+
+    def feed(self, digest):
+        """
+        把待签名内容写入摘要
+        """
+        # 每个参数一次 update, 未编码的值直接写入
+        separator = b""
+        for key in sorted(self.fields):
+            if key in self.EXCLUDED:
+                continue
+            value = self.fields[key]
+            if b"%" in value or b"+" in value:
+                value = unquote_plus_bytes(value)
+            digest.update(separator + key + b"=" + value)
+            separator = b"&"
+        return digest
+
+
 class AliPay(object):
     """
     支付宝支付接口
@@ -32,10 +217,9 @@ class AliPay(object):
 
         self.return_url = return_url
 
-        with open(app_private_key_path) as fp:
-            self.app_private_key = RSA.importKey(fp.read())
-        with open(alipay_public_key_path) as fp:
-            self.alipay_public_key = RSA.importKey(fp.read())
+        self.keys = AliPayKeys.load(app_private_key_path, alipay_public_key_path)
+        self.app_private_key = self.keys.app_private_key
+        self.alipay_public_key = self.keys.alipay_public_key
 
         # if debug is True:
         #     self.__gateway = "https://openapi.alipaydev.com/gateway.do"
@@ -147,7 +331,7 @@ class AliPay(object):
 
     def verified_sync_response(self, data, response_type):
         url = self.__gateway + "?" + self.sign_data(data)
-        raw_string = urlopen(url, timeout=10).read().decode()
+        raw_string = http.get(url).text
         return self._verify_and_return_sync_response(raw_string, response_type)
 
     def _verify_and_return_sync_response(self, raw_string, response_type):
@@ -251,26 +435,27 @@ class AliPay(object):
 
     def sign(self, unsigned_string):
         # 开始计算签名
-        key = self.app_private_key
-
-        signer = PKCS1_v1_5.new(key)
         logger.info(unsigned_string)
-        signature = signer.sign(SHA256.new(unsigned_string))
+        signature = self.keys.sign(unsigned_string)
 
         # base64 编码，转换为unicode表示并移除回车
         sign = encodebytes(signature).decode("utf8").replace("\n", "")
         return sign
 
     def _verify(self, raw_content, signature):
-        # 开始计算签名
-        key = self.alipay_public_key
-        signer = PKCS1_v1_5.new(key)
-        digest = SHA256.new()
-        digest.update(raw_content.encode("utf8"))
-
-        if signer.verify(digest, decodebytes(signature.encode("utf8"))):
-            return True
-        return False
+        # 开始验签
+        return self.keys.verify(
+            raw_content.encode("utf8"), decodebytes(signature.encode("utf8")))
+
+    def verify_notify(self, notify):
+        """
+        :param notify: AliPayNotify
+        """
+        signature = notify.signature()
+        if not signature:
+            return False
+        return self.keys.verify_digest(
+            notify.feed(self.keys.new_digest()), signature)
 
     def verify(self, data, signature):
         if "sign_type" in data:
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 22:10
+# @Author  : payne
+# @File    : wechat_codec.py
+# @Description : 微信支付 v2 接口的签名与 XML 编解码
+#
+# 输出与 wechat_pay 中原有的 get_sign / trans_dict_to_xml / trans_xml_to_dict 逐字节一致:
+# - 签名: 参数按名称排序, k=v 以 & 连接后追加 &key=API_KEY, MD5 大写; 空值同样参与签名
+# - XML: 按名称排序, 不转义, 只有 detail 包裹 CDATA
+import hashlib
+import secrets
+from xml.etree.ElementTree import fromstring
+
+
+def nonce_str(length=16):
+    """
+    :param length: 随机字符串长度, 微信要求不超过 32 位
+    """
+    return secrets.token_hex((length + 1) // 2)[:length]
+
+
+def _xml_value(k, v):
+    if k == "detail" and not v.startswith("<![CDATA["):
+        return f"<![CDATA[{v}]]>"
+    return v
+
+
+def _md5(signed, key):
+    return hashlib.md5(
+        ("&".join(signed) + "&key=" + key).encode("utf-8")).hexdigest().upper()
+
+
+def sign(params, key):
+    """
+    :param params: 不含 sign 的参数
+    :param key: 商户 API 密钥
+    :return: 大写 MD5 签名
+    """
+    # 字典键唯一, 按 (键, 值) 排序即按键排序
+    return _md5([f"{k}={v}" for k, v in sorted(params.items())], key)
+
+
+def encode(params):
+    """
+    参数转为 XML, 与 trans_dict_to_xml 相同
+    """
+    return "<xml>" + "".join([
+        f"<{k}>{_xml_value(k, v)}</{k}>" for k, v in sorted(params.items())
+    ]) + "</xml>"
+
+
+def encode_signed(params, key):
+    """
+    签名并序列化, 排序一次, 一次遍历同时生成待签名串和 XML
+    :param params: 不含 sign 的参数, 不会被修改
+    :return: (sign, xml)
+    """
+    signed = []
+    elements = []
+    sign_at = None
+    for k, v in sorted(params.items()):
+        if sign_at is None and k > "sign":
+            sign_at = len(elements)
+        signed.append(f"{k}={v}")
+        elements.append(f"<{k}>{_xml_value(k, v)}</{k}>")
+
+    signature = _md5(signed, key)
+    elements.insert(
+        len(elements) if sign_at is None else sign_at,
+        f"<sign>{signature}</sign>",
+    )
+    return signature, "<xml>" + "".join(elements) + "</xml>"
+
+
+def decode(data_xml):
+    """
+    :param data_xml: 响应或回调报文, bytes 或 str
+    :return: {标签: 文本}, 只取根节点的直接子节点
+    """
+    return {child.tag: child.text for child in fromstring(data_xml)}
+
+
+def verify(data, key):
+    """
+    校验回调/响应签名
+    :param data: decode 的结果, 含 sign
+    """
+    signature = data.get("sign")
+    if not signature:
+        return False
+    expected = _md5(
+        [f"{k}={v}" for k, v in sorted(data.items()) if k != "sign"], key)
+    return secrets.compare_digest(expected, signature)
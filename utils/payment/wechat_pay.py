@@ -4,10 +4,8 @@
 # Author : panxi
 # Desc : 微信支付配置
 # """
-import hashlib
 import logging
 import time
-from random import Random
 
 import requests
 from django.conf import settings
@@ -23,6 +21,8 @@ from config import *
 
 from language.language_pack import RET
 from utils.cst_class import CstException
+from utils.http_client import http
+from utils.payment import wechat_codec
 
 logger = logging.getLogger("views")
 
@@ -33,13 +33,7 @@ def random_str(randomlength=8):
     :param randomlength: 字符串长度
     :return:
     """
-    strs = ""
-    chars = "AaBbCcDdEeFfGgHhIiJjKkLlMmNnOoPpQqRrSsTtUuVvWwXxYyZz0123456789"
-    length = len(chars) - 1
-    random = Random()
-    for i in range(randomlength):
-        strs += chars[random.randint(0, length)]
-    return strs
+    return wechat_codec.nonce_str(randomlength)
 
 
 # 请求统一支付接口
@@ -72,11 +66,9 @@ def wxpay(
         params["openid"] = open_id
 
     print(f"wx_pay 调用参数 {params}")
-    sign = get_sign(params, API_KEY)  # 获取签名
-    params["sign"] = sign  # 添加签名到参数字典
-    xml = trans_dict_to_xml(params)  # 转换字典为XML
-    response = requests.request(
-        "post", UFDODER_URL, data=xml.encode()
+    _, xml = wechat_codec.encode_signed(params, API_KEY)  # 签名并转换为XML
+    response = http.post(
+        UFDODER_URL, data=xml.encode()
     )  # 以POST方式向微信公众平台服务器发起请求
     data_dict = trans_xml_to_dict(response.content)  # 将请求返回的数据转为字典
     return data_dict
@@ -89,16 +81,7 @@ def get_sign(data_dict, key):
     :param key: 密钥 ，即上面的API_KEY
     :return: 字符串
     """
-    params_list = sorted(
-        data_dict.items(), key=lambda e: e[0], reverse=False
-    )  # 参数字典倒排序为列表
-    params_str = "&".join("{}={}".format(k, v)
-                          for k, v in params_list) + "&key=" + key
-    # 组织参数字符串并在末尾添加商户交易密钥
-    md5 = hashlib.md5()  # 使用MD5加密模式
-    md5.update(params_str.encode("utf-8"))  # 将参数字符串传入
-    sign = md5.hexdigest().upper()  # 完成加密并转为大写
-    return sign
+    return wechat_codec.sign(data_dict, key)
 
 
 def trans_dict_to_xml(data_dict):
@@ -107,13 +90,7 @@ def trans_dict_to_xml(data_dict):
     :param data_dict:
     :return:
     """
-    data_xml = []
-    for k in sorted(data_dict.keys()):  # 遍历字典排序后的key
-        v = data_dict.get(k)  # 取出字典中key对应的value
-        if k == "detail" and not v.startswith("<![CDATA["):  # 添加XML标记
-            v = "<![CDATA[{}]]>".format(v)
-        data_xml.append("<{key}>{value}</{key}>".format(key=k, value=v))
-    return "<xml>{}</xml>".format("".join(data_xml))  # 返回XML
+    return wechat_codec.encode(data_dict)
 
 
 def trans_xml_to_dict(data_xml):
@@ -122,15 +99,7 @@ def trans_xml_to_dict(data_xml):
     :param data_xml:
     :return:
     """
-    data_dict = {}
-    try:
-        import xml.etree.cElementTree as ET
-    except ImportError:
-        import xml.etree.ElementTree as ET
-    root = ET.fromstring(data_xml)
-    for child in root:
-        data_dict[child.tag] = child.text
-    return data_dict
+    return wechat_codec.decode(data_xml)
 
 
 def get_openid(code):
@@ -142,7 +111,7 @@ def get_openid(code):
         "grant_type": "authorization_code",
     }
     logger.info(f"open_id params {params}")
-    res = requests.get(settings.XCX_AUTH, params=params)
+    res = http.get(settings.XCX_AUTH, params=params)
     if res.status_code == requests.codes.ok:
         res = res.json()
         openid = res.get("openid")
@@ -162,7 +131,7 @@ def get_jsapi_openid(code, appid, secret):
         "code": code,
         "grant_type": "authorization_code",
     }
-    res = requests.get(settings.MWEB_AUTH, params=params)
+    res = http.get(settings.MWEB_AUTH, params=params)
     if res.status_code == requests.codes.ok:
         res = res.json()
         openid = res.get("openid")
@@ -234,14 +203,13 @@ def query_payment_status(order_id, source):
         "out_trade_no": str(order_id),  # 订单编号
     }
 
-    sign = get_sign(params, API_KEY)  # 获取签名
-    params["sign"] = sign  # 添加签名到参数字典
-    xml = trans_dict_to_xml(params)  # 转换字典为XM
+    _, xml = wechat_codec.encode_signed(params, API_KEY)  # 签名并转换为XML
 
     print(f"query wechat payment {xml}")
 
-    response = requests.request(
-        "post", QUERY_URL, data=xml.encode()
+    # 查询接口可安全重试
+    response = http.post(
+        QUERY_URL, data=xml.encode(), timeout=10, retries=2
     )  # 以POST方式向微信公众平台服务器发起请求
     data_dict = trans_xml_to_dict(response.content)  # 将请求返回的数据转为字典
 
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 10:12
+# @Author  : payne
+# @File    : deduction.py
+# @Description : 流量包原子扣减, 通过 Lua 脚本在 Redis 端一次完成 选包/清理过期/扣减
+
+import time
+
+from utils.quota.ledger import (FAMILY_PACKAGE, FAMILY_UNIVERSAL,
+                                RECORD_FORMAT, ledger_key)
+
+# 账本记录解析, 格式见 utils.quota.ledger
+LUA_RECORD = """
+local function unpack_record(record)
+    return tonumber(string.sub(record, 1, 10)),
+        tonumber(string.sub(record, 11, 24)),
+        tonumber(string.sub(record, 25, 38))
+end
+local function pack_record(expire_at, rest, origin)
+    return string.format('%s', expire_at, rest, origin)
+end
+""" % RECORD_FORMAT
+
+# 次数流量包扣减
+# KEYS[1] ledger:package:{user_id}
+# ARGV[1] prod_id  ARGV[2] 消耗次数  ARGV[3] 当前时间戳
+# 返回 {1, 当前包剩余, 产品总剩余} 或 {0}
+LUA_CONSUME_PACKAGE = LUA_RECORD + """
+local prefix = ARGV[1] .. ':'
+local consumed = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local fields = redis.call('HGETALL', KEYS[1])
+local best_field, best_expire, best_rest, best_origin = nil, nil, nil, nil
+local total = 0
+for i = 1, #fields, 2 do
+    local field = fields[i]
+    if string.sub(field, 1, #prefix) == prefix then
+        local expire_at, rest, origin = unpack_record(fields[i + 1])
+        if expire_at < now or rest <= 0 then
+            redis.call('HDEL', KEYS[1], field)
+        else
+            total = total + rest
+            if best_expire == nil or expire_at < best_expire then
+                best_field, best_expire, best_rest, best_origin = field, expire_at, rest, origin
+            end
+        end
+    end
+end
+if best_field == nil then
+    return {0}
+end
+local rest = math.max(best_rest - consumed, 0)
+redis.call('HSET', KEYS[1], best_field, pack_record(best_expire, rest, best_origin))
+total = total - best_rest + rest
+return {1, tostring(rest), tostring(total)}
+"""
+
+# 通用流量包扣减, 在所有通用产品中选择最早过期且余额足够的包
+# KEYS[1] ledger:universal:{user_id}
+# ARGV[1] 消耗积分  ARGV[2] 当前时间戳  ARGV[3..] 参与扣减的 prod_id
+# 返回 {1, 命中产品, 当前包剩余, 产品总剩余} 或 {0}
+LUA_CONSUME_UNIVERSAL = LUA_RECORD + """
+local consumed = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local allowed = {}
+for i = 3, #ARGV do
+    allowed[ARGV[i]] = true
+end
+local fields = redis.call('HGETALL', KEYS[1])
+local best_field, best_prod, best_expire, best_rest, best_origin = nil, nil, nil, nil, nil
+local totals = {}
+for i = 1, #fields, 2 do
+    local field = fields[i]
+    local prod_id = string.match(field, '^(%d+):')
+    if prod_id and allowed[prod_id] then
+        local expire_at, rest, origin = unpack_record(fields[i + 1])
+        if expire_at < now or rest <= 1 then
+            redis.call('HDEL', KEYS[1], field)
+        else
+            totals[prod_id] = (totals[prod_id] or 0) + rest
+            if rest >= consumed and (best_expire == nil or expire_at < best_expire) then
+                best_field, best_prod, best_expire, best_rest, best_origin = field, prod_id, expire_at, rest, origin
+            end
+        end
+    end
+end
+if best_field == nil then
+    return {0}
+end
+local rest = best_rest - consumed
+redis.call('HSET', KEYS[1], best_field, pack_record(best_expire, rest, best_origin))
+return {1, best_prod, tostring(rest), tostring(totals[best_prod] - consumed)}
+"""
+
+_scripts = {}
+
+
+def _get_script(r_connect, name, source):
+    # 每个进程只注册一次, 之后走 EVALSHA, NOSCRIPT 时 redis-py 会自动重新加载
+    script = _scripts.get(name)
+    if script is None:
+        script = _scripts[name] = r_connect.register_script(source)
+    return script
+
+
+class QuotaDeduction(object):
+    @staticmethod
+    def consume_package(r_connect, user_id, prod_id, consumed, now=None):
+        """
+        扣减次数流量包
+        :param r_connect: usage redis 连接
+        :return: (是否扣减成功, 当前包剩余次数, 产品总剩余次数)
+        """
+        script = _get_script(r_connect, "consume_package", LUA_CONSUME_PACKAGE)
+        result = script(
+            keys=[ledger_key(FAMILY_PACKAGE, user_id)],
+            args=[prod_id, int(consumed), now or time.time()],
+            client=r_connect,
+        )
+        if not result or int(result[0]) == 0:
+            return False, 0, 0
+        return True, float(result[1]), float(result[2])
+
+    @staticmethod
+    def consume_universal(r_connect, user_id, prod_ids, consumed, now=None):
+        """
+        扣减通用流量包
+        :param prod_ids: 参与扣减的通用产品id 列表
+        :return: (是否扣减成功, 命中的产品id, 当前包剩余积分, 产品总剩余积分)
+        """
+        script = _get_script(
+            r_connect,
+            "consume_universal",
+            LUA_CONSUME_UNIVERSAL)
+        result = script(
+            keys=[ledger_key(FAMILY_UNIVERSAL, user_id)],
+            args=[int(consumed), now or time.time(), *prod_ids],
+            client=r_connect,
+        )
+        if not result or int(result[0]) == 0:
+            return False, None, 0, 0
+        if isinstance(result[1], bytes):
+            result = [each.decode() if isinstance(each, bytes) else each for each in result]
+        return True, int(result[1]), float(result[2]), float(result[3])
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 14:30
+# @Author  : payne
+# @File    : entitlement.py
+# @Description : 用户权益(会员/流量包/会员次数/赠送次数)计算, 供流量控制与各查询接口共用
+import datetime
+import json
+import logging
+import time
+import traceback
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django_redis import get_redis_connection
+
+from language.language_pack import RET, Language
+from utils.cst_class import CstException
+from utils.json_datetime import DateTimeEncoder
+from utils.quota.snapshot import load_snapshot
+from utils.quota.vip_quota import QuotaTemplate, VipQuota
+from utils.sql_oper import MysqlOper
+
+logger = logging.getLogger("view")
+
+# 暂时没有会员概念了, 与 MembershipManage 返回空结构体保持一致, 后期改回来的话这边置为 True
+MEMBERSHIP_ENABLED = False
+
+# 用户权益缓存时间(秒), 支付回调/激活码/扣减会主动失效, 这里只是兜底
+ENTITLEMENT_CACHE_TTL = 5
+
+# 流量控制返回的次数流量包
+PACKAGE_NAMES = [
+    "gpt35",
+    "gpt40",
+    "dalle2",
+    "baidu_drawing",
+    "wenxin",
+    "xunfei",
+    "mj",
+    "claude",
+    "chatglm",
+    "stablediffusion",
+    "qianwen",
+    "sensecore",
+    "360",
+]
+
+# 流量控制返回的通用流量包
+UNIVERSAL_NAMES = [
+    "universal",
+    "universal_9",
+    "universal_8",
+    "universal_5",
+    "universal_hidden_2",
+    "universal_hidden_10",
+]
+
+
+def db_error():
+    code = RET.DB_ERR
+    message = Language.get(code)
+    logger.error(traceback.format_exc())
+    return CstException(code=code, message=message)
+
+
+def no_vip_identity(user_type):
+    # 保持redis数据格式统一， 游客 order_id = 1  注册用户 order_id = 2 vip 为真实order_id
+    if int(user_type) == 1:
+        return 1, 9
+    return 2, 10
+
+
+def entitlement_cache_key(user_id):
+    return f"entitlement:{user_id}"
+
+
+class EntitlementCache(object):
+    """
+    用户权益短时缓存, usage 库 hash entitlement:{user_id}, 每个字段存一份计算结果 {"at": 计算开始时间, "data": 结果}
+    失效时写入字段 i 记录失效时间, 计算开始早于失效时间或超过 ENTITLEMENT_CACHE_TTL 的结果都视为未命中,
+    避免失效前开始的计算在失效后回写旧数据
+    """
+
+    INVALIDATED_FIELD = "i"
+
+    @staticmethod
+    def fetch(user_id, field, loader, r_usage=None):
+        r_usage = r_usage or get_redis_connection("usage")
+        key = entitlement_cache_key(user_id)
+        now = time.time()
+
+        try:
+            cached, invalidated_at = r_usage.hmget(
+                key, field, EntitlementCache.INVALIDATED_FIELD)
+            if cached:
+                cached = json.loads(cached)
+                if (now - cached["at"] < ENTITLEMENT_CACHE_TTL
+                        and cached["at"] > float(invalidated_at or 0)):
+                    return cached["data"]
+        except Exception:
+            logger.error(traceback.format_exc())
+
+        data = loader()
+
+        try:
+            pipe = r_usage.pipeline(transaction=False)
+            pipe.hset(
+                key,
+                field,
+                json.dumps(
+                    {"at": now, "data": data},
+                    cls=DateTimeEncoder,
+                    ensure_ascii=False,
+                ),
+            )
+            pipe.expire(key, ENTITLEMENT_CACHE_TTL)
+            pipe.execute()
+        except Exception:
+            logger.error(traceback.format_exc())
+        return data
+
+    @staticmethod
+    def invalidate(user_id, r_usage=None):
+        if not user_id:
+            return
+        r_usage = r_usage or get_redis_connection("usage")
+        key = entitlement_cache_key(user_id)
+        try:
+            pipe = r_usage.pipeline(transaction=False)
+            pipe.hset(key, EntitlementCache.INVALIDATED_FIELD, time.time())
+            pipe.expire(key, ENTITLEMENT_CACHE_TTL)
+            pipe.execute()
+        except Exception:
+            logger.error(traceback.format_exc())
+
+    @staticmethod
+    def member_info(user_id):
+        return EntitlementCache.fetch(
+            user_id, "member", lambda: EntitlementService.member_info(user_id))
+
+    @staticmethod
+    def vip_rest_count(user_id, r_usage=None):
+        code, data = EntitlementCache.fetch(
+            user_id,
+            "vip",
+            lambda: EntitlementService.vip_rest_count(user_id, r_usage),
+            r_usage,
+        )
+        return code, data
+
+    @staticmethod
+    def no_vip_rest_count(user_id, user_type, r_usage=None):
+        code, data = EntitlementCache.fetch(
+            user_id,
+            f"no_vip:{user_type}",
+            lambda: EntitlementService.no_vip_rest_count(
+                user_id, user_type, r_usage),
+            r_usage,
+        )
+        return code, data
+
+    @staticmethod
+    def package_data(user_id):
+        return EntitlementCache.fetch(
+            user_id, "packages", lambda: load_snapshot(user_id).package_data())
+
+    @staticmethod
+    def traffic_control(user_id, user_type):
+        return EntitlementCache.fetch(
+            user_id,
+            f"traffic:{user_type}",
+            lambda: EntitlementService.traffic_control(user_id, user_type),
+        )
+
+
+class EntitlementService(object):
+    @staticmethod
+    def member_info(user_id):
+        """
+        查询用户当前会员信息
+        :return: 会员信息 dict, 非会员返回 None
+        """
+        sql_member_info = (
+            f"SELECT FROM_UNIXTIME({settings.DEFAULT_DB}.pm_membership.expire_at) AS expire_date, "
+            f"{settings.DEFAULT_DB}.pm_membership_levels.level_name, "
+            f"{settings.DEFAULT_DB}.pm_membership_levels.level_id "
+            f"FROM {settings.DEFAULT_DB}.pm_membership JOIN {settings.DEFAULT_DB}.pm_membership_levels "
+            f"ON {settings.DEFAULT_DB}.pm_membership.points >= {settings.DEFAULT_DB}.pm_membership_levels.points_threshold "
+            f"WHERE {settings.DEFAULT_DB}.pm_membership.user_id = {user_id} AND {settings.DEFAULT_DB}.pm_membership.is_delete = 0 "
+            f"AND {settings.DEFAULT_DB}.pm_membership.status =1 "
+            f"AND {settings.DEFAULT_DB}.pm_membership_levels.is_delete = 0 "
+            f" ORDER BY {settings.DEFAULT_DB}.pm_membership.expire_at  DESC  LIMIT 1 ")
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql_member_info)
+                query_data = MysqlOper.get_query_result(cursor)
+        except Exception:
+            raise db_error()
+
+        if not query_data:
+            return None
+        return {
+            "expire_date": query_data[0].get("expire_date"),
+            "level_name": query_data[0].get("level_name"),
+            "user_id": user_id,
+            "level_id": query_data[0].get("level_id"),
+        }
+
+    @staticmethod
+    def vip_rest_count(user_id, r_usage=None):
+        """
+        会员各产品剩余次数, 订单首次访问时按会员套餐初始化并结转上个订单未过期的次数
+        :return: (code, data)
+        """
+        r_usage = r_usage or get_redis_connection("usage")
+
+        sql_check_vip = (
+            f"SELECT 1 FROM {settings.DEFAULT_DB}.pm_membership WHERE user_id = '{user_id}' AND UNIX_TIMESTAMP(NOW()) < expire_at "
+            f"AND status = 1 ORDER BY expire_at DESC LIMIT 1")
+        check_current_vip_content = (
+            f"SELECT oi.prod_id, o.order_id FROM {settings.DEFAULT_DB}.po_orders_items oi INNER JOIN po_orders o ON "
+            f"oi.order_id = o.order_id WHERE o.user_id = {user_id} AND o.status = 2 AND oi.prod_cate_id = 3 ORDER BY o.created_at DESC")
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(sql_check_vip)
+                if cursor.rowcount <= 0:
+                    return RET.VIP_EXPIRED, settings.VIP_FRAME_LIMIT
+                cursor.execute(check_current_vip_content)
+                result = MysqlOper.get_query_result(cursor)
+        except Exception:
+            raise db_error()
+
+        if not result:
+            return RET.VIP_EXPIRED, settings.VIP_FRAME_LIMIT
+
+        order_id = result[0].get("order_id")
+        prod_id = result[0].get("prod_id")
+        vip_limit_usage_name = f"{user_id}:{order_id}"
+        template = QuotaTemplate.get(prod_id)
+
+        try:
+            inited, rest_counts = VipQuota.read(
+                r_usage, vip_limit_usage_name, template)
+        except Exception:
+            raise db_error()
+
+        if not inited:
+            # 取出上一个订单id， 获取redis 里用户id:order_id 下剩余的次数，初始化的时候加上剩余次数
+            sql_get_last_order = (
+                f"SELECT order_id FROM {settings.DEFAULT_DB}.po_orders WHERE status = 2 AND "
+                f"user_id = {user_id} ORDER BY created_at DESC LIMIT 2 ")
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql_get_last_order)
+                    result_last_order = MysqlOper.get_query_result(cursor)
+            except Exception:
+                raise db_error()
+            if len(result_last_order) > 1:
+                carry_name = f"{user_id}:{result_last_order[1].get('order_id')}"
+            else:
+                carry_name = None
+
+            try:
+                rest_counts = VipQuota.init(
+                    r_usage, vip_limit_usage_name, template, carry_name)
+            except Exception:
+                raise db_error()
+
+        return RET.OK, rest_counts
+
+    @staticmethod
+    def no_vip_rest_count(user_id, user_type, r_usage=None):
+        """
+        游客/注册用户各产品剩余赠送次数, 首次访问时按默认额度初始化
+        :return: (code, data)
+        """
+        r_usage = r_usage or get_redis_connection("usage")
+        order_id, prod_id = no_vip_identity(user_type)
+        vip_limit_usage_name = f"{user_id}:{order_id}"
+        template = QuotaTemplate.get(prod_id)
+
+        try:
+            inited, rest_counts = VipQuota.read(r_usage, vip_limit_usage_name, template)
+            if not inited:
+                rest_counts = VipQuota.init(r_usage, vip_limit_usage_name, template)
+        except Exception:
+            raise db_error()
+
+        return RET.OK, rest_counts
+
+    @staticmethod
+    def package_data(snapshot):
+        package_data = defaultdict(lambda: defaultdict(dict))
+        for prod_name in PACKAGE_NAMES:
+            rest = int(snapshot.package(prod_name).rest)
+            package_data["package"][prod_name]["status"] = rest > 0
+            package_data["package"][prod_name]["value"] = rest if rest > 0 else 0
+
+        universal_data = snapshot.universal_data()
+        package_data["package"]["universal"]["total"] = float(
+            snapshot.universal_total)
+        for prod_name in UNIVERSAL_NAMES:
+            package_data["package"]["universal"][prod_name] = universal_data.get(
+                prod_name)
+        return package_data
+
+    @staticmethod
+    def traffic_control(user_id, user_type):
+        """
+        流量控制所需的全部权益: 会员状态及次数、次数流量包、通用流量包
+        """
+        ret_data = defaultdict(lambda: defaultdict(dict))
+        member_info = EntitlementService.member_info(
+            user_id) if MEMBERSHIP_ENABLED else None
+
+        if member_info:
+            member_info_expire = datetime.datetime.strptime(
+                member_info.get("expire_date"), "%Y-%m-%d %H:%M:%S")
+            # 当前不是会员 或者会员过期
+            if datetime.datetime.now() > member_info_expire:
+                ret_data["member"]["status"] = False
+                ret_data["member"]["data"]["count"] = {}
+            else:
+                ret_data["member"]["status"] = True
+                ret_data["member"]["data"] = member_info
+                code, data = EntitlementService.vip_rest_count(user_id)
+                ret_data["member"]["data"]["count"] = data if code == RET.OK else {}
+        # 没有找到数据, 非会员
+        else:
+            ret_data["member"]["status"] = False
+            code, data = EntitlementService.no_vip_rest_count(
+                user_id, user_type)
+            if code == RET.OK:
+                ret_data["member"]["data"]["count"] = data
+            else:
+                ret_data["member"]["data"] = {}
+
+        ret_data.update(
+            EntitlementService.package_data(
+                load_snapshot(user_id)))
+        return ret_data
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 11:20
+# @Author  : payne
+# @File    : ledger.py
+# @Description : 用户流量包余额账本
+#
+# 每个用户每类流量包只占一个 hash:
+#   ledger:package:{user_id}    次数流量包
+#   ledger:universal:{user_id}  通用流量包(积分)
+# field 说明:
+#   {prod_id}:{order_id}  定长记录  过期时间(10位) + 剩余(14位) + 购买总量(14位)
+#   o:{prod_id}           该产品累计购买总量, 对应原 total_count_origin / total_price_origin
+# 记录为定长 ASCII, 兼容 decode_responses=True 的连接, 也方便 Lua 端直接截取解析,
+# 小 hash 会以 listpack 编码存储, 比原 hash + zset + 计数器 的布局节省大量内存
+
+import time
+
+FAMILY_PACKAGE = "package"
+FAMILY_UNIVERSAL = "universal"
+
+RECORD_FORMAT = "%010d%014.3f%014.3f"
+RECORD_LENGTH = 38
+
+
+def ledger_key(family, user_id):
+    return f"ledger:{family}:{user_id}"
+
+
+def pack_record(expire_at, rest, origin):
+    return RECORD_FORMAT % (int(expire_at), float(rest), float(origin))
+
+
+def unpack_record(record):
+    if isinstance(record, bytes):
+        record = record.decode()
+    return int(record[:10]), float(record[10:24]), float(record[24:38])
+
+
+def format_value(value):
+    # 整数值按整数返回, 与原先 total_count 等 key 中存储的格式保持一致
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class BalanceLedger(object):
+    @staticmethod
+    def add_package(
+            r_connect,
+            family,
+            user_id,
+            prod_id,
+            order_id,
+            amount,
+            expire_at):
+        """
+        写入一笔购买记录
+        :param amount: 次数流量包为次数, 通用流量包为积分
+        """
+        key = ledger_key(family, user_id)
+        pipe = r_connect.pipeline(transaction=True)
+        pipe.hset(
+            key,
+            f"{prod_id}:{order_id}",
+            pack_record(expire_at, amount, amount))
+        pipe.hincrbyfloat(key, f"o:{prod_id}", float(amount))
+        pipe.execute()
+
+    @staticmethod
+    def parse(raw, now=None):
+        """
+        解析 HGETALL 的结果
+        :return: {prod_id: {"rest": 未过期剩余总量, "total": 累计购买总量, "packages": [(expire_at, rest, origin), ...]}}
+        """
+        now = now or time.time()
+        balances = {}
+        for field, value in raw.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            prefix, _, suffix = field.partition(":")
+            if prefix == "o":
+                balance = balances.setdefault(
+                    suffix, {"rest": 0.0, "total": 0.0, "packages": []})
+                balance["total"] = float(value)
+                continue
+            expire_at, rest, origin = unpack_record(value)
+            balance = balances.setdefault(
+                prefix, {"rest": 0.0, "total": 0.0, "packages": []})
+            if expire_at >= now and rest > 0:
+                balance["rest"] += rest
+                balance["packages"].append((expire_at, rest, origin))
+        for balance in balances.values():
+            balance["packages"].sort()
+        return balances
+
+    @staticmethod
+    def balances(r_connect, family, user_id, now=None):
+        # 单条 HGETALL 读取用户该类流量包的全部余额
+        return BalanceLedger.parse(
+            r_connect.hgetall(
+                ledger_key(
+                    family,
+                    user_id)),
+            now)
+
+    @staticmethod
+    def rest_value(r_connect, family, user_id, prod_id, now=None):
+        balance = BalanceLedger.balances(
+            r_connect, family, user_id, now).get(str(prod_id))
+        return format_value(balance["rest"]) if balance else 0
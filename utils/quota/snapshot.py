@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 13:05
+# @Author  : payne
+# @File    : snapshot.py
+# @Description : 用户流量包余额快照, 一次 pipeline 读取用户全部产品余额
+
+import json
+import threading
+import time
+
+from django_redis import get_redis_connection
+
+from utils.quota.ledger import (FAMILY_PACKAGE, FAMILY_UNIVERSAL,
+                                BalanceLedger, format_value, ledger_key)
+
+# 产品映射进程内缓存时间(秒)
+PRODUCT_MAPS_TTL = 60
+
+
+class ProductMaps(object):
+    """
+    产品名称与 prod_id 的映射, 来自 config 库的 config:products:idMaps / config:products:universal,
+    在进程内缓存 PRODUCT_MAPS_TTL 秒
+    """
+
+    _lock = threading.Lock()
+    _maps = None
+    _loaded_at = 0
+
+    @classmethod
+    def get(cls, r_config=None):
+        if cls._maps is None or time.time() - cls._loaded_at > PRODUCT_MAPS_TTL:
+            with cls._lock:
+                if cls._maps is None or time.time() - cls._loaded_at > PRODUCT_MAPS_TTL:
+                    r_config = r_config or get_redis_connection("config")
+                    id_maps, universal_maps = r_config.mget(
+                        "config:products:idMaps", "config:products:universal")
+                    cls._maps = (
+                        json.loads(id_maps) if id_maps else {},
+                        json.loads(universal_maps) if universal_maps else {},
+                    )
+                    cls._loaded_at = time.time()
+        return cls._maps
+
+    @classmethod
+    def invalidate(cls):
+        cls._maps = None
+
+
+class ProductBalance(object):
+    """
+    单个产品余额
+    - rest 未过期剩余量
+    - total 累计购买总量
+    """
+
+    __slots__ = ("prod_id", "rest", "total")
+
+    def __init__(self, prod_id, rest=0, total=0):
+        self.prod_id = prod_id
+        self.rest = format_value(max(rest, 0))
+        self.total = format_value(max(total, 0))
+
+    @property
+    def status(self):
+        return self.rest > 0
+
+    def to_dict(self):
+        # 与原先直接返回 redis 中的字符串一致, 没有余额时为 0
+        return {
+            "rest": str(self.rest) if self.rest > 0 else 0,
+            "total": str(self.total) if self.total > 0 else 0,
+        }
+
+
+class BalanceSnapshot(object):
+    """
+    用户余额快照
+    - packages  次数流量包 {prod_name: ProductBalance}
+    - universal 通用流量包 {prod_name: ProductBalance}
+    """
+
+    def __init__(self, user_id, packages, universal):
+        self.user_id = user_id
+        self.packages = packages
+        self.universal = universal
+
+    @property
+    def universal_total(self):
+        return sum(float(each.rest) for each in self.universal.values())
+
+    def package(self, prod_name):
+        return self.packages.get(prod_name) or ProductBalance(None)
+
+    def package_data(self):
+        return {name: each.to_dict() for name, each in self.packages.items()}
+
+    def universal_data(self):
+        return {name: each.to_dict() for name, each in self.universal.items()}
+
+
+def _build(user_id, package_raw, universal_raw, id_maps, universal_maps, now):
+    def balances_of(raw, maps):
+        parsed = BalanceLedger.parse(raw, now)
+        result = {}
+        for prod_name, prod_id in maps.items():
+            balance = parsed.get(str(prod_id), {})
+            result[prod_name] = ProductBalance(
+                prod_id, balance.get("rest", 0), balance.get("total", 0))
+        return result
+
+    return BalanceSnapshot(
+        user_id,
+        balances_of(package_raw, id_maps),
+        balances_of(universal_raw, universal_maps),
+    )
+
+
+def load_snapshots(user_ids, r_usage=None, r_config=None, now=None):
+    """
+    批量读取多个用户的余额快照, 所有用户共用一次 pipeline
+    :return: {user_id: BalanceSnapshot}
+    """
+    r_usage = r_usage or get_redis_connection("usage")
+    id_maps, universal_maps = ProductMaps.get(r_config)
+    now = now or time.time()
+
+    pipe = r_usage.pipeline(transaction=False)
+    for user_id in user_ids:
+        pipe.hgetall(ledger_key(FAMILY_PACKAGE, user_id))
+        pipe.hgetall(ledger_key(FAMILY_UNIVERSAL, user_id))
+    raws = pipe.execute()
+
+    snapshots = {}
+    for index, user_id in enumerate(user_ids):
+        snapshots[user_id] = _build(
+            user_id,
+            raws[index * 2],
+            raws[index * 2 + 1],
+            id_maps,
+            universal_maps,
+            now,
+        )
+    return snapshots
+
+
+def load_snapshot(user_id, r_usage=None, r_config=None, now=None):
+    return load_snapshots([user_id], r_usage, r_config, now)[user_id]
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 15:20
+# @Author  : payne
+# @File    : vip_quota.py
+# @Description : 会员/赠送次数, 每个计数一个 redis key, 周期过期由 key 的 TTL 完成, 读取时不再解析过期时间
+#
+# - 计数 key: {user_id}:{order_id}:{prod_id}:{prod_name}:{flag}, value 为剩余次数,
+#   每次写入按周期重新设置过期时间(day 当天结束, week 7 天, month 30 天), 与原 field 内的过期时间规则一致
+# - key 不存在即周期已过期: 读取为额度, 扣减时重置为额度(本次不扣), 赠送时重置为赠送次数
+# - {user_id}:{order_id}:inited 标记订单已初始化; 首次访问时按额度初始化并结转上个订单未过期的次数
+# - 旧布局 hash {user_id}:{order_id} (field {prod_id}:{prod_name}:{flag}, value "过期时间戳:剩余次数"
+#   或 JSON) 在订单首次访问时迁移一次, 未过期的计数保留原过期时间
+# 初始化、迁移和更新都在一次脚本调用内完成
+import datetime
+import threading
+import time
+
+from django.conf import settings
+
+from utils.quota.deduction import _get_script
+
+# KEYS[1] 初始化标记  KEYS[2] 本订单旧 hash  KEYS[3] 上个订单旧 hash, 不结转时为空串
+# KEYS[4 + 2i] 第 i 个计数 key  KEYS[5 + 2i] 上个订单对应计数 key, 不结转时为空串
+# ARGV[1] 当前时间戳  ARGV[2] 当前时间 iso 格式(比较旧 JSON 数据用)  ARGV[3] 未初始化时是否初始化(1/0)
+# ARGV[4] read / consume / gift
+# ARGV[5 + 4i ..] 第 i 个计数的 旧 field, 额度, 周期过期时间戳, 本次数量(空串表示不更新)
+# 未初始化且不允许初始化时返回 false, 否则返回全部计数的剩余次数
+LUA_VIP_COUNTERS = """
+local now = tonumber(ARGV[1])
+local now_iso = ARGV[2]
+local mode = ARGV[4]
+local count = (#ARGV - 4) / 4
+
+-- 旧布局未过期的计数, 返回 (剩余次数, 过期时间戳), JSON 数据没有时间戳
+local function legacy_rest(raw)
+    if not raw then
+        return nil
+    end
+    if string.sub(raw, 1, 1) == '{' then
+        local data = cjson.decode(raw)
+        if data['expire_date'] >= now_iso then
+            return tonumber(data['value']), nil
+        end
+        return nil
+    end
+    local sep = string.find(raw, ':', 1, true)
+    local expire_at = tonumber(string.sub(raw, 1, sep - 1))
+    if expire_at >= now then
+        return tonumber(string.sub(raw, sep + 1)), expire_at
+    end
+    return nil
+end
+
+local function save(key, value, expire_at)
+    redis.call('SET', key, value)
+    redis.call('EXPIREAT', key, expire_at + 1)
+end
+
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        for i = 0, count - 1 do
+            local a = 5 + i * 4
+            local rest, expire_at = legacy_rest(redis.call('HGET', KEYS[2], ARGV[a]))
+            if rest then
+                save(KEYS[4 + i * 2], rest, expire_at or tonumber(ARGV[a + 2]))
+            end
+        end
+    elseif ARGV[3] == '1' then
+        for i = 0, count - 1 do
+            local a = 5 + i * 4
+            local value = tonumber(ARGV[a + 1])
+            local carry_key = KEYS[5 + i * 2]
+            if carry_key ~= '' then
+                local carried = redis.call('GET', carry_key)
+                if carried then
+                    value = value + tonumber(carried)
+                elseif KEYS[3] ~= '' then
+                    value = value + (legacy_rest(redis.call('HGET', KEYS[3], ARGV[a])) or 0)
+                end
+            end
+            save(KEYS[4 + i * 2], value, tonumber(ARGV[a + 2]))
+        end
+    else
+        return false
+    end
+    redis.call('SET', KEYS[1], 1)
+end
+
+local values = {}
+for i = 0, count - 1 do
+    local a = 5 + i * 4
+    local key = KEYS[4 + i * 2]
+    local limit = tonumber(ARGV[a + 1])
+    local current = redis.call('GET', key)
+    local value
+    if mode == 'read' or ARGV[a + 3] == '' then
+        value = current and tonumber(current) or limit
+    else
+        local amount = tonumber(ARGV[a + 3])
+        if mode == 'consume' then
+            value = current and tonumber(current) - amount or limit
+        else
+            value = current and tonumber(current) + amount or amount
+        end
+        save(key, value, tonumber(ARGV[a + 2]))
+    end
+    values[#values + 1] = value
+end
+return values
+"""
+
+
+def period_expire_at(limit_flag, now=None):
+    # 会员/赠送次数的周期过期时间
+    now = datetime.datetime.fromtimestamp(now or time.time())
+    if limit_flag == "day":
+        expire_date = now.replace(hour=23, minute=59, second=59, microsecond=0)
+    elif limit_flag == "week":
+        expire_date = now + datetime.timedelta(weeks=1)
+    else:
+        expire_date = now + datetime.timedelta(days=30)
+    return int(expire_date.timestamp())
+
+
+def counter_key(name, field):
+    return f"{name}:{field}"
+
+
+def inited_key(name):
+    return f"{name}:inited"
+
+
+class QuotaEntry(object):
+    __slots__ = ("prod_name", "flag", "field", "limit")
+
+    def __init__(self, prod_name, flag, field, limit):
+        self.prod_name = prod_name
+        self.flag = flag
+        self.field = field
+        self.limit = limit
+
+
+class QuotaTemplate(object):
+    """
+    单个会员/赠送产品的次数模板, 由 settings.VIP_FRAME_LIMIT_USAGE 预先展开
+    - entries 全部 (产品, 周期, 额度) 条目, field 与旧布局的 hash field 相同
+    """
+
+    _lock = threading.Lock()
+    _templates = None
+
+    def __init__(self, prod_id, limit_usage):
+        self.prod_id = int(prod_id)
+        self.entries = []
+        for prod_name, limit_content in limit_usage.items():
+            for limit_flag, limit_value in limit_content.items():
+                self.entries.append(
+                    QuotaEntry(
+                        prod_name,
+                        limit_flag,
+                        f"{self.prod_id}:{prod_name}:{limit_flag}",
+                        limit_value,
+                    ))
+
+    def entries_of(self, prod_name=None):
+        if prod_name is None:
+            return self.entries
+        return [each for each in self.entries if each.prod_name == prod_name]
+
+    @classmethod
+    def get(cls, prod_id):
+        if cls._templates is None:
+            with cls._lock:
+                if cls._templates is None:
+                    cls._templates = {
+                        int(each_prod_id): cls(each_prod_id, limit_usage)
+                        for each_prod_id, limit_usage in getattr(
+                            settings, "VIP_FRAME_LIMIT_USAGE", {}).items()
+                    }
+        return cls._templates[int(prod_id)]
+
+
+def rest_counts_of(template, values):
+    rest_counts = {}
+    for entry, value in zip(template.entries, values):
+        rest_counts.setdefault(entry.prod_name, {})[entry.flag] = int(value)
+    return rest_counts
+
+
+class VipQuota(object):
+    @staticmethod
+    def read(r_usage, name, template):
+        """
+        一次 pipeline 读取初始化标记和全部计数, 已过期(不存在)的计数为额度
+        :return: (是否已初始化, {prod_name: {flag: 剩余次数}})
+        """
+        pipe = r_usage.pipeline(transaction=False)
+        pipe.exists(inited_key(name))
+        pipe.mget([counter_key(name, entry.field) for entry in template.entries])
+        inited, raws = pipe.execute()
+        values = [
+            entry.limit if raw is None else raw
+            for entry, raw in zip(template.entries, raws)
+        ]
+        return bool(inited), rest_counts_of(template, values)
+
+    @staticmethod
+    def _run(r_usage, name, template, mode, amounts=None, init=False, carry_name=None, now=None):
+        now = now or time.time()
+        keys = [inited_key(name), name, carry_name or ""]
+        args = [now, datetime.datetime.fromtimestamp(now).isoformat(), 1 if init else 0, mode]
+        for entry in template.entries:
+            keys.append(counter_key(name, entry.field))
+            keys.append(counter_key(carry_name, entry.field) if carry_name else "")
+            amount = (amounts or {}).get(id(entry))
+            args.extend([
+                entry.field,
+                int(entry.limit),
+                period_expire_at(entry.flag, now),
+                "" if amount is None else int(amount),
+            ])
+
+        script = _get_script(r_usage, "vip_counters", LUA_VIP_COUNTERS)
+        return script(keys=keys, args=args, client=r_usage)
+
+    @staticmethod
+    def init(r_usage, name, template, carry_name=None, now=None):
+        """
+        订单首次访问: 旧布局存在时迁移, 否则按额度初始化并结转 carry_name 中未过期的剩余次数
+        :return: {prod_name: {flag: 剩余次数}}
+        """
+        values = VipQuota._run(
+            r_usage, name, template, "read", init=True, carry_name=carry_name, now=now)
+        return rest_counts_of(template, values)
+
+    @staticmethod
+    def update(r_usage, name, template, entries, mode, amount_of, init=False, now=None):
+        """
+        :param mode: consume 扣减 amount_of(entry) 次, 周期已过期时重置为额度;
+                     gift 增加 amount_of(entry) 次, 周期已过期时重置为赠送次数
+        :param init: 订单未初始化时是否先初始化, 不初始化时不更新
+        :return: [(entry, 剩余次数)]
+        """
+        if not entries:
+            return []
+        amounts = {id(entry): amount_of(entry) for entry in entries}
+        values = VipQuota._run(r_usage, name, template, mode, amounts, init=init, now=now)
+        if not values:
+            return []
+        return [
+            (entry, int(value))
+            for entry, value in zip(template.entries, values)
+            if id(entry) in amounts
+        ]
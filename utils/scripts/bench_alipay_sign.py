@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 21:15
+# @Author  : payne
+# @File    : bench_alipay_sign.py
+# @Description : 支付宝 RSA2 签名/验签压测, 对比旧版每次解析密钥、缓存 pycryptodome 对象、cryptography 三种方式的单核吞吐
+#
+# 用法: python -m utils.scripts.bench_alipay_sign --seconds 3
+# 使用临时生成的 2048 位密钥, 单线程运行, 结果即单核每秒次数
+import argparse
+import time
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from django.conf import settings
+
+# 典型的异步通知待验签字符串
+MESSAGE = (
+    "app_id=2021000000000000&auth_app_id=2021000000000000&buyer_id=2088000000000000"
+    "&buyer_pay_amount=19.90&charset=utf-8&fund_bill_list=[{\"amount\":\"19.90\","
+    "\"fundChannel\":\"ALIPAYACCOUNT\"}]&gmt_create=2026-10-17 12:00:00"
+    "&gmt_payment=2026-10-17 12:00:05&invoice_amount=19.90&notify_id=2026101700000000000000"
+    "&notify_time=2026-10-17 12:00:06&notify_type=trade_status_sync"
+    "&out_trade_no=1700000000000000000&point_amount=0.00&receipt_amount=19.90"
+    "&seller_id=2088000000000001&subject=gpt35 次数包&total_amount=19.90"
+    "&trade_no=2026101722001400000000000000&trade_status=TRADE_SUCCESS&version=1.0"
+).encode("utf8")
+
+
+def legacy_sign(private_pem, message):
+    # 原 AliPay() 每次构造都解析密钥, sign 时新建 signer
+    key = RSA.importKey(private_pem)
+    return PKCS1_v1_5.new(key).sign(SHA256.new(message))
+
+
+def legacy_verify(public_pem, message, signature):
+    key = RSA.importKey(public_pem)
+    digest = SHA256.new()
+    digest.update(message)
+    return PKCS1_v1_5.new(key).verify(digest, signature)
+
+
+def throughput(func, seconds):
+    count = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while time.perf_counter() < deadline:
+        func()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--bits", type=int, default=2048)
+    args = parser.parse_args()
+
+    # utils.payment.alipay 经 utils.exception 依赖 django 配置, 压测不需要项目设置
+    if not settings.configured:
+        settings.configure()
+    from utils.payment.alipay import AliPayKeys
+
+    app_key = RSA.generate(args.bits)
+    alipay_key = RSA.generate(args.bits)
+    private_pem = app_key.export_key().decode()
+    public_pem = alipay_key.publickey().export_key().decode()
+    # 验签使用支付宝私钥签出的通知
+    signature = PKCS1_v1_5.new(alipay_key).sign(SHA256.new(MESSAGE))
+
+    cached = AliPayKeys(private_pem, public_pem, fast=False)
+    fast = AliPayKeys(private_pem, public_pem, fast=True)
+    assert cached.verify(MESSAGE, signature) and fast.verify(MESSAGE, signature)
+    assert cached.sign(MESSAGE) == fast.sign(MESSAGE) == legacy_sign(private_pem, MESSAGE)
+
+    cases = [
+        ("legacy", lambda: legacy_sign(private_pem, MESSAGE),
+         lambda: legacy_verify(public_pem, MESSAGE, signature)),
+        ("cached", lambda: cached.sign(MESSAGE),
+         lambda: cached.verify(MESSAGE, signature)),
+    ]
+    if fast.private_key is not None:
+        cases.append(("cryptography", lambda: fast.sign(MESSAGE),
+                      lambda: fast.verify(MESSAGE, signature)))
+    else:
+        print("cryptography not installed, skip fast path")
+
+    print(f"RSA{args.bits} SHA256, single core, {args.seconds}s per case")
+    print(f"{'case':<14}{'sign/s':>12}{'verify/s':>12}")
+    for name, sign, verify in cases:
+        print(f"{name:<14}{throughput(sign, args.seconds):>12.0f}"
+              f"{throughput(verify, args.seconds):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
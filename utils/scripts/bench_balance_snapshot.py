@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 13:40
+# @Author  : payne
+# @File    : bench_balance_snapshot.py
+# @Description : 余额读取压测, 对比逐产品 GET 与 pipeline 余额快照
+#
+# 用法: python -m utils.scripts.bench_balance_snapshot --host 127.0.0.1 --db 15 --users 10000
+# 注意: 会清空 --db 指定的库, 请使用专用的测试库
+import argparse
+import json
+import time
+
+import redis
+
+from utils.quota.ledger import (FAMILY_PACKAGE, FAMILY_UNIVERSAL, ledger_key,
+                                pack_record)
+from utils.quota.snapshot import load_snapshot, load_snapshots
+
+ID_MAPS = {
+    "gpt35": 1, "gpt40": 2, "dalle2": 3, "baidu_drawing": 4, "wenxin": 5,
+    "xunfei": 6, "mj": 7, "claude": 8, "chatglm": 9, "stablediffusion": 10,
+    "qianwen": 11, "sensecore": 12, "360": 13,
+}
+UNIVERSAL_MAPS = {
+    "universal": 18, "universal_9": 19, "universal_8": 20, "universal_5": 21,
+    "universal_hidden_2": 25, "universal_hidden_10": 26,
+}
+
+
+def seed(r, users):
+    r.flushdb()
+    r.set("config:products:idMaps", json.dumps(ID_MAPS))
+    r.set("config:products:universal", json.dumps(UNIVERSAL_MAPS))
+    expire_at = time.time() + 86400 * 30
+    pipe = r.pipeline(transaction=False)
+    for user_id in range(users):
+        for prod_id in list(ID_MAPS.values())[:4]:
+            # 旧布局的总量计数器
+            pipe.set(f"total_count:{user_id}:{prod_id}", 100)
+            pipe.set(f"total_count_origin:{user_id}:{prod_id}", 100)
+            pipe.hset(
+                ledger_key(FAMILY_PACKAGE, user_id),
+                mapping={f"{prod_id}:1": pack_record(expire_at, 100, 100), f"o:{prod_id}": 100})
+        pipe.hset(
+            ledger_key(FAMILY_UNIVERSAL, user_id),
+            mapping={"18:1": pack_record(expire_at, 5000, 5000), "o:18": 5000})
+        if user_id % 1000 == 0:
+            pipe.execute()
+    pipe.execute()
+
+
+def per_product_get(r, user_id):
+    # 原 TokenConsume.get 的读取方式: 先读映射, 再逐产品 GET
+    id_maps = json.loads(r.get("config:products:idMaps"))
+    data = {}
+    for prod_name, prod_id in id_maps.items():
+        data[prod_name] = {
+            "rest": r.get(f"total_count:{user_id}:{prod_id}") or 0,
+            "total": r.get(f"total_count_origin:{user_id}:{prod_id}") or 0,
+        }
+    return data
+
+
+def report(name, users, elapsed):
+    print(f"{name:<16} users={users} total={elapsed:.2f}s per_user={elapsed / users * 1e6:.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default=None)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    r = redis.Redis(
+        host=args.host,
+        port=args.port,
+        password=args.password,
+        db=args.db,
+        decode_responses=True,
+    )
+    seed(r, args.users)
+
+    start = time.perf_counter()
+    for user_id in range(args.users):
+        per_product_get(r, user_id)
+    report("per-product GET", args.users, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for user_id in range(args.users):
+        load_snapshot(user_id, r_usage=r, r_config=r)
+    report("snapshot", args.users, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for offset in range(0, args.users, args.batch):
+        load_snapshots(
+            range(offset, min(offset + args.batch, args.users)), r_usage=r, r_config=r)
+    report(f"snapshot x{args.batch}", args.users, time.perf_counter() - start)
+
+    r.flushdb()
+
+
+if __name__ == "__main__":
+    main()
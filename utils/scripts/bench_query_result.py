@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 17:05
+# @Author  : payne
+# @File    : bench_query_result.py
+# @Description : 结果集转换压测, 对比旧版逐列循环与 MysqlOper.get_query_result 的耗时和内存
+#
+# 用法: python -m utils.scripts.bench_query_result --rows 100000
+# 不连接数据库, 使用内存中的模拟游标, 只衡量结果集转换本身
+import argparse
+import datetime
+import gc
+import logging
+import time
+import tracemalloc
+from decimal import Decimal
+
+from utils.sql_oper import MysqlOper
+
+COLUMNS = (
+    "order_id", "source", "price", "prod_name", "prod_id", "prod_cate_id",
+    "valid_period_days", "total_amount", "payment_method", "created_at",
+    "status", "quantity", "expire_at",
+)
+
+
+class FakeResult(object):
+    insert_id = 0
+
+
+class FakeCursor(object):
+    def __init__(self, rows):
+        self.description = tuple((name, None, None, None, None, None, None) for name in COLUMNS)
+        self._rows = rows
+        self._executed = "SELECT ..."
+        self._result = FakeResult()
+        self.rowcount = len(rows)
+        self.rownumber = 0
+        self.arraysize = 1
+
+    def fetchall(self):
+        return self._rows
+
+
+def make_rows(count):
+    created_at = datetime.datetime(2026, 10, 17, 12, 0, 0)
+    return [
+        (
+            1700000000000000000 + index, "web", Decimal("19.90"), "gpt35 次数包", 1, 1,
+            30, Decimal("19.90"), index % 3, created_at, 2, 1, None,
+        )
+        for index in range(count)
+    ]
+
+
+def legacy_get_query_result(cursor):
+    # 旧实现, 保留日志格式化与逐列循环
+    result = []
+    names = cursor.description
+    datas = cursor.fetchall()
+
+    logging.getLogger("view").info(
+        "current execute sql \n{}\nrowcount : {}\nrownumber : {}\narraysize : {}\ninsert_id : {}".format(
+            cursor._executed,
+            cursor.rowcount,
+            cursor.rownumber,
+            cursor.arraysize,
+            cursor._result.insert_id,
+        )
+    )
+    for rows in datas:
+        one = {}
+        for i in range(len(rows)):
+            one[names[i][0]] = str(
+                rows[i]) if rows[i] or rows[i] == 0 else ""
+        result.append(one)
+    return result
+
+
+def measure(name, func, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(FakeCursor(rows))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    result = func(FakeCursor(rows))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    print(f"{name:<10} rows={len(rows)} best={best * 1000:.1f}ms "
+          f"per_row={best / len(rows) * 1e6:.2f}us peak={peak / 1024 / 1024:.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    rows = make_rows(args.rows)
+
+    measure("legacy", legacy_get_query_result, rows, args.repeat)
+    measure("str", MysqlOper.get_query_result, rows, args.repeat)
+    measure("typed", lambda cursor: MysqlOper.get_query_result(cursor, typed=True), rows, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 10:40
+# @Author  : payne
+# @File    : bench_token_consume.py
+# @Description : 流量包扣减压测, 对比旧布局逐条命令扣减与账本 Lua 原子扣减的内存占用、往返次数和 p99 延迟
+#
+# 用法: python -m utils.scripts.bench_token_consume --host 127.0.0.1 --db 15 --users 200 --packages 5
+# 注意: 会清空 --db 指定的库, 请使用专用的测试库
+import argparse
+import datetime
+import statistics
+import time
+
+import redis
+
+from utils.quota.deduction import QuotaDeduction
+from utils.quota.ledger import FAMILY_PACKAGE, ledger_key, pack_record
+
+
+class CountingRedis(redis.Redis):
+    # 统计每次调用发出的命令数, 非 pipeline 场景下即为网络往返次数
+    round_trips = 0
+
+    def execute_command(self, *args, **options):
+        CountingRedis.round_trips += 1
+        return super(CountingRedis, self).execute_command(*args, **options)
+
+
+def legacy_consume_package(r_usage, user_id, prod_id, consumed_token):
+    # 原 TokenConsume.post 的扣减流程
+    package_keys = r_usage.zrange(f"packages:{user_id}:{prod_id}", 0, -1)
+    count = 0
+    for earliest_package_key in package_keys:
+        earliest_package_info = r_usage.hgetall(earliest_package_key)
+        if earliest_package_info:
+            count = int(earliest_package_info["count"])
+            expire_at = float(earliest_package_info["expire_at"])
+            if (expire_at < datetime.datetime.now().timestamp()) or count <= 0:
+                r_usage.zrem(f"packages:{user_id}:{prod_id}", earliest_package_key)
+                r_usage.decr(f"total_count:{user_id}:{prod_id}", count)
+            else:
+                break
+    else:
+        return False
+    if count > 0:
+        count = max(count - consumed_token, 0)
+        r_usage.hset(earliest_package_key, "count", count)
+        total_count = int(r_usage.get(f"total_count:{user_id}:{prod_id}") or 0)
+        if total_count > 0:
+            total_count = max(total_count - consumed_token, 0)
+            r_usage.set(f"total_count:{user_id}:{prod_id}", total_count)
+        return True
+    return False
+
+
+def seed(r_usage, users, packages, prod_id, count):
+    r_usage.flushdb()
+    now = time.time()
+    pipe = r_usage.pipeline(transaction=False)
+    for user_id in range(users):
+        for order_id in range(packages):
+            # 前一半的包已过期, 模拟需要清理的情况
+            expire_at = now - 3600 if order_id < packages // 2 else now + 86400 * (order_id + 1)
+            package_key = f"package:{user_id}:{prod_id}:{order_id}"
+            pipe.hset(package_key, mapping={"count": count, "expire_at": str(expire_at)})
+            pipe.zadd(f"packages:{user_id}:{prod_id}", {package_key: expire_at})
+            pipe.incrbyfloat(f"total_count:{user_id}:{prod_id}", count)
+    pipe.execute()
+
+
+def seed_ledger(r_usage, users, packages, prod_id, count):
+    r_usage.flushdb()
+    now = time.time()
+    pipe = r_usage.pipeline(transaction=False)
+    for user_id in range(users):
+        for order_id in range(packages):
+            expire_at = now - 3600 if order_id < packages // 2 else now + 86400 * (order_id + 1)
+            pipe.hset(
+                ledger_key(FAMILY_PACKAGE, user_id),
+                f"{prod_id}:{order_id}",
+                pack_record(expire_at, count, count))
+        pipe.hset(ledger_key(FAMILY_PACKAGE, user_id), f"o:{prod_id}", count * packages)
+    pipe.execute()
+
+
+def memory_per_user(r_usage, users):
+    return r_usage.info("memory")["used_memory"] / users
+
+
+def run(name, r_usage, users, rounds, consume):
+    latencies = []
+    CountingRedis.round_trips = 0
+    for _ in range(rounds):
+        for user_id in range(users):
+            start = time.perf_counter()
+            consume(user_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+    calls = len(latencies)
+    latencies.sort()
+    print(
+        f"{name:<8} calls={calls} round_trips/call={CountingRedis.round_trips / calls:.2f} "
+        f"p50={statistics.median(latencies):.3f}ms p99={latencies[int(calls * 0.99) - 1]:.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--password", default=None)
+    parser.add_argument("--db", type=int, default=15)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--packages", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    r_usage = CountingRedis(
+        host=args.host,
+        port=args.port,
+        password=args.password,
+        db=args.db,
+        decode_responses=True,
+    )
+    prod_id = 1
+
+    r_usage.flushdb()
+    baseline = memory_per_user(r_usage, args.users)
+    seed(r_usage, args.users, args.packages, prod_id, 10000)
+    print(f"legacy   memory/user={memory_per_user(r_usage, args.users) - baseline:.0f}B")
+    run("legacy", r_usage, args.users, args.rounds,
+        lambda user_id: legacy_consume_package(r_usage, user_id, prod_id, 1))
+
+    seed_ledger(r_usage, args.users, args.packages, prod_id, 10000)
+    print(f"ledger   memory/user={memory_per_user(r_usage, args.users) - baseline:.0f}B")
+    run("script", r_usage, args.users, args.rounds,
+        lambda user_id: QuotaDeduction.consume_package(r_usage, user_id, prod_id, 1))
+
+    r_usage.flushdb()
+
+
+if __name__ == "__main__":
+    main()
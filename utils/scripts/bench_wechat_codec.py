@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/17 22:25
+# @Author  : payne
+# @File    : bench_wechat_codec.py
+# @Description : 微信支付 v2 编解码微基准, 对比 wechat_pay 原实现与 wechat_codec
+#
+# 用法: python -m utils.scripts.bench_wechat_codec --number 20000
+# 单线程, 每项交替执行多轮取最快一轮, 输出每次调用耗时(微秒)
+import argparse
+import hashlib
+import time
+from random import Random
+
+from utils.payment import wechat_codec
+
+API_KEY = "192006250b4c09247ec02edce69f6a2d"
+
+# 统一下单参数
+ORDER_PARAMS = {
+    "appid": "wx2421b1c4370ec43b",
+    "mch_id": "10000100",
+    "nonce_str": "ibuaiVcKdpRxkhJA",
+    "out_trade_no": "1700000000000000000",
+    "total_fee": 1990,
+    "spbill_create_ip": "127.0.0.1",
+    "notify_url": "https://example.com/pay/update_order_wechat/",
+    "body": "gpt35 次数包",
+    "detail": "gpt35 次数包",
+    "trade_type": "NATIVE",
+}
+
+# 支付回调/查询响应
+NOTIFY_XML = (
+    "<xml><appid><![CDATA[wx2421b1c4370ec43b]]></appid>"
+    "<bank_type><![CDATA[CFT]]></bank_type><cash_fee><![CDATA[1990]]></cash_fee>"
+    "<fee_type><![CDATA[CNY]]></fee_type><is_subscribe><![CDATA[N]]></is_subscribe>"
+    "<mch_id><![CDATA[10000100]]></mch_id><nonce_str><![CDATA[5d2b6c2a8db53831f7eda20af46e531c]]></nonce_str>"
+    "<openid><![CDATA[oUpF8uMEb4qRXf22hE3X68TekukE]]></openid>"
+    "<out_trade_no><![CDATA[1700000000000000000]]></out_trade_no>"
+    "<result_code><![CDATA[SUCCESS]]></result_code><return_code><![CDATA[SUCCESS]]></return_code>"
+    "<sign><![CDATA[{sign}]]></sign><time_end><![CDATA[20261017120005]]></time_end>"
+    "<total_fee>1990</total_fee><trade_type><![CDATA[NATIVE]]></trade_type>"
+    "<transaction_id><![CDATA[4200000000202610170000000000]]></transaction_id></xml>"
+)
+
+
+def legacy_random_str(randomlength=8):
+    strs = ""
+    chars = "AaBbCcDdEeFfGgHhIiJjKkLlMmNnOoPpQqRrSsTtUuVvWwXxYyZz0123456789"
+    length = len(chars) - 1
+    random = Random()
+    for i in range(randomlength):
+        strs += chars[random.randint(0, length)]
+    return strs
+
+
+def legacy_get_sign(data_dict, key):
+    params_list = sorted(data_dict.items(), key=lambda e: e[0], reverse=False)
+    params_str = "&".join("{}={}".format(k, v) for k, v in params_list) + "&key=" + key
+    md5 = hashlib.md5()
+    md5.update(params_str.encode("utf-8"))
+    return md5.hexdigest().upper()
+
+
+def legacy_trans_dict_to_xml(data_dict):
+    data_xml = []
+    for k in sorted(data_dict.keys()):
+        v = data_dict.get(k)
+        if k == "detail" and not v.startswith("<![CDATA["):
+            v = "<![CDATA[{}]]>".format(v)
+        data_xml.append("<{key}>{value}</{key}>".format(key=k, value=v))
+    return "<xml>{}</xml>".format("".join(data_xml))
+
+
+def legacy_trans_xml_to_dict(data_xml):
+    data_dict = {}
+    try:
+        import xml.etree.cElementTree as ET
+    except ImportError:
+        import xml.etree.ElementTree as ET
+    root = ET.fromstring(data_xml)
+    for child in root:
+        data_dict[child.tag] = child.text
+    return data_dict
+
+
+def legacy_sign_and_encode(params):
+    # 原 wxpay: 先签名, 写回参数字典, 再整体转 XML
+    params = dict(params)
+    params["sign"] = legacy_get_sign(params, API_KEY)
+    return legacy_trans_dict_to_xml(params)
+
+
+def legacy_verify(notify_xml):
+    data = legacy_trans_xml_to_dict(notify_xml)
+    sign = data.pop("sign")
+    return sign == legacy_get_sign(data, API_KEY)
+
+
+def bench(cases, number, rounds):
+    best = {}
+    for _ in range(rounds):
+        for name, func in cases:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            elapsed = (time.perf_counter() - start) / number
+            best[name] = min(best.get(name, elapsed), elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    notify_data = legacy_trans_xml_to_dict(NOTIFY_XML.format(sign=""))
+    notify_data.pop("sign")
+    notify_xml = NOTIFY_XML.format(sign=legacy_get_sign(notify_data, API_KEY)).encode()
+
+    # 输出一致性
+    assert wechat_codec.encode_signed(ORDER_PARAMS, API_KEY)[1] == legacy_sign_and_encode(ORDER_PARAMS)
+    assert wechat_codec.decode(notify_xml) == legacy_trans_xml_to_dict(notify_xml)
+    assert wechat_codec.verify(wechat_codec.decode(notify_xml), API_KEY) and legacy_verify(notify_xml)
+
+    groups = [
+        ("nonce", lambda: legacy_random_str(16), lambda: wechat_codec.nonce_str(16)),
+        ("sign", lambda: legacy_get_sign(ORDER_PARAMS, API_KEY),
+         lambda: wechat_codec.sign(ORDER_PARAMS, API_KEY)),
+        ("sign + xml", lambda: legacy_sign_and_encode(ORDER_PARAMS),
+         lambda: wechat_codec.encode_signed(ORDER_PARAMS, API_KEY)),
+        ("decode", lambda: legacy_trans_xml_to_dict(notify_xml),
+         lambda: wechat_codec.decode(notify_xml)),
+        ("notify verify", lambda: legacy_verify(notify_xml),
+         lambda: wechat_codec.verify(wechat_codec.decode(notify_xml), API_KEY)),
+    ]
+    cases = []
+    for name, legacy, codec in groups:
+        cases.append((name + " legacy", legacy))
+        cases.append((name + " codec", codec))
+    best = bench(cases, args.number, args.rounds)
+
+    print(f"{args.number} calls x {args.rounds} rounds, single core, us per call")
+    print(f"{'case':<16}{'legacy':>10}{'codec':>10}{'speedup':>10}")
+    for name, _, _ in groups:
+        legacy, codec = best[name + " legacy"] * 1e6, best[name + " codec"] * 1e6
+        print(f"{name:<16}{legacy:>10.2f}{codec:>10.2f}{legacy / codec:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
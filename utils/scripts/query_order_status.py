@@ -3,21 +3,48 @@
 # @Time    : 2023/6/27 16:09
 # @Author  : payne
 # @File    : query_order_status.py
-# @Description :
+# @Description : 订单支付状态轮询, 延迟重试队列, 由 run_order_status 消费
+#
+# - order 库有序集合 order_status:jobs, member 为订单号, score 为下次查询时间
+# - order_status:payload 保存 {订单号: {"method", "source", "attempts"}}
+# - 多实例竞争领取, 领取后在租约期内对其他消费者不可见, 消费者崩溃后租约到期重新可见
+# - 查询失败按 2s, 4s, 8s ... 退避, 超过 MAX_ATTEMPTS 次后放弃
 import json
+import logging
 import time
 import traceback
-from threading import Lock, Thread
 
-import requests
-from django.apps import AppConfig
 from django.conf import settings
+from django.db import transaction
 from django_redis import get_redis_connection
 
+from utils.delayed_queue import DelayedQueue
+from utils.http_client import http
 
-class QueryOrderStatusQueue(object):
+logger = logging.getLogger("view")
+
+ORDER_STATUS_QUEUE = "order_status:jobs"
+ORDER_STATUS_PAYLOAD = "order_status:payload"
+
+MAX_ATTEMPTS = 10
+
+# 查询支付状态接口超时(秒)
+REQUEST_TIMEOUT = 10
 
-    lock = Lock()
+
+def retry_delay(attempts):
+    # 2s, 4s, 8s ... 最长 10 分钟
+    return min(2 ** attempts, 600)
+
+
+class QueryOrderStatusQueue(object):
+    @staticmethod
+    def queue(r_order=None):
+        return DelayedQueue(
+            ORDER_STATUS_QUEUE,
+            r_order or get_redis_connection("order"),
+            lease=getattr(settings, "ORDER_STATUS_LEASE", REQUEST_TIMEOUT * 3),
+        )
 
     @staticmethod
     def process_order(order_id, method, source):
@@ -28,7 +55,8 @@ class QueryOrderStatusQueue(object):
             api_request_url = settings.WECHAT_QUERY_ORDER_STATUS
         data = {"order_id": order_id, "source": source}
 
-        response = requests.post(url=api_request_url, data=data)
+        response = http.post(
+            url=api_request_url, data=data, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
             if response.text == "success":
                 return True
@@ -43,67 +71,70 @@ class QueryOrderStatusQueue(object):
             return False
 
     @staticmethod
-    def push_order_to_queue(order_data):
-        r = get_redis_connection("order")
-        r.publish("orders", json.dumps(order_data))
+    def push_order_to_queue(order_data, delay=0):
+        """
+        :param order_data: {"order_id", "method": alipay/wechat, "source"}
+        :param delay: 首次查询延迟(秒)
+        在事务内调用时提交后入队, 避免查询到未提交的订单
+        """
+        order_id = str(order_data["order_id"])
+        payload = json.dumps({
+            "method": order_data.get("method"),
+            "source": order_data.get("source"),
+            "attempts": 0,
+        })
+
+        def _push():
+            # 订单已提交, 入队失败只记录, 由支付回调和对账兜底
+            try:
+                pipe = get_redis_connection("order").pipeline()
+                pipe.hsetnx(ORDER_STATUS_PAYLOAD, order_id, payload)
+                pipe.zadd(ORDER_STATUS_QUEUE, {order_id: time.time() + delay}, nx=True)
+                pipe.execute()
+            except Exception:
+                logger.error(traceback.format_exc())
+
+        transaction.on_commit(_push)
 
     @staticmethod
-    def mark_order_as_processed(order_id):
-        r = get_redis_connection("order")
-        r.publish("processed_orders", order_id)
+    def mark_order_as_processed(order_id, queue=None):
+        queue = queue or QueryOrderStatusQueue.queue()
+        pipe = queue.redis.pipeline()
+        pipe.zrem(ORDER_STATUS_QUEUE, order_id)
+        pipe.hdel(ORDER_STATUS_PAYLOAD, order_id)
+        pipe.execute()
 
     @staticmethod
-    def order_listener():
-        r = get_redis_connection("order")
-        p = r.pubsub(ignore_subscribe_messages=True)
-        p.subscribe("orders")
-        for message in p.listen():
-            order_data = json.loads(message["data"])
-            order_id = order_data.get("order_id")
-            source = order_data.get("source")
-            method = order_data.get("method")
-            if order_data["retry_count"] > 0:
-                try:
-                    with QueryOrderStatusQueue.lock:  # 使用锁来保护资源访问
-                        process_result = QueryOrderStatusQueue.process_order(
-                            order_id, method, source
-                        )
-                    if process_result:
-                        continue
-                    else:
-                        with QueryOrderStatusQueue.lock:  # 使用锁来保护资源访问
-                            order_data["retry_count"] -= 1
-                            print(
-                                "current count {}".format(
-                                    order_data["retry_count"]))
-                            r.publish("orders", json.dumps(order_data))
-                        time.sleep(2)
-                except Exception as e:
-                    print(traceback.format_exc())
-                    with QueryOrderStatusQueue.lock:  # 使用锁来保护资源访问
-                        order_data["retry_count"] -= 1
-                        print(
-                            "current count {}".format(
-                                order_data["retry_count"]))
-
-                        r.publish("orders", json.dumps(order_data))
-                    time.sleep(2)
-            else:
-                print(
-                    f"Order {order_data['order_id']} has been retried 10 times and will be discarded."
-                )
-
-
-class QueryOrderStatusConfig(AppConfig):
-    default_auto_field = "django.db.models.BigAutoField"
-    name = "apps.sp_pay"
-
-    def ready(self):
-        print("QueryOrderStatus starting........")
-        num_threads = 1  # 设置线程数量
-        threads = []
+    def handle(queue, order_id):
+        """
+        处理一个已领取的订单, 成功或超过次数后删除, 否则按退避重新排期
+        """
+        raw = queue.redis.hget(ORDER_STATUS_PAYLOAD, order_id)
+        if raw is None:
+            queue.ack(order_id)
+            return False
+        order_data = json.loads(raw)
+
+        try:
+            process_result = QueryOrderStatusQueue.process_order(
+                order_id, order_data.get("method"), order_data.get("source"))
+        except Exception:
+            logger.error(traceback.format_exc())
+            process_result = False
+
+        if process_result:
+            QueryOrderStatusQueue.mark_order_as_processed(order_id, queue)
+            return True
+
+        order_data["attempts"] += 1
+        if order_data["attempts"] >= MAX_ATTEMPTS:
+            logger.warning(
+                f"Order {order_id} has been retried {MAX_ATTEMPTS} times and will be discarded.")
+            QueryOrderStatusQueue.mark_order_as_processed(order_id, queue)
+            return False
 
-        for _ in range(num_threads):
-            thread = Thread(target=QueryOrderStatusQueue.order_listener)
-            thread.start()
-            threads.append(thread)
+        pipe = queue.redis.pipeline()
+        pipe.hset(ORDER_STATUS_PAYLOAD, order_id, json.dumps(order_data))
+        pipe.zadd(ORDER_STATUS_QUEUE, {order_id: time.time() + retry_delay(order_data["attempts"])})
+        pipe.execute()
+        return False
@@ -6,8 +6,12 @@
 # @Description : sql 操作相关
 
 import logging
+import threading
+import time
 
 import pymysql
+from django.conf import settings
+from django.db import connections
 
 logger = logging.getLogger('view')
 
@@ -17,28 +21,32 @@ class MysqlOper(object):
         super(MysqlOper, self).__init__()
 
     @staticmethod
-    def get_query_result(cursor):
-        result = []
-        names = cursor.description
+    def get_query_result(cursor, typed=False):
+        """
+        结果集转为 [{列名: 值}]
+        :param typed: False 时值统一转为字符串, None/空值转为 "", True 时保留驱动返回的原始类型
+        """
+        names = [each[0] for each in cursor.description or ()]
         datas = cursor.fetchall()
 
-        logger.info(
-            "current execute sql \n{}\nrowcount : {}\nrownumber : {}\narraysize : {}\ninsert_id : {}".format(
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "current execute sql \n%s\nrowcount : %s\nrownumber : %s\narraysize : %s\ninsert_id : %s",
                 cursor._executed,
                 cursor.rowcount,
                 cursor.rownumber,
                 cursor.arraysize,
-                cursor._result.insert_id,
+                cursor._result.insert_id if cursor._result else None,
             )
-        )
-        for rows in datas:
-            one = {}
-            for i in range(len(rows)):
-                one[names[i][0]] = str(
-                    rows[i]) if rows[i] or rows[i] == 0 else ""
-                # one[names[i][0]] = str(rows[i])
-            result.append(one)
-        return result
+
+        if typed:
+            return [dict(zip(names, rows)) for rows in datas]
+        # 与历史返回保持一致: 0 保留为 "0", None 及其他空值为 ""
+        return [
+            {name: str(value) if value or value == 0 else ""
+             for name, value in zip(names, rows)}
+            for rows in datas
+        ]
 
     @staticmethod
     def format_sql(sql, params):
@@ -50,3 +58,128 @@ class MysqlOper(object):
                     param, "utf8") for param in params)
             formatted_sql = sql % formatted_sql
         return formatted_sql
+
+
+class Statement(object):
+    """
+    注册过的参数化语句
+    - sql      语句模板, {db}/{admin_db} 替换为库名, 参数使用 %(name)s 绑定
+    - optional 可选片段 {slot: 片段}, 模板中的 {slot} 在 params[slot] 不为 None 时替换为片段, 否则为空
+    - using    数据库别名, 同样支持 {admin_db}
+    """
+
+    def __init__(self, name, sql, using="default", optional=None):
+        self.name = name
+        self.sql = sql
+        self.using = using
+        self.optional = optional or {}
+        self._rendered = {}
+
+    def render(self, params):
+        present = tuple(
+            slot for slot in self.optional if params.get(slot) is not None)
+        sql = self._rendered.get(present)
+        if sql is None:
+            fragments = {
+                slot: (fragment if slot in present else "")
+                for slot, fragment in self.optional.items()
+            }
+            sql = self._rendered[present] = self.sql.format(
+                db=settings.DEFAULT_DB,
+                admin_db=getattr(settings, "ADMIN_DB", ""),
+                **fragments
+            )
+        return sql
+
+    def _run(self, params, handle):
+        params = params or {}
+        sql = self.render(params)
+        start = time.perf_counter()
+        try:
+            using = self.using.format(admin_db=getattr(settings, "ADMIN_DB", ""))
+            with connections[using].cursor() as cursor:
+                cursor.execute(sql, params or None)
+                return handle(cursor)
+        finally:
+            QueryRegistry.record(self.name, time.perf_counter() - start)
+
+    def fetch_all(self, params=None, typed=False):
+        return self._run(
+            params, lambda cursor: MysqlOper.get_query_result(cursor, typed))
+
+    def fetch_one(self, params=None, typed=False):
+        rows = self.fetch_all(params, typed)
+        return rows[0] if rows else None
+
+    def execute(self, params=None):
+        """
+        :return: 影响行数
+        """
+        return self._run(params, lambda cursor: cursor.rowcount)
+
+    def execute_many(self, rows):
+        """
+        同一语句按多组参数执行, INSERT ... VALUES 由驱动合并为一条多值语句
+        :param rows: [params], 可选片段以第一组参数为准
+        :return: 影响行数
+        """
+        if not rows:
+            return 0
+        sql = self.render(rows[0])
+        start = time.perf_counter()
+        try:
+            using = self.using.format(admin_db=getattr(settings, "ADMIN_DB", ""))
+            with connections[using].cursor() as cursor:
+                cursor.executemany(sql, rows)
+                return cursor.rowcount
+        finally:
+            QueryRegistry.record(self.name, time.perf_counter() - start)
+
+
+class QueryRegistry(object):
+    """
+    参数化语句注册表, 记录每条语句的执行次数与耗时
+    """
+
+    _lock = threading.Lock()
+    _statements = {}
+    _stats = {}
+
+    @classmethod
+    def register(cls, name, sql, using="default", optional=None):
+        registered = cls._statements.get(name)
+        if registered is not None:
+            # apps 目录同时以 apps.xxx 和 xxx 两种包名导入时模块会执行两次, 同一语句直接复用
+            if registered.sql == sql and registered.optional == (optional or {}):
+                return registered
+            raise ValueError(f"statement {name} already registered")
+        statement = cls._statements[name] = Statement(
+            name, sql, using, optional)
+        return statement
+
+    @classmethod
+    def get(cls, name):
+        return cls._statements[name]
+
+    @classmethod
+    def record(cls, name, elapsed):
+        with cls._lock:
+            stat = cls._stats.setdefault(
+                name, {"calls": 0, "total": 0.0, "max": 0.0})
+            stat["calls"] += 1
+            stat["total"] += elapsed
+            stat["max"] = max(stat["max"], elapsed)
+
+        if elapsed * 1000 > getattr(settings, "SLOW_QUERY_MS", 200):
+            logger.warning("slow query %s %.1fms", name, elapsed * 1000)
+
+    @classmethod
+    def stats(cls):
+        """
+        :return: {name: {"calls", "total", "max", "avg"}} 时间单位为秒
+        """
+        with cls._lock:
+            return {
+                name: dict(stat, avg=stat["total"] / stat["calls"])
+                for name, stat in cls._stats.items()
+            }